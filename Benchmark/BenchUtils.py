@@ -0,0 +1,160 @@
+import json
+import datetime
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from Config import BaseConfig
+from Utils import InitUtils
+from Table import TaskBatch, TaskInfo
+from TaskCenter.TaskInfoCache import task_info_cache
+
+# 各执行周期的分钟数
+UNIT_MINUTES = dict(minute=1, hour=60, day=1440)
+
+
+def bind_session_factory(uri):
+    """将 BaseConfig 中的读写 session 工厂替换为基准测试库，需在 fork 前或子进程初始化时调用"""
+
+    factory = InitUtils.init_mysql_session_factory(uri)
+    BaseConfig.mysql_session_factory_r = factory
+    BaseConfig.mysql_session_factory_w = factory
+    return factory
+
+
+def bind_redis(redis_server):
+    """将 BaseConfig 中的 redis 连接池替换为基准测试实例，需在 fork 前或子进程初始化时调用"""
+
+    BaseConfig.redis_conn_pool = InitUtils.init_redis_connection_pool(redis_server)
+
+
+def init_schema(uri):
+    """重建 task_info / task_batch 表，返回 engine"""
+
+    engine = sqlalchemy.create_engine(uri)
+    for base in (TaskInfo.Base, TaskBatch.Base):
+        base.metadata.drop_all(engine)
+        base.metadata.create_all(engine)
+    return engine
+
+
+def seed_tasks(engine, task_count, exec_unit="minute", dependence=None, script="Benchmark.NoopScript", script_args="",
+               exec_unit_map=None):
+    """
+    写入 task_info，任务名为 bench_0 ... bench_{task_count-1}
+    :param dependence: 可选，task_name -> dependence 列表的映射
+    :param exec_unit_map: 可选，task_name -> 执行周期的映射，未指定的任务使用 exec_unit
+    :param script: 任务脚本，默认为空操作脚本
+    :param script_args: 脚本参数，空操作脚本为执行耗时（秒）
+    """
+
+    dependence = dependence or dict()
+    exec_unit_map = exec_unit_map or dict()
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [
+        dict(
+            task_num=str(i), task_name=f"bench_{i}", task_type=0, online=BaseConfig.ENV_TYPE,
+            dependence=json.dumps(dependence.get(f"bench_{i}", [])), script=script, script_args=script_args,
+            exec_unit=exec_unit_map.get(f"bench_{i}", exec_unit), exec_unit_param=1, delay=0, start_expire=60, retry_max_times=0, run_expire=10,
+            retry_base=5, retry_multiplier=2, retry_cap=600, retry_jitter=0.1,
+            cpu_weight=1, memory_mb=256, max_concurrency=0, profile=0,
+            create_time=now, update_time=now,
+        )
+        for i in range(task_count)
+    ]
+    with engine.begin() as conn:
+        conn.execute(TaskInfo.TaskInfo.__table__.insert(), rows)
+    # 同名任务在同一秒内重建时 update_time 不变，强制进程内缓存下次全量加载
+    task_info_cache.full_reload_ts = 0
+
+
+def seed_batches(engine, task_count, batch_count, chunk_size=5000):
+    """写入 batch_count 个已到期、无依赖的待执行批次，均匀分布在 task_count 个任务上"""
+
+    base_dt = datetime.datetime.now().replace(second=0, microsecond=0) - datetime.timedelta(minutes=batch_count)
+    table = TaskBatch.TaskBatch.__table__
+    rows = list()
+    for i in range(batch_count):
+        start_dt = base_dt + datetime.timedelta(minutes=i // task_count)
+        end_dt = start_dt + datetime.timedelta(minutes=1)
+        task_name = f"bench_{i % task_count}"
+        tag_name = f"{task_name}_{start_dt.strftime('%Y%m%d%H%M')}"
+        rows.append(dict(
+            task_name=task_name, task_tag_name=tag_name, task_batch_name=f"{tag_name}_1", batch_num=1,
+            exec_status=0, dependence="[]",
+            start_time=start_dt, end_time=end_dt, plan_time=end_dt, plan_expire_time=end_dt,
+            exec_time=None, exit_time=None, duration=0, retry=0, claim_host="",
+        ))
+        if len(rows) == chunk_size:
+            with engine.begin() as conn:
+                conn.execute(table.insert(), rows)
+            rows = list()
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+
+
+def build_workload(shape, task_count, width, units):
+    """
+    构造任务依赖结构
+    :param shape: flat 无依赖；chain 每 width 个任务组成一条依赖链；fanin 每 width 个上游任务汇聚到一个下游任务
+    :param width: 链长度或汇聚宽度
+    :param units: 执行周期列表，按任务（flat）或按链 / 汇聚组轮流分配，同一组内周期相同
+    :return: (task_name -> dependence 列表, task_name -> 执行周期)
+    """
+
+    dependence, exec_unit_map = dict(), dict()
+    group_size = dict(flat=1, chain=width, fanin=width + 1)[shape]
+    for i in range(task_count):
+        group, index = divmod(i, group_size)
+        unit = units[group % len(units)]
+        exec_unit_map[f"bench_{i}"] = unit
+        if shape == "chain" and index:
+            upstream = [i - 1]
+        elif shape == "fanin" and index == group_size - 1:
+            upstream = range(i - width, i)
+        else:
+            continue
+        dependence[f"bench_{i}"] = [dict(task_name=f"bench_{k}", offset=[0, 0, 0], exec_unit=unit) for k in upstream]
+    return dependence, exec_unit_map
+
+
+def seed_workload(engine, batch_count, shape="flat", task_count=100, width=10, units=("minute",), pending_ratio=0.1,
+                  script_args="", chunk_size=10000):
+    """
+    按依赖结构写入任务和约 batch_count 个批次，批次时间区间连续且均已到期
+    最早的 1 - pending_ratio 部分为已执行成功的历史批次，其余为待执行批次
+    :return: 写入的批次数
+    """
+
+    dependence, exec_unit_map = build_workload(shape, task_count, width, units)
+    seed_tasks(engine, task_count, dependence=dependence, exec_unit_map=exec_unit_map, script_args=script_args)
+    session = sessionmaker(bind=engine)()
+    tasks = session.query(TaskInfo.TaskInfo).all()
+    session.close()
+
+    # 覆盖的时间跨度（分钟），使各任务批次数之和约为 batch_count
+    span = batch_count / sum(1 / UNIT_MINUTES[task.exec_unit] for task in tasks)
+    stop_dt = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(days=1)
+    start_dt = stop_dt - datetime.timedelta(minutes=int(span))
+    pending_dt = stop_dt - datetime.timedelta(minutes=span * pending_ratio)
+    table = TaskBatch.TaskBatch.__table__
+    rows, count = list(), 0
+    for task in tasks:
+        for row in task.iter_batch_rows(start_dt, stop_dt - datetime.timedelta(minutes=1)):
+            if row["start_time"] < pending_dt:
+                row.update(exec_status=3, exec_time=row["plan_time"], exit_time=row["plan_time"])
+            rows.append(row)
+            if len(rows) == chunk_size:
+                with engine.begin() as conn:
+                    conn.execute(table.insert(), rows)
+                count += len(rows)
+                rows = list()
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+        count += len(rows)
+    return count
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,127 @@
+"""
+依赖触发延迟基准：上游批次由其他节点执行（本进程模拟），下游批次由常驻调度进程认领，
+统计上游执行成功到下游被认领的间隔，对比 tag 执行成功事件触发与纯轮询
+Usage：
+python -m Benchmark.ChainLatencyBench --uri mysql+pymysql://root@127.0.0.1:3306/taskcenter_bench \
+    --redis 127.0.0.1:6379/0 --pairs 10 --poll-interval 30
+"""
+import time
+import random
+import argparse
+import datetime
+import statistics
+import multiprocessing
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from Config import BaseConfig
+from Table import TaskBatch, TaskInfo
+from TaskCenter.Dependence import publish_tag_done
+from TaskCenter.Scheduler import Scheduler
+from . import BenchUtils
+
+
+def seed_pairs(engine, pairs):
+    """
+    写入 pairs 组上下游任务：bench_{2k} -> bench_{2k+1}，各一个已到期批次
+    上游批次写入为执行中（exec_status 2），视为已被其他节点认领，返回 [(上游 tag, 下游 tag)]
+    """
+
+    dependence = {
+        f"bench_{2 * k + 1}": [dict(task_name=f"bench_{2 * k}", offset=[0, 0, 0], exec_unit="minute")]
+        for k in range(pairs)
+    }
+    BenchUtils.seed_tasks(engine, 2 * pairs, dependence=dependence)
+    start_dt = datetime.datetime.now().replace(second=0, microsecond=0) - datetime.timedelta(minutes=2)
+    session = sessionmaker(bind=engine)()
+    tasks = sorted(session.query(TaskInfo.TaskInfo).all(), key=lambda task: int(task.task_num))
+    rows = [next(task.iter_batch_rows(start_dt, start_dt)) for task in tasks]
+    for row in rows[::2]:
+        row["exec_status"] = 2
+    TaskBatch.TaskBatch.insert_ignore(session, rows)
+    session.commit()
+    session.close()
+    return [(rows[2 * k]["task_tag_name"], rows[2 * k + 1]["task_tag_name"]) for k in range(pairs)]
+
+
+def _serve(uri, redis_server, poll_interval, event_trigger):
+    """调度进程入口"""
+
+    BenchUtils.bind_session_factory(uri)
+    BenchUtils.bind_redis(redis_server)
+    BaseConfig.event_trigger = event_trigger
+    Scheduler(2, poll_interval=poll_interval).serve_forever()
+
+
+def _wait_claimed(engine, tag, timeout):
+    """轮询直到 tag 的批次被认领，返回观测到的时刻，超时返回 None"""
+
+    t = TaskBatch.TaskBatch.__table__
+    stmt = select(t.c.exec_status).where(t.c.task_tag_name == tag)
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        with engine.connect() as conn:
+            if conn.execute(stmt).scalar() != 0:
+                return time.perf_counter()
+        time.sleep(0.01)
+    return None
+
+
+def bench(uri, redis_server, pairs, poll_interval, event_trigger):
+    """执行一轮基准，返回结果字典"""
+
+    engine = BenchUtils.init_schema(uri)
+    tag_pairs = seed_pairs(engine, pairs)
+    t = TaskBatch.TaskBatch.__table__
+
+    process = multiprocessing.Process(target=_serve, args=(uri, redis_server, poll_interval, event_trigger))
+    process.start()
+    # 等待调度进程完成首次扫描，建立反向依赖索引
+    time.sleep(3)
+    latency, missed = list(), 0
+    try:
+        for upstream, downstream in tag_pairs:
+            # 上游完成时刻在轮询周期内随机分布
+            time.sleep(random.uniform(0, 2))
+            with engine.begin() as conn:
+                conn.execute(t.update().where(t.c.task_tag_name == upstream).values(exec_status=3))
+            done = time.perf_counter()
+            if event_trigger:
+                publish_tag_done(upstream)
+            claimed = _wait_claimed(engine, downstream, poll_interval * 2)
+            if claimed is None:
+                missed += 1
+            else:
+                latency.append(claimed - done)
+    finally:
+        process.terminate()
+        process.join()
+
+    return dict(
+        event_trigger=event_trigger,
+        pairs=pairs,
+        poll_interval=poll_interval,
+        missed=missed,
+        latency_mean_s=round(statistics.mean(latency), 3) if latency else None,
+        latency_max_s=round(max(latency), 3) if latency else None,
+    )
+
+
+def main():
+    """命令行入口"""
+
+    parser = argparse.ArgumentParser(description="依赖触发延迟基准")
+    parser.add_argument("--uri", default="mysql+pymysql://root@127.0.0.1:3306/taskcenter_bench")
+    parser.add_argument("--redis", default=BaseConfig.redis_server)
+    parser.add_argument("--pairs", type=int, default=10)
+    parser.add_argument("--poll-interval", type=int, default=30)
+    args = parser.parse_args()
+
+    BenchUtils.bind_session_factory(args.uri)
+    BenchUtils.bind_redis(args.redis)
+    for event_trigger in (False, True):
+        print(bench(args.uri, args.redis, args.pairs, args.poll_interval, event_trigger))
+
+
+if __name__ == '__main__':
+    main()
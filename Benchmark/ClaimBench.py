@@ -0,0 +1,84 @@
+"""
+多节点认领吞吐基准：1/2/4/8 个并发认领进程对同一张 task_batch 表反复认领，直到表中无待执行批次
+每轮结束后校验全部批次恰好被认领一次，重复认领不计入吞吐；需要支持 SELECT ... FOR UPDATE（SKIP LOCKED）的数据库，
+sqlite 等不支持行锁的数据库会重复认领，直接拒绝
+Usage：
+python -m Benchmark.ClaimBench --uri mysql+pymysql://root@127.0.0.1:3306/taskcenter_bench --batches 20000
+"""
+import time
+import argparse
+import multiprocessing
+from sqlalchemy.engine.url import make_url
+
+from Utils import BaseUtils
+from TaskCenter.RunBatch import TaskManager
+from . import BenchUtils
+
+
+def _init_claimer(uri):
+    """认领进程初始化，绑定基准测试库"""
+
+    BenchUtils.bind_session_factory(uri)
+
+
+def _claim_until_empty(slots, skip_locked):
+    """单个认领进程：循环认领直到没有可认领批次，返回 (认领的批次 id 列表, 认领次数)"""
+
+    claimed_ids, rounds = list(), 0
+    while True:
+        task_list = TaskManager(slots, skip_locked=skip_locked).get_ready_task()
+        BaseUtils.init_mysql_session("w").close()
+        if not task_list:
+            break
+        claimed_ids.extend(descriptor.id for descriptor in task_list)
+        rounds += 1
+    return claimed_ids, rounds
+
+
+def bench(uri, claimers, slots, skip_locked, task_count, batch_count):
+    """执行一轮基准，返回结果字典，存在重复认领或遗漏时抛出 RuntimeError"""
+
+    if make_url(uri).get_backend_name() not in ("mysql", "postgresql"):
+        raise ValueError(f"{uri}:数据库不支持 SELECT ... FOR UPDATE，并发认领结果无效")
+    engine = BenchUtils.init_schema(uri)
+    BenchUtils.seed_tasks(engine, task_count)
+    BenchUtils.seed_batches(engine, task_count, batch_count)
+    engine.dispose()
+
+    pool = multiprocessing.Pool(claimers, initializer=_init_claimer, initargs=(uri,))
+    start = time.perf_counter()
+    results = pool.starmap(_claim_until_empty, [(slots, skip_locked)] * claimers)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    pool.join()
+
+    claimed_ids = [batch_id for r in results for batch_id in r[0]]
+    claimed = len(claimed_ids)
+    if claimed != batch_count or len(set(claimed_ids)) != claimed:
+        raise RuntimeError(
+            f"认领结果异常：共{batch_count}个批次，认领{claimed}次，不重复批次{len(set(claimed_ids))}个")
+    return dict(
+        claimers=claimers, skip_locked=skip_locked, claimed=claimed, rounds=sum(r[1] for r in results),
+        elapsed=round(elapsed, 3), throughput=round(claimed / elapsed, 1),
+    )
+
+
+def main():
+    """命令行入口"""
+
+    parser = argparse.ArgumentParser(description="task_batch 认领吞吐基准")
+    parser.add_argument("--uri", default="mysql+pymysql://root@127.0.0.1:3306/taskcenter_bench")
+    parser.add_argument("--claimers", default="1,2,4,8")
+    parser.add_argument("--slots", type=int, default=8, help="单个认领进程的空闲进程数")
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--batches", type=int, default=20000)
+    args = parser.parse_args()
+
+    for skip_locked in (False, True):
+        for claimers in map(int, args.claimers.split(",")):
+            result = bench(args.uri, claimers, args.slots, skip_locked, args.tasks, args.batches)
+            print(result)
+
+
+if __name__ == '__main__':
+    main()
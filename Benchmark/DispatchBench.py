@@ -0,0 +1,94 @@
+"""
+批次下发序列化基准：对比旧方式（绑定方法 + kwargs，pickle 整个 TaskManager）与 TaskDescriptor 的单次下发字节数和耗时
+Usage：
+python -m Benchmark.DispatchBench
+"""
+import time
+import pickle
+import datetime
+import multiprocessing
+
+from TaskCenter.RunBatch import TaskDescriptor
+
+
+def _noop(*args, **kwargs):
+    """进程池空任务"""
+
+    return None
+
+
+class LegacyTaskManager(object):
+    """旧下发方式的等价结构：绑定方法会连同 task_kwargs_list 一起被序列化"""
+
+    def __init__(self, task_kwargs_list):
+        self.task_num = multiprocessing.cpu_count()
+        self.task_kwargs_list = task_kwargs_list
+        self.exec_time = datetime.datetime.now()
+
+    def execute_task_once(self, **kwargs):
+        return None
+
+
+def make_batches(batch_count):
+    """构造 batch_count 个批次，返回 (旧方式 kwargs 列表, TaskDescriptor 列表)"""
+
+    now = datetime.datetime(2021, 1, 1)
+    kwargs_list, descriptor_list = list(), list()
+    for i in range(batch_count):
+        tag_name = f"bench_{i % 100}_202101010000"
+        kwargs = dict(
+            id=i, task_name=f"bench_{i % 100}", task_tag_name=tag_name, task_batch_name=f"{tag_name}_1", batch_num=1,
+            exec_status=2, dependence="[]", start_time=now, end_time=now, plan_time=now, plan_expire_time=now,
+            exec_time=now, exit_time=None, duration=0, retry=0, claim_host="",
+            retry_max_times=3, run_expire=10, task_type=0, script="NoopScript", script_args="",
+            retry_base=5, retry_multiplier=2, retry_cap=600, retry_jitter=0.1,
+        )
+        kwargs_list.append(kwargs)
+        descriptor_list.append(TaskDescriptor(
+            i, kwargs["task_name"], tag_name, kwargs["task_batch_name"], 1, now, now, now, 0, now, "", 0, "NoopScript", "",
+            3, 10, 5, 2, 600, 0.1, 0,
+        ))
+    return kwargs_list, descriptor_list
+
+
+def bench(batch_count, sample=200):
+    """
+    执行一轮基准，取前 sample 次下发计算均值
+    :return: 结果字典，bytes 为单次下发序列化字节数，pickle_us / ipc_us 为单次序列化和进程池往返耗时（微秒）
+    """
+
+    kwargs_list, descriptor_list = make_batches(batch_count)
+    manager = LegacyTaskManager(kwargs_list)
+    sample = min(sample, batch_count)
+    cases = dict(
+        legacy=[(manager.execute_task_once, (), kwargs) for kwargs in kwargs_list[:sample]],
+        descriptor=[(_noop, (descriptor,), {}) for descriptor in descriptor_list[:sample]],
+    )
+
+    result = dict(batches=batch_count)
+    pool = multiprocessing.Pool(1)
+    for name, calls in cases.items():
+        start = time.perf_counter()
+        size = sum(len(pickle.dumps(call, pickle.HIGHEST_PROTOCOL)) for call in calls)
+        pickle_us = (time.perf_counter() - start) / sample * 1e6
+
+        start = time.perf_counter()
+        for func, args, kwds in calls:
+            pool.apply(func, args, kwds)
+        ipc_us = (time.perf_counter() - start) / sample * 1e6
+
+        result[name] = dict(bytes=size // sample, pickle_us=round(pickle_us, 1), ipc_us=round(ipc_us, 1))
+    pool.close()
+    pool.join()
+    return result
+
+
+def main():
+    """命令行入口"""
+
+    for batch_count in (10, 1000, 10000):
+        print(bench(batch_count))
+
+
+if __name__ == '__main__':
+    main()
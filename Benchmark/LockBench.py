@@ -0,0 +1,91 @@
+"""
+RedisLock 竞争基准：waiters 个线程反复争抢同一把锁，统计释放到下一个持有方获得锁的交接延迟和 SET 命令次数
+对比 sleep 轮询（redis-py 默认 sleep=0.1）与 notify 模式（释放时写入通知，等待方 BLPOP 唤醒）
+Usage：
+python -m Benchmark.LockBench --redis 127.0.0.1:6379/0 --waiters 2,4,8,16,32,64 --rounds 200
+"""
+import time
+import argparse
+import threading
+import statistics
+
+from Config import BaseConfig
+from Utils import RedisUtils
+from . import BenchUtils
+
+
+def get_set_calls(client):
+    """redis 累计执行的 SET 命令次数"""
+
+    return client.info("commandstats").get("cmdstat_set", dict()).get("calls", 0)
+
+
+def bench(client, waiters, rounds, hold, notify):
+    """
+    执行一轮基准
+    :param waiters: 争抢线程数
+    :param rounds: 总获取次数
+    :param hold: 每次持有时间（秒）
+    :param notify: 是否使用 notify 模式
+    """
+
+    lock = client.lock("bench:contention", timeout=30, notify=notify)
+    state = dict(released_at=None, count=0)
+    state_lock = threading.Lock()
+    handoff = list()
+
+    def worker():
+        while True:
+            lock.acquire()
+            acquired_at = time.perf_counter()
+            with state_lock:
+                if state["count"] >= rounds:
+                    lock.release()
+                    return
+                state["count"] += 1
+                if state["released_at"] is not None:
+                    handoff.append(acquired_at - state["released_at"])
+            time.sleep(hold)
+            with state_lock:
+                state["released_at"] = time.perf_counter()
+            lock.release()
+
+    set_calls = get_set_calls(client)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(waiters)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    handoff.sort()
+    return dict(
+        mode="notify" if notify else "poll",
+        waiters=waiters,
+        rounds=rounds,
+        elapsed_s=round(elapsed, 3),
+        handoff_mean_ms=round(statistics.mean(handoff) * 1000, 2),
+        handoff_p99_ms=round(handoff[int(len(handoff) * 0.99)] * 1000, 2),
+        set_calls=get_set_calls(client) - set_calls,
+    )
+
+
+def main():
+    """命令行入口"""
+
+    parser = argparse.ArgumentParser(description="RedisLock 竞争基准")
+    parser.add_argument("--redis", default=BaseConfig.redis_server)
+    parser.add_argument("--waiters", default="2,4,8,16,32,64")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--hold-ms", type=float, default=1)
+    args = parser.parse_args()
+
+    BenchUtils.bind_redis(args.redis)
+    client = RedisUtils.Redis(connection_pool=BaseConfig.redis_conn_pool, is_log=False)
+    for waiters in map(int, args.waiters.split(",")):
+        for notify in (False, True):
+            print(bench(client, waiters, args.rounds, args.hold_ms / 1000, notify))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+redis 命令日志开销基准：循环执行 GET，对比关闭日志、同步逐条记录（旧方式）、异步采样和异步全量记录的单次调用耗时
+异步模式下调用线程只负责入队，drain_ms 为循环结束后等待后台线程写完剩余日志的时间
+Usage：
+python -m Benchmark.LogBench --redis 127.0.0.1:6379/0 --calls 20000 --rate 0.01
+"""
+import time
+import argparse
+
+import common_logger
+from Config import BaseConfig
+from Utils import RedisUtils, LogUtils
+from . import BenchUtils
+
+
+class InlineLogRedis(RedisUtils.Redis):
+    """旧方式：每条命令及响应在调用线程中同步格式化并写入日志"""
+
+    def execute_command(self, *args, **options):
+        common_logger.info(f'{args[:2]},options:{options}')
+        res = super(RedisUtils.Redis, self).execute_command(*args, **options)
+        common_logger.info('resdis response:' + str(res))
+        return res
+
+
+def bench(client, calls, key):
+    """执行 calls 次 GET，返回 (单次耗时微秒, 等待后台写入完成的毫秒数)"""
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        client.get(key)
+    cost = time.perf_counter() - start
+    start = time.perf_counter()
+    LogUtils.log_writer.flush(timeout=60)
+    return round(cost / calls * 1e6, 2), round((time.perf_counter() - start) * 1000, 2)
+
+
+def main():
+    """命令行入口"""
+
+    parser = argparse.ArgumentParser(description="redis 命令日志开销基准")
+    parser.add_argument("--redis", default=BaseConfig.redis_server)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=BaseConfig.log_sample_rates["redis"], help="采样模式的采样率")
+    args = parser.parse_args()
+
+    BenchUtils.bind_redis(args.redis)
+    key = "taskcenter:bench:log"
+    RedisUtils.Redis(connection_pool=BaseConfig.redis_conn_pool, is_log=False).set(key, "x" * 64)
+    cases = [
+        ("off", RedisUtils.Redis, False, 0),
+        ("inline", InlineLogRedis, True, 0),
+        ("sampled", RedisUtils.Redis, True, args.rate),
+        ("full", RedisUtils.Redis, True, 1),
+    ]
+    for name, client_cls, is_log, rate in cases:
+        LogUtils.configure(dict(redis=rate), BaseConfig.log_max_payload, BaseConfig.log_queue_size)
+        client = client_cls(connection_pool=BaseConfig.redis_conn_pool, is_log=is_log)
+        LogUtils.log_writer.dropped = 0
+        # 预热连接
+        client.get(key)
+        per_call_us, drain_ms = bench(client, args.calls, key)
+        print(dict(mode=name, rate=rate, calls=args.calls, per_call_us=per_call_us, drain_ms=drain_ms,
+                   dropped=LogUtils.log_writer.dropped))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+import time
+
+from TaskCenter.TaskScript import BaseTaskScript
+
+
+class Script(BaseTaskScript):
+    """基准测试用空操作脚本，script_args 为执行耗时（秒）"""
+
+    def run_task(self, **kwargs):
+        """执行任务"""
+
+        time.sleep(float(kwargs.get("script_args") or 0))
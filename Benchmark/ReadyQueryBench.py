@@ -0,0 +1,122 @@
+"""
+待执行批次扫描基准：对比 varchar 时间字段无索引（旧表结构）与 datetime + (exec_status, plan_time) 索引的扫描耗时
+Usage：
+python -m Benchmark.ReadyQueryBench --uri mysql+pymysql://root@127.0.0.1:3306/taskcenter_bench --history 1000000
+"""
+import time
+import argparse
+import datetime
+import sqlalchemy
+from sqlalchemy import Table, Column, MetaData, Integer, String, Text, select
+
+from Table import TaskBatch
+
+legacy_metadata = MetaData()
+
+# 旧表结构，时间字段为 varchar，仅主键索引
+legacy_table = Table(
+    "task_batch_legacy", legacy_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("task_name", String(255)),
+    Column("task_tag_name", String(255)),
+    Column("task_batch_name", String(255)),
+    Column("batch_num", Integer),
+    Column("exec_status", Integer),
+    Column("dependence", Text),
+    Column("start_time", String(255)),
+    Column("end_time", String(255)),
+    Column("plan_time", String(255)),
+    Column("plan_expire_time", String(255)),
+    Column("exec_time", String(255)),
+    Column("exit_time", String(255)),
+    Column("duration", Integer),
+    Column("retry", Integer),
+    Column("claim_host", String(255)),
+)
+
+
+def _iter_rows(history, due, task_count=100):
+    """生成 history 个已完成历史批次和 due 个已到期待执行批次，返回 (datetime 行, 字符串行)"""
+
+    base_dt = datetime.datetime.now().replace(second=0, microsecond=0) \
+        - datetime.timedelta(minutes=(history + due) // task_count + 1)
+    for i in range(history + due):
+        start_dt = base_dt + datetime.timedelta(minutes=i // task_count)
+        end_dt = start_dt + datetime.timedelta(minutes=1)
+        task_name = f"bench_{i % task_count}"
+        tag_name = f"{task_name}_{start_dt:%Y%m%d%H%M}"
+        exec_status, exec_time = (3, end_dt) if i < history else (0, None)
+        row = dict(
+            task_name=task_name, task_tag_name=tag_name, task_batch_name=f"{tag_name}_1", batch_num=1,
+            exec_status=exec_status, dependence="[]", start_time=start_dt, end_time=end_dt, plan_time=end_dt,
+            plan_expire_time=end_dt, exec_time=exec_time, exit_time=exec_time, duration=1, retry=0, claim_host="",
+        )
+        legacy_row = dict(row)
+        for key in ("start_time", "end_time", "plan_time", "plan_expire_time", "exec_time", "exit_time"):
+            legacy_row[key] = row[key].strftime("%Y-%m-%d %H:%M:%S") if row[key] else "0000-00-00 00:00:00"
+        yield row, legacy_row
+
+
+def seed(engine, history, due, chunk_size=10000):
+    """重建两张表并写入相同数据"""
+
+    legacy_metadata.drop_all(engine)
+    legacy_metadata.create_all(engine)
+    TaskBatch.Base.metadata.drop_all(engine)
+    TaskBatch.Base.metadata.create_all(engine)
+
+    table = TaskBatch.TaskBatch.__table__
+    rows, legacy_rows = list(), list()
+    for row, legacy_row in _iter_rows(history, due):
+        rows.append(row)
+        legacy_rows.append(legacy_row)
+        if len(rows) == chunk_size:
+            with engine.begin() as conn:
+                conn.execute(table.insert(), rows)
+                conn.execute(legacy_table.insert(), legacy_rows)
+            rows, legacy_rows = list(), list()
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+            conn.execute(legacy_table.insert(), legacy_rows)
+
+
+def time_query(engine, table, now, repeat):
+    """执行 get_ready_task 的加锁扫描 repeat 次，返回 (平均耗时毫秒, 命中行数)"""
+
+    stmt = select(table.c.id, table.c.exec_status, table.c.plan_expire_time, table.c.dependence).where(
+        table.c.exec_status.in_((0, 1)) & (table.c.plan_time <= now)
+    ).order_by(table.c.plan_time).with_for_update()
+    count, cost = 0, 0
+    for _ in range(repeat):
+        with engine.connect() as conn:
+            trans = conn.begin()
+            start = time.perf_counter()
+            count = len(conn.execute(stmt).all())
+            cost += time.perf_counter() - start
+            trans.rollback()
+    return round(cost / repeat * 1000, 2), count
+
+
+def main():
+    """命令行入口"""
+
+    parser = argparse.ArgumentParser(description="待执行批次扫描基准")
+    parser.add_argument("--uri", default="mysql+pymysql://root@127.0.0.1:3306/taskcenter_bench")
+    parser.add_argument("--history", type=int, default=1000000, help="已完成历史批次数")
+    parser.add_argument("--due", type=int, default=1000, help="已到期待执行批次数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine(args.uri)
+    if not args.skip_seed:
+        seed(engine, args.history, args.due)
+    now = datetime.datetime.now()
+    before = time_query(engine, legacy_table, now.strftime("%Y-%m-%d %H:%M:%S"), args.repeat)
+    after = time_query(engine, TaskBatch.TaskBatch.__table__, now, args.repeat)
+    print(dict(history=args.history, due=args.due, before_ms=before[0], after_ms=after[0], rows=after[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+调度器基准套件：在本地数据库（默认 SQLite，也可指定 MySQL）中重建 task_info / task_batch，按合成负载计时
+1. ready_task：TaskManager.get_ready_task 单次认领耗时，负载为 flat / chain / fanin 依赖结构，minute / hour / day 混合周期
+2. create_batch：CreateBatch.Script.run_task 首次生成（补齐到当前时间 + HORIZON）和无新增批次时的耗时
+3. dispatch：常驻调度进程以空操作脚本执行全部待执行批次的端到端耗时和吞吐
+结果写入 JSON，--compare 指定历史结果文件时输出各耗时指标的比值，用于对比不同提交
+Usage：
+TASKCENTER_DB_URI=sqlite:////tmp/taskcenter_bench.db python -m Benchmark.SchedulerBench --batches 10000,100000
+python -m Benchmark.SchedulerBench --uri mysql+pymysql://root@127.0.0.1:3306/taskcenter_bench --batches 1000000 \
+    --compare Tmp/bench/scheduler_abc1234.json
+BaseConfig 在导入时按 TASKCENTER_DB_URI 创建 session 工厂，未设置时需要安装 pymysql
+"""
+import os
+import json
+import time
+import argparse
+import datetime
+import statistics
+import subprocess
+import multiprocessing
+from sqlalchemy import select, func
+
+from Config import BaseConfig
+from Utils import BaseUtils
+from Table import TaskBatch
+from TaskCenter import LocalUtils
+from TaskCenter.RunBatch import TaskManager
+from TaskCenter.Scheduler import Scheduler
+from TaskCenter.TaskScript import CreateBatch
+from . import BenchUtils
+
+
+def get_commit():
+    """当前提交的短哈希，非 git 目录时返回 None"""
+
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BaseConfig.path_project, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(costs):
+    """耗时列表（秒）转换为毫秒统计"""
+
+    costs = sorted(costs)
+    return dict(
+        mean_ms=round(statistics.mean(costs) * 1000, 2),
+        p50_ms=round(statistics.median(costs) * 1000, 2),
+        max_ms=round(costs[-1] * 1000, 2),
+    )
+
+
+def reset_claimed(engine, batch_ids):
+    """将认领的批次恢复为待执行，下一轮认领相同的批次"""
+
+    t = TaskBatch.TaskBatch.__table__
+    with engine.begin() as conn:
+        conn.execute(t.update().where(t.c.id.in_(batch_ids)).values(
+            exec_status=0, exec_time=None, claim_host="", lease_expire_time=None))
+
+
+def bench_ready_task(engine, slots, repeat):
+    """get_ready_task 认领 slots 个批次，重复 repeat 次"""
+
+    costs, stats, claimed = list(), None, 0
+    for _ in range(repeat):
+        task_manager = TaskManager(slots)
+        start = time.perf_counter()
+        task_list = task_manager.get_ready_task()
+        costs.append(time.perf_counter() - start)
+        stats, claimed = task_manager.claim_stats, len(task_list)
+        BaseUtils.init_mysql_session("w").close()
+        if task_list:
+            reset_claimed(engine, [descriptor.id for descriptor in task_list])
+    return dict(
+        summarize(costs), slots=slots, claimed=claimed, candidates=stats["candidates"],
+        dependency_tags=stats["dependency_tags"], dependency_queries=stats["dependency_queries"],
+    )
+
+
+def bench_create_batch(engine):
+    """CreateBatch 首次生成及无新增批次时各执行一次"""
+
+    t = TaskBatch.TaskBatch.__table__
+    script = CreateBatch.Script()
+    now_ts = int(time.time())
+    result = dict()
+    for name in ("fill", "steady"):
+        with engine.connect() as conn:
+            before = conn.execute(select(func.count()).select_from(t)).scalar()
+        start = time.perf_counter()
+        script.run_task(interval=LocalUtils.Interval(now_ts, now_ts))
+        cost = time.perf_counter() - start
+        BaseUtils.init_mysql_session("w").close()
+        with engine.connect() as conn:
+            inserted = conn.execute(select(func.count()).select_from(t)).scalar() - before
+        result[f"{name}_ms"] = round(cost * 1000, 2)
+        result[f"{name}_inserted"] = inserted
+    return result
+
+
+def _serve(uri, workers):
+    """调度进程入口"""
+
+    BenchUtils.bind_session_factory(uri)
+    BaseConfig.event_trigger = False
+    Scheduler(workers, poll_interval=1).serve_forever()
+
+
+def bench_dispatch(uri, workers, batch_count, timeout):
+    """常驻调度进程执行 batch_count 个无依赖的空操作批次，返回端到端耗时和吞吐"""
+
+    engine = BenchUtils.init_schema(uri)
+    count = BenchUtils.seed_workload(engine, batch_count, task_count=100, pending_ratio=1, script_args="0")
+    t = TaskBatch.TaskBatch.__table__
+    stmt = select(func.count()).select_from(t).where(t.c.exec_status.notin_((0, 1, 2)))
+
+    process = multiprocessing.Process(target=_serve, args=(uri, workers))
+    start = time.perf_counter()
+    process.start()
+    done, deadline = 0, start + timeout
+    try:
+        while done < count and time.perf_counter() < deadline:
+            time.sleep(0.2)
+            with engine.connect() as conn:
+                done = conn.execute(stmt).scalar()
+    finally:
+        elapsed = time.perf_counter() - start
+        process.terminate()
+        process.join()
+        engine.dispose()
+    return dict(
+        workers=workers, batches=count, finished=done, elapsed_s=round(elapsed, 3),
+        throughput=round(done / elapsed, 1),
+    )
+
+
+def compare(results, baseline_path):
+    """输出与历史结果同名用例的耗时比值，大于 1 表示变慢"""
+
+    with open(baseline_path) as fp:
+        baseline = {item["case"]: item for item in json.load(fp)["results"]}
+    for item in results:
+        old = baseline.get(item["case"])
+        if not old:
+            continue
+        ratios = {
+            key: round(value / old[key], 2) for key, value in item.items()
+            if key.endswith(("_ms", "_s")) and old.get(key)
+        }
+        print(item["case"], ratios)
+
+
+def main():
+    """命令行入口"""
+
+    parser = argparse.ArgumentParser(description="调度器基准套件")
+    parser.add_argument("--uri", default=BaseConfig.db_uri or f"sqlite:///{BaseConfig.path_tmp}/taskcenter_bench.db")
+    parser.add_argument("--batches", default="10000,100000", help="ready_task 负载的批次数，逗号分隔")
+    parser.add_argument("--shapes", default="flat,chain,fanin")
+    parser.add_argument("--units", default="minute,hour,day", help="执行周期，按任务或依赖组轮流分配")
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--width", type=int, default=10, help="依赖链长度或汇聚宽度")
+    parser.add_argument("--pending-ratio", type=float, default=0.1, help="待执行批次占比")
+    parser.add_argument("--slots", default="8,64", help="单次认领的空闲进程数，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dispatch-batches", type=int, default=2000, help="端到端下发的批次数，0 为跳过")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--timeout", type=int, default=600, help="端到端下发的最长等待时间（秒）")
+    parser.add_argument("--output", default=None, help="结果文件，默认为 Tmp/bench/scheduler_<commit>.json")
+    parser.add_argument("--compare", default=None, help="历史结果文件")
+    args = parser.parse_args()
+
+    BenchUtils.bind_session_factory(args.uri)
+    # 基准库中不存在上游 tag 事件的订阅方，不发布事件
+    BaseConfig.event_trigger = False
+    units = args.units.split(",")
+    results = list()
+    for batch_count in map(int, args.batches.split(",")):
+        for shape in args.shapes.split(","):
+            engine = BenchUtils.init_schema(args.uri)
+            seeded = BenchUtils.seed_workload(
+                engine, batch_count, shape, args.tasks, args.width, units, args.pending_ratio)
+            for slots in map(int, args.slots.split(",")):
+                result = dict(case=f"ready_task/{shape}/{batch_count}/{slots}", batches=seeded)
+                result.update(bench_ready_task(engine, slots, args.repeat))
+                print(result)
+                results.append(result)
+            result = dict(case=f"create_batch/{shape}/{batch_count}", batches=seeded)
+            result.update(bench_create_batch(engine))
+            print(result)
+            results.append(result)
+            BaseUtils.dispose_mysql_session()
+            engine.dispose()
+
+    if args.dispatch_batches:
+        result = dict(case=f"dispatch/{args.dispatch_batches}/{args.workers}")
+        result.update(bench_dispatch(args.uri, args.workers, args.dispatch_batches, args.timeout))
+        print(result)
+        results.append(result)
+
+    commit = get_commit()
+    output = args.output or f"{BaseConfig.path_tmp}/bench/scheduler_{commit or int(time.time())}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    meta = dict(
+        commit=commit, time=datetime.datetime.now().isoformat(" ", "seconds"), dialect=args.uri.split(":")[0],
+        args=vars(args),
+    )
+    with open(output, "w") as fp:
+        json.dump(dict(meta=meta, results=results), fp, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 import os
 import sys
 from datetime import timedelta
-from Utils import InitUtils
+from Utils import InitUtils, LogUtils
 
 # 目录
 path_project, path_log, path_tmp = InitUtils.init_project_directory()
@@ -52,10 +52,74 @@ redis_server = conf_dict["redis_server"]
 mysql_r_server = conf_dict["mysql_r_server"]
 mysql_w_server = conf_dict["mysql_w_server"]
 
+# 调度参数
+# 多节点部署时开启，认领批次使用 FOR UPDATE SKIP LOCKED，已被其他节点锁定的批次直接跳过（需要 MySQL 8.0+）
+claim_skip_locked = False
+# 单次认领扫描的批次数量 = 空闲进程数 * claim_scan_factor，为依赖未满足的批次预留余量
+claim_scan_factor = 4
+# 多节点认领时单次最多扫描的页数，每页 空闲进程数 * claim_scan_factor 条，就绪批次不足时继续扫描下一页
+claim_scan_max_pages = 10
+# 常驻调度进程的执行模式，开启后每个批次在独立子进程中执行，运行超时先 SIGTERM，宽限期后 SIGKILL
+supervised_execution = False
+supervised_kill_grace = 10
+# 批次执行成功后通过 redis 发布 tag 完成事件，常驻调度进程订阅后立即认领下游批次，默认关闭，下游批次在下一次轮询时认领
+# 开启时设置为 True，执行进程和调度进程均需能够访问 redis，调度进程在 redis 不可用时每 5 秒重新订阅并记录错误日志
+event_trigger = False
+# 依赖判定优先读取 redis 中的 tag 状态索引，调度进程启动及每隔 reconcile_interval 秒按 MySQL 重建最近 reconcile_days 天的 tag
+tag_index = False
+tag_index_reconcile_interval = 3600
+tag_index_reconcile_days = 7
+# 就绪批次多于空闲进程时按依赖图关键路径长度 + priority_fanout_weight * 传递下游任务数排序认领
+priority_scheduling = False
+priority_fanout_weight = 1.0
+# 资源感知准入：进程池大小为 cpu 数量 * admission_slot_factor，按主机预算装入批次
+# 预算默认为全部 cpu 核数和 80% 物理内存
+resource_admission = False
+admission_slot_factor = 4
+host_cpu_budget = None
+host_memory_budget_mb = None
+# 异步执行进程数量，大于 0 时 AsyncBaseTaskScript 任务的批次由异步执行进程的事件循环并发执行，每个进程最多 async_batch_limit 个
+async_worker_num = 0
+async_batch_limit = 200
+# 批次状态写入：case 为 CASE id WHEN 多行更新，executemany 为逐行参数批量执行
+# 开启 status_write_behind 时，进程池中的执行进程将状态变更交给调度进程每隔 status_flush_interval_ms 毫秒或累计 status_flush_size 条批量提交
+status_writer_mode = "case"
+status_write_behind = False
+status_flush_interval_ms = 200
+status_flush_size = 200
+# 同一批次连续提交失败 status_flush_max_failures 次后逐条提交，逐条提交再失败同样次数后放弃，由租约回收
+status_flush_max_failures = 3
+# 执行中批次的租约时长和续期周期（秒），租约过期的批次由调度进程重新入队或置为失败
+lease_seconds = 60
+lease_renew_interval = 10
+# 调度指标：metrics_file 不为空时每隔 metrics_export_interval 秒以 Prometheus 文本格式写入，metrics_http_port 不为空时提供 /metrics
+metrics_file = None
+metrics_export_interval = 15
+metrics_http_port = None
+# 批次性能采集：环境变量 TASKCENTER_PROFILE 覆盖 task_info.profile，取值为 "3"（全部任务）或 "task_a:1,task_b:3"
+# 结果写入 path_tmp/profile，总大小超过 profile_max_mb 时删除最早的文件，日志输出累计耗时最高的 profile_top_n 个函数
+profile_env = os.getenv("TASKCENTER_PROFILE", "")
+profile_max_mb = 200
+profile_top_n = 10
+# 选主：开启后批次生成和循环批次过期判定仅由 leader 执行，leader_lease_seconds 为 leader 崩溃后的最长切换时间，
+# leader 每隔 leader_generate_interval 秒生成批次，此时调度进程不认领 CreateBatch 任务的批次
+leader_election = False
+leader_lease_seconds = 15
+leader_generate_interval = 60
+
+# 高频路径日志：redis 命令、http 请求、sql 语句的采样率（0 关闭，1 全部记录），单条日志截断长度，后台写入队列长度上限
+log_sample_rates = dict(redis=0.01, http=0.1, sql=0)
+log_max_payload = 512
+log_queue_size = 10000
+LogUtils.configure(log_sample_rates, log_max_payload, log_queue_size)
+
+# 数据库连接串，环境变量 TASKCENTER_DB_URI 不为空时读写库均使用该连接串，如基准测试使用的 sqlite:////path/to/bench.db
+db_uri = os.getenv("TASKCENTER_DB_URI", "")
+
 # 全局变量
 redis_conn_pool = InitUtils.init_redis_connection_pool(redis_server)
-mysql_session_factory_r = InitUtils.init_mysql_session_factory(f"mysql+pymysql://{mysql_r_server}/threat_intel")
-mysql_session_factory_w = InitUtils.init_mysql_session_factory(f"mysql+pymysql://{mysql_w_server}/threat_intel")
+mysql_session_factory_r = InitUtils.init_mysql_session_factory(db_uri or f"mysql+pymysql://{mysql_r_server}/threat_intel")
+mysql_session_factory_w = InitUtils.init_mysql_session_factory(db_uri or f"mysql+pymysql://{mysql_w_server}/threat_intel")
 
 
 
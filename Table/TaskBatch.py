@@ -1,26 +1,36 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Integer, Column, String, Text
+from sqlalchemy import Integer, Column, String, Text, DateTime, Float, Index, insert
 
 Base = declarative_base()
 
 
 class TaskBatch(Base):
     __tablename__ = 'task_batch'
+    __table_args__ = (
+        Index("uk_task_batch_name", "task_batch_name", unique=True),
+        Index("idx_status_plan_time", "exec_status", "plan_time"),
+        Index("idx_tag_batch_num", "task_tag_name", "batch_num"),
+    )
 
     id = Column(Integer, primary_key=True)
     task_name = Column(String(255))
     task_tag_name = Column(String(255))
     task_batch_name = Column(String(255))
+    batch_num = Column(Integer)
     exec_status = Column(Integer)
     dependence = Column(Text)
-    start_time = Column(String(255))
-    end_time = Column(String(255))
-    plan_time = Column(String(255))
-    plan_expire_time = Column(String(255))
-    exec_time = Column(String(255))
-    exit_time = Column(String(255))
+    start_time = Column(DateTime)
+    end_time = Column(DateTime)
+    plan_time = Column(DateTime)
+    plan_expire_time = Column(DateTime)
+    exec_time = Column(DateTime)
+    exit_time = Column(DateTime)
     duration = Column(Integer)
     retry = Column(Integer)
+    claim_host = Column(String(255))
+    cpu_time = Column(Float)
+    max_rss_mb = Column(Integer)
+    lease_expire_time = Column(DateTime)
 
     def to_dict(self):
         """转换为 dict 类型"""
@@ -30,6 +40,7 @@ class TaskBatch(Base):
             task_name=self.task_name,
             task_tag_name=self.task_tag_name,
             task_batch_name=self.task_batch_name,
+            batch_num=self.batch_num,
             exec_status=self.exec_status,
             dependence=self.dependence,
             start_time=self.start_time,
@@ -40,8 +51,28 @@ class TaskBatch(Base):
             exit_time=self.exit_time,
             duration=self.duration,
             retry=self.retry,
+            claim_host=self.claim_host,
+            cpu_time=self.cpu_time,
+            max_rss_mb=self.max_rss_mb,
+            lease_expire_time=self.lease_expire_time,
         )
 
+    @classmethod
+    def insert_ignore(cls, session, rows, chunk_size=1000):
+        """
+        分块多行插入，task_batch_name 唯一键冲突的行忽略，多个生成进程并发插入时不会重复创建批次
+        :param session: 数据库 session，由调用方提交事务
+        :param rows: 批次字段字典列表
+        :param chunk_size: 单条 INSERT 的行数
+        :return: 实际插入行数
+        """
+
+        stmt = insert(cls.__table__).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+        count = 0
+        for i in range(0, len(rows), chunk_size):
+            count += session.execute(stmt.values(rows[i: i + chunk_size])).rowcount
+        return count
+
 
 if __name__ == '__main__':
     pass
@@ -1,6 +1,6 @@
 import json
 import datetime
-from sqlalchemy import Integer, Column, String, Text
+from sqlalchemy import Integer, Column, String, Text, Float
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import timedelta
 from Table import TaskBatch
@@ -24,7 +24,15 @@ class TaskInfo(Base):
     delay = Column(Integer)
     start_expire = Column(Integer)
     retry_max_times = Column(Integer)
+    retry_base = Column(Integer)
+    retry_multiplier = Column(Float)
+    retry_cap = Column(Integer)
+    retry_jitter = Column(Float)
     run_expire = Column(Integer)
+    cpu_weight = Column(Float)
+    memory_mb = Column(Integer)
+    max_concurrency = Column(Integer)
+    profile = Column(Integer)
     create_time = Column(String(255))
     update_time = Column(String(255))
 
@@ -45,7 +53,15 @@ class TaskInfo(Base):
             delay=self.delay,
             start_expire=self.start_expire,
             retry_max_times=self.retry_max_times,
+            retry_base=self.retry_base,
+            retry_multiplier=self.retry_multiplier,
+            retry_cap=self.retry_cap,
+            retry_jitter=self.retry_jitter,
             run_expire=self.run_expire,
+            cpu_weight=self.cpu_weight,
+            memory_mb=self.memory_mb,
+            max_concurrency=self.max_concurrency,
+            profile=self.profile,
             create_time=self.create_time,
             update_time=self.update_time,
         )
@@ -53,25 +69,56 @@ class TaskInfo(Base):
     def create_new_task(self, start_dt, batch_num=1):
         """根据任务创建时间和任务批次，创建 TaskBatch 对象"""
 
-        end_dt = self.get_next_end_dt(start_dt)
-        tag_name = self._get_tag_name(self.task_name, start_dt, self.exec_unit)
-        kwargs = dict(
-            task_name=self.task_name,
-            task_tag_name=tag_name,
-            task_batch_name=f"{tag_name}_{batch_num}",
-            exec_status=0,
-            dependence=json.dumps(self._get_depend_tag(start_dt)),
-            start_time=start_dt.strftime("%Y-%m-%d %H:%M:%S"),
-            end_time=end_dt.strftime("%Y-%m-%d %H:%M:%S"),
-            plan_time=self._get_plan_dt(end_dt).strftime("%Y-%m-%d %H:%M:%S"),
-            plan_expire_time=self._get_plan_expire_dt(end_dt).strftime("%Y-%m-%d %H:%M:%S"),
-            exec_time="0000-00-00 00:00:00",
-            exit_time="0000-00-00 00:00:00",
-            duration=0,
-            retry=0,
-        )
+        return TaskBatch.TaskBatch(**next(self.iter_batch_rows(start_dt, start_dt, batch_num)))
 
-        return TaskBatch.TaskBatch(**kwargs)
+    def iter_batch_rows(self, start_dt, stop_dt, batch_num=1):
+        """
+        生成时间区间左边界在 [start_dt, stop_dt] 内的全部批次字段字典，用于批量插入
+        时间增量和依赖偏移在循环外计算，时间字段直接写入 datetime，仅 Tag 名称使用 isoformat 切片格式化
+        :param start_dt: 首个批次的时间区间左边界，datetime 对象
+        :param stop_dt: 最后一个批次时间区间左边界的上限，datetime 对象
+        :param batch_num: 批次序号
+        """
+
+        exec_unit_map = dict(minute="minutes", hour="hours", day="days")
+        task_name, exec_unit = self.task_name, self.exec_unit
+        step = datetime.timedelta(**{exec_unit_map[exec_unit]: self.exec_unit_param})
+        unit = datetime.timedelta(**{exec_unit_map[exec_unit]: 1})
+        plan_delta = unit + datetime.timedelta(minutes=self.delay)
+        plan_expire_delta = plan_delta + datetime.timedelta(minutes=self.start_expire)
+        depend_list = [
+            (
+                item["task_name"],
+                datetime.timedelta(**dict(zip(["days", "hours", "minutes"], item["offset"]))),
+                item["exec_unit"],
+            )
+            for item in json.loads(self.dependence)
+        ]
+
+        while start_dt <= stop_dt:
+            start_time = start_dt.isoformat(" ", "seconds")
+            tag_name = self._format_tag_name(task_name, start_time, exec_unit)
+            yield dict(
+                task_name=task_name,
+                task_tag_name=tag_name,
+                task_batch_name=f"{tag_name}_{batch_num}",
+                batch_num=batch_num,
+                exec_status=0,
+                dependence=json.dumps([
+                    self._format_tag_name(name, (start_dt + offset).isoformat(" ", "seconds"), unit_)
+                    for name, offset, unit_ in depend_list
+                ]),
+                start_time=start_dt,
+                end_time=start_dt + unit,
+                plan_time=start_dt + plan_delta,
+                plan_expire_time=start_dt + plan_expire_delta,
+                exec_time=None,
+                exit_time=None,
+                duration=0,
+                retry=0,
+                claim_host="",
+            )
+            start_dt += step
 
     def get_next_start_dt(self, start_dt):
         """输入批次执行时间区间左边界，计算下次任务执行时间区间的左边界"""
@@ -106,9 +153,15 @@ class TaskInfo(Base):
     def _get_tag_name(task_name, start_dt, exec_unit):
         """计算 Tag 名称，由于需要计算依赖批次的 Tag 名称，因此需要数据 task_name / exec_unit 等参数"""
 
+        return TaskInfo._format_tag_name(task_name, start_dt.isoformat(" ", "seconds"), exec_unit)
+
+    @staticmethod
+    def _format_tag_name(task_name, start_time, exec_unit):
+        """由 "%Y-%m-%d %H:%M:%S" 格式的时间字符串计算 Tag 名称"""
+
         fmt_len_map = dict(day=8, hour=10, minute=12)
-        length = fmt_len_map[exec_unit]
-        return f"{task_name}_{start_dt.strftime('%Y%m%d%H%M%S')[:length]}"
+        s = start_time
+        return f"{task_name}_{(s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16])[:fmt_len_map[exec_unit]]}"
 
     def _get_depend_tag(self, start_dt):
         """计算依赖 tag 列表"""
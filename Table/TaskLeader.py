@@ -0,0 +1,48 @@
+import datetime
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Integer, Column, String, DateTime
+
+Base = declarative_base()
+
+
+class TaskLeader(Base):
+    __tablename__ = 'task_leader'
+
+    name = Column(String(64), primary_key=True)
+    fencing_token = Column(Integer)
+    leader_host = Column(String(255))
+    update_time = Column(DateTime)
+
+    def to_dict(self):
+        """转换为 dict 类型"""
+
+        return dict(
+            name=self.name,
+            fencing_token=self.fencing_token,
+            leader_host=self.leader_host,
+            update_time=self.update_time,
+        )
+
+    @classmethod
+    def get_token(cls, session, name):
+        """已写入的 fencing token，不存在选主记录时返回 0"""
+
+        token = session.query(cls.fencing_token).filter(cls.name == name).scalar()
+        return token or 0
+
+    @classmethod
+    def fence(cls, session, name, token, leader_host):
+        """
+        以 fencing token 条件更新选主记录，持有行锁直到调用方提交事务
+        :param session: 数据库 session，由调用方提交事务
+        :return: 是否更新成功，已有更大的 token 写入时返回 False
+        """
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        count = session.query(cls).filter((cls.name == name) & (cls.fencing_token <= token)).update(
+            dict(fencing_token=token, leader_host=leader_host, update_time=now), synchronize_session=False)
+        return bool(count)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,10 @@
+-- ----------------------------
+-- task_batch 增加数值型批次序号 batch_num，依赖判定按 batch_num 取 tag 的最新批次
+-- 历史数据由 task_batch_name 的 "_" 后缀回填
+-- ----------------------------
+ALTER TABLE `task_batch`
+  ADD COLUMN `batch_num` int(11) NOT NULL DEFAULT '1' COMMENT '批次序号' AFTER `task_batch_name`;
+
+UPDATE `task_batch` SET `batch_num` = CAST(SUBSTRING_INDEX(`task_batch_name`, '_', -1) AS UNSIGNED);
+
+ALTER TABLE `task_batch` ADD KEY `idx_tag_batch_num` (`task_tag_name`, `batch_num`);
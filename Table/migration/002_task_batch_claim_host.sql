@@ -0,0 +1,5 @@
+-- ----------------------------
+-- task_batch 增加认领节点 claim_host，多节点认领时记录批次由哪个调度进程执行
+-- ----------------------------
+ALTER TABLE `task_batch`
+  ADD COLUMN `claim_host` varchar(255) NOT NULL DEFAULT '' COMMENT '认领节点' AFTER `retry`;
@@ -0,0 +1,9 @@
+-- ----------------------------
+-- task_info 增加重试退避参数，失败批次以新的 plan_time 重新入队，不再在执行进程内 sleep 重试
+-- 第 n 次重试延迟 = min(retry_cap, retry_base * retry_multiplier ^ (n - 1)) * (1 ± retry_jitter)
+-- ----------------------------
+ALTER TABLE `task_info`
+  ADD COLUMN `retry_base` int(11) NOT NULL DEFAULT '5' COMMENT '重试退避基数（秒）' AFTER `retry_max_times`,
+  ADD COLUMN `retry_multiplier` double NOT NULL DEFAULT '2' COMMENT '重试退避倍数' AFTER `retry_base`,
+  ADD COLUMN `retry_cap` int(11) NOT NULL DEFAULT '600' COMMENT '重试退避上限（秒）' AFTER `retry_multiplier`,
+  ADD COLUMN `retry_jitter` double NOT NULL DEFAULT '0.1' COMMENT '重试退避抖动比例' AFTER `retry_cap`;
@@ -0,0 +1,8 @@
+-- ----------------------------
+-- task_batch_name 唯一，批次生成使用 INSERT IGNORE，并发生成不会重复创建批次，不再需要锁 task_info 全表
+-- 执行前需先清理重复批次，保留 id 最小的一条
+-- ----------------------------
+DELETE b1 FROM `task_batch` b1
+  INNER JOIN `task_batch` b2 ON b1.`task_batch_name` = b2.`task_batch_name` AND b1.`id` > b2.`id`;
+
+ALTER TABLE `task_batch` ADD UNIQUE KEY `uk_task_batch_name` (`task_batch_name`);
@@ -0,0 +1,20 @@
+-- ----------------------------
+-- task_batch 时间字段由 varchar 改为 datetime，未执行 / 未结束的 exec_time、exit_time 由 '0000-00-00 00:00:00' 改为 NULL
+-- 增加待执行批次扫描索引 (exec_status, plan_time)
+-- 表数据量较大时建议使用 pt-online-schema-change / gh-ost 执行
+-- ----------------------------
+ALTER TABLE `task_batch`
+  MODIFY COLUMN `exec_time` varchar(255) DEFAULT NULL COMMENT '开始执行时间',
+  MODIFY COLUMN `exit_time` varchar(255) DEFAULT NULL COMMENT '结束执行时间';
+
+UPDATE `task_batch` SET `exec_time` = NULL WHERE `exec_time` IN ('', '0000-00-00 00:00:00');
+UPDATE `task_batch` SET `exit_time` = NULL WHERE `exit_time` IN ('', '0000-00-00 00:00:00');
+
+ALTER TABLE `task_batch`
+  MODIFY COLUMN `start_time` datetime NOT NULL COMMENT '时间片左边界',
+  MODIFY COLUMN `end_time` datetime NOT NULL COMMENT '时间片右边界',
+  MODIFY COLUMN `plan_time` datetime NOT NULL COMMENT '计划执行时间',
+  MODIFY COLUMN `plan_expire_time` datetime NOT NULL COMMENT '启动超时时间',
+  MODIFY COLUMN `exec_time` datetime DEFAULT NULL COMMENT '开始执行时间',
+  MODIFY COLUMN `exit_time` datetime DEFAULT NULL COMMENT '结束执行时间',
+  ADD KEY `idx_status_plan_time` (`exec_status`, `plan_time`);
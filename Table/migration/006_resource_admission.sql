@@ -0,0 +1,11 @@
+-- ----------------------------
+-- 资源感知准入：task_info 声明单个批次的资源需求，task_batch 记录执行进程实测的资源占用
+-- ----------------------------
+ALTER TABLE `task_info`
+  ADD COLUMN `cpu_weight` double NOT NULL DEFAULT '1' COMMENT '声明 cpu 占用（核）' AFTER `run_expire`,
+  ADD COLUMN `memory_mb` int(11) NOT NULL DEFAULT '256' COMMENT '声明内存峰值（MB）' AFTER `cpu_weight`,
+  ADD COLUMN `max_concurrency` int(11) NOT NULL DEFAULT '0' COMMENT '同时执行批次数上限，0 为不限制' AFTER `memory_mb`;
+
+ALTER TABLE `task_batch`
+  ADD COLUMN `cpu_time` double NOT NULL DEFAULT '0' COMMENT '实测 cpu 时间（秒）' AFTER `claim_host`,
+  ADD COLUMN `max_rss_mb` int(11) NOT NULL DEFAULT '0' COMMENT '实测内存峰值（MB）' AFTER `cpu_time`;
@@ -0,0 +1,6 @@
+-- ----------------------------
+-- 执行中批次的租约：认领时写入到期时间，执行进程定期续期，调度进程回收租约过期的批次
+-- 迁移前已处于执行中的批次 lease_expire_time 为 NULL，不会被回收
+-- ----------------------------
+ALTER TABLE `task_batch`
+  ADD COLUMN `lease_expire_time` datetime DEFAULT NULL COMMENT '执行租约到期时间' AFTER `max_rss_mb`;
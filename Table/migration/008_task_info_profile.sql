@@ -0,0 +1,6 @@
+-- ----------------------------
+-- 批次性能采集开关：1 cProfile，2 tracemalloc，3 两者同时开启，0 关闭
+-- 结果写入 Tmp/profile 目录，按 task_batch_name 命名
+-- ----------------------------
+ALTER TABLE `task_info`
+  ADD COLUMN `profile` int(11) NOT NULL DEFAULT '0' COMMENT '性能采集开关，1 cProfile，2 tracemalloc' AFTER `max_concurrency`;
@@ -0,0 +1,13 @@
+-- ----------------------------
+-- 调度单例职责的 fencing token：leader 在批次生成和循环批次过期判定的事务中以自身 token 条件更新该行，
+-- token 小于已写入值（已有更新的 leader）时更新失败并回滚
+-- ----------------------------
+CREATE TABLE `task_leader` (
+  `name` varchar(64) NOT NULL COMMENT '选主名称',
+  `fencing_token` bigint(20) NOT NULL DEFAULT '0' COMMENT '最近写入的 leader fencing token',
+  `leader_host` varchar(255) NOT NULL DEFAULT '' COMMENT '最近写入的 leader 节点',
+  `update_time` datetime DEFAULT NULL COMMENT '最近写入时间',
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='调度选主表';
+
+INSERT INTO `task_leader` (`name`) VALUES ('scheduler');
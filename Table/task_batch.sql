@@ -10,17 +10,25 @@ CREATE TABLE `task_batch` (
   `task_name` varchar(255) NOT NULL DEFAULT '' COMMENT '任务名称',
   `task_tag_name` varchar(255) NOT NULL DEFAULT '' COMMENT 'tag 名称',
   `task_batch_name` varchar(255) NOT NULL DEFAULT '' COMMENT '批次名称',
+  `batch_num` int(11) NOT NULL DEFAULT '1' COMMENT '批次序号',
   `exec_status` int(11) NOT NULL DEFAULT '0' COMMENT '批次执行状态',
   `dependence` text COMMENT '任务依赖',
-  `start_time` varchar(255) NOT NULL DEFAULT '' COMMENT '时间片左边界',
-  `end_time` varchar(255) NOT NULL DEFAULT '' COMMENT '时间片右边界',
-  `plan_time` varchar(255) NOT NULL DEFAULT '' COMMENT '计划执行时间',
-  `plan_expire_time` varchar(255) NOT NULL DEFAULT '' COMMENT '启动超时时间',
-  `exec_time` varchar(255) NOT NULL DEFAULT '' COMMENT '开始执行时间',
-  `exit_time` varchar(255) NOT NULL DEFAULT '' COMMENT '结束执行时间',
+  `start_time` datetime NOT NULL COMMENT '时间片左边界',
+  `end_time` datetime NOT NULL COMMENT '时间片右边界',
+  `plan_time` datetime NOT NULL COMMENT '计划执行时间',
+  `plan_expire_time` datetime NOT NULL COMMENT '启动超时时间',
+  `exec_time` datetime DEFAULT NULL COMMENT '开始执行时间',
+  `exit_time` datetime DEFAULT NULL COMMENT '结束执行时间',
   `duration` int(11) NOT NULL DEFAULT '0' COMMENT '执行耗时',
   `retry` int(11) NOT NULL DEFAULT '0' COMMENT '已重试次数',
-  PRIMARY KEY (`id`)
+  `claim_host` varchar(255) NOT NULL DEFAULT '' COMMENT '认领节点',
+  `cpu_time` double NOT NULL DEFAULT '0' COMMENT '实测 cpu 时间（秒）',
+  `max_rss_mb` int(11) NOT NULL DEFAULT '0' COMMENT '实测内存峰值（MB）',
+  `lease_expire_time` datetime DEFAULT NULL COMMENT '执行租约到期时间',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_task_batch_name` (`task_batch_name`),
+  KEY `idx_status_plan_time` (`exec_status`, `plan_time`),
+  KEY `idx_tag_batch_num` (`task_tag_name`, `batch_num`)
 ) ENGINE=InnoDB AUTO_INCREMENT=91228 DEFAULT CHARSET=utf8mb4 COMMENT='任务批次表';
 
 SET FOREIGN_KEY_CHECKS = 1;
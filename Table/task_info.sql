@@ -19,7 +19,15 @@ CREATE TABLE `task_info` (
   `delay` int(11) NOT NULL DEFAULT '0' COMMENT '执行延迟',
   `start_expire` int(11) NOT NULL DEFAULT '0' COMMENT '启动超时',
   `retry_max_times` int(11) NOT NULL DEFAULT '0' COMMENT '最大重试次数',
+  `retry_base` int(11) NOT NULL DEFAULT '5' COMMENT '重试退避基数（秒）',
+  `retry_multiplier` double NOT NULL DEFAULT '2' COMMENT '重试退避倍数',
+  `retry_cap` int(11) NOT NULL DEFAULT '600' COMMENT '重试退避上限（秒）',
+  `retry_jitter` double NOT NULL DEFAULT '0.1' COMMENT '重试退避抖动比例',
   `run_expire` int(11) NOT NULL DEFAULT '0' COMMENT '运行超时',
+  `cpu_weight` double NOT NULL DEFAULT '1' COMMENT '声明 cpu 占用（核）',
+  `memory_mb` int(11) NOT NULL DEFAULT '256' COMMENT '声明内存峰值（MB）',
+  `max_concurrency` int(11) NOT NULL DEFAULT '0' COMMENT '同时执行批次数上限，0 为不限制',
+  `profile` int(11) NOT NULL DEFAULT '0' COMMENT '性能采集开关，1 cProfile，2 tracemalloc',
   `create_time` varchar(255) NOT NULL DEFAULT '' COMMENT '创建时间',
   `update_time` varchar(255) NOT NULL DEFAULT '' COMMENT '更新时间',
   PRIMARY KEY (`id`)
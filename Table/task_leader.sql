@@ -0,0 +1,18 @@
+SET NAMES utf8mb4;
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- ----------------------------
+-- Table structure for task_leader
+-- ----------------------------
+DROP TABLE IF EXISTS `task_leader`;
+CREATE TABLE `task_leader` (
+  `name` varchar(64) NOT NULL COMMENT '选主名称',
+  `fencing_token` bigint(20) NOT NULL DEFAULT '0' COMMENT '最近写入的 leader fencing token',
+  `leader_host` varchar(255) NOT NULL DEFAULT '' COMMENT '最近写入的 leader 节点',
+  `update_time` datetime DEFAULT NULL COMMENT '最近写入时间',
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='调度选主表';
+
+INSERT INTO `task_leader` (`name`) VALUES ('scheduler');
+
+SET FOREIGN_KEY_CHECKS = 1;
@@ -0,0 +1,197 @@
+"""
+异步执行进程：每个进程运行一个事件循环，并发执行 AsyncBaseTaskScript 任务的批次
+调度进程通过 task_queue 下发 TaskDescriptor（None 表示退出），批次结束后将 (批次 id, BatchStats) 写入 done_queue 释放名额
+批次状态由 AsyncStatusWriter 汇总后批量提交
+"""
+import time
+import asyncio
+import datetime
+import functools
+
+from .RunBatch import Batch, get_exit_record, get_batch_stats
+from .ScriptRegistry import registry
+from .StatusWriter import StatusWriter, extend_pending_leases
+from .Supervisor import init_worker
+from .Lease import lease_keeper, get_claim_token
+import common_logger
+
+
+class AsyncBatch(Batch):
+    """异步批次，复用 Batch 的初始化和重试计算，不作为线程启动"""
+
+    def __init__(self, descriptor):
+        """初始化，descriptor 为待执行批次的 TaskDescriptor"""
+
+        super().__init__(descriptor)
+        self.timed_out = False
+
+    async def run_async(self):
+        """
+        执行批次，run_task 超过 run_expire 分钟后取消并视为超时
+        脚本内部抛出的 TimeoutError（3.11 起与 asyncio.TimeoutError 为同一类型）按耗时与 wait_for 的超时区分，按执行失败处理
+        """
+
+        script_obj = registry.get_script(self.script)
+        self.retry_policy.policy_map.update(script_obj.retry_policy)
+        interval = self.interval
+        task_batch_name = self.task_batch_name
+        common_logger.info(f'{task_batch_name}:开始执行')
+        try:
+            if self.retry:
+                common_logger.info(f'{task_batch_name}:第{self.retry}次重试')
+            deadline, run_start = self.run_expire * 60, time.monotonic()
+            try:
+                await asyncio.wait_for(
+                    script_obj.run_task(
+                        interval=interval, script_args=self.script_args, task_tag_name=self.task_tag_name),
+                    deadline,
+                )
+            except asyncio.TimeoutError:
+                if time.monotonic() - run_start < deadline:
+                    raise
+                self.timed_out = True
+                common_logger.error(f'{task_batch_name}:执行超时')
+                return
+            await script_obj.run_success_callback(interval=interval, task_batch_name=task_batch_name)
+            self.success = True
+            common_logger.info(f'{task_batch_name}:执行成功')
+            return
+        except Exception as e:
+            error = e
+            try:
+                await script_obj.run_failure_callback(interval=interval, task_batch_name=task_batch_name, error=e)
+                common_logger.error(f'{task_batch_name}执行失败:{e}')
+            except Exception as e:
+                common_logger.error(e)
+        self.plan_retry(error)
+
+
+class AsyncStatusWriter(object):
+    """事件循环内的状态缓冲，每隔 flush_interval 秒或累计 flush_size 条时在线程池中批量提交"""
+
+    def __init__(self, writer, flush_interval=0.2, flush_size=100):
+        """
+        初始化
+        :param writer: StatusWriter 对象
+        :param flush_interval: 提交周期（秒）
+        :param flush_size: 触发立即提交的缓冲条数
+        """
+
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.buffer = list()
+        self.flush_event = asyncio.Event()
+        self.closed = False
+
+    def put(self, record):
+        """写入一条 StatusRecord"""
+
+        self.buffer.append(record)
+        if len(self.buffer) >= self.flush_size:
+            self.flush_event.set()
+
+    async def flush(self):
+        """提交缓冲中的全部记录，失败时保留记录等待下次提交"""
+
+        records, self.buffer = self.buffer, list()
+        if not records:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.writer.write_many, records)
+        except Exception as e:
+            common_logger.error(f'批次状态提交失败，{len(records)}条记录等待重试:{e}')
+            self.buffer = records + self.buffer
+            await asyncio.get_running_loop().run_in_executor(None, extend_pending_leases, records)
+
+    async def run(self):
+        """提交循环，close 后提交剩余记录并退出"""
+
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_event.clear()
+            await self.flush()
+        while self.buffer:
+            await self.flush()
+            if self.buffer:
+                await asyncio.sleep(1)
+
+    def close(self):
+        """停止提交循环"""
+
+        self.closed = True
+        self.flush_event.set()
+
+
+async def run_batch(descriptor, status_writer):
+    """执行单个批次并写入状态，返回 BatchStats，租约被回收时取消执行，不写入状态并返回 None"""
+
+    task = AsyncBatch(descriptor)
+    task.run_start_time = datetime.datetime.now()
+    run_start = time.monotonic()
+    loop = asyncio.get_running_loop()
+    future = loop.create_task(task.run_async())
+    lost = lease_keeper.add(
+        descriptor.id, get_claim_token(descriptor), on_lost=lambda: loop.call_soon_threadsafe(future.cancel))
+    try:
+        await future
+    except asyncio.CancelledError:
+        if not lost.is_set():
+            raise
+    except Exception as e:
+        # 脚本加载失败等批次外异常，按执行失败处理
+        common_logger.error(f'{descriptor.task_batch_name}执行异常:{e}')
+        task.plan_retry(e)
+    finally:
+        lease_keeper.discard(descriptor.id)
+    if lost.is_set():
+        common_logger.error(f'{descriptor.task_batch_name}:租约已被回收，已取消执行')
+        return None
+    exit_time = datetime.datetime.now().replace(microsecond=0)
+    kwargs = get_exit_record(task, exit_time, task.timed_out)
+    status_writer.put(task.get_status_record(kwargs))
+    return get_batch_stats(task, kwargs, time.monotonic() - run_start)
+
+
+def on_batch_done(descriptor, done_queue, future):
+    """批次协程结束回调，取消或异常结束时同样通知调度进程释放名额"""
+
+    stats = None
+    if future.cancelled():
+        common_logger.error(f'{descriptor.task_batch_name}:执行已取消')
+    elif future.exception() is not None:
+        common_logger.error(f'{descriptor.task_batch_name}执行异常:{future.exception()}')
+    else:
+        stats = future.result()
+    done_queue.put((descriptor.id, stats))
+
+
+async def _serve(task_queue, done_queue):
+    """事件循环主协程"""
+
+    loop = asyncio.get_running_loop()
+    status_writer = AsyncStatusWriter(StatusWriter())
+    flusher = loop.create_task(status_writer.run())
+    pending = set()
+    while True:
+        descriptor = await loop.run_in_executor(None, task_queue.get)
+        if descriptor is None:
+            break
+        future = loop.create_task(run_batch(descriptor, status_writer))
+        pending.add(future)
+        future.add_done_callback(pending.discard)
+        future.add_done_callback(functools.partial(on_batch_done, descriptor, done_queue))
+    if pending:
+        await asyncio.wait(pending)
+    status_writer.close()
+    await flusher
+
+
+def serve_async(task_queue, done_queue):
+    """异步执行进程入口"""
+
+    init_worker()
+    asyncio.run(_serve(task_queue, done_queue))
@@ -0,0 +1,274 @@
+"""
+历史区间回溯执行
+批量生成指定时间范围内的批次（batch_num 取该范围内已有最大值 + 1，不影响原批次），以独立进程池按并发上限和速率执行
+回溯批次以 exec_status=5 入库，失败重试时恢复为 5，常驻调度进程不会认领，不占用线上批次的执行位
+回溯批次按 dependence 判定依赖，上游 tag 的最新批次执行成功后才会认领
+进度保存在 Tmp/backfill 目录，进程崩溃后以相同参数重新执行即可从断点继续
+Usage：
+python -m TaskCenter.Backfill task_name "2021-01-01 00:00:00" "2021-01-31 00:00:00" --parallelism 4 --rate 60
+"""
+import os
+import json
+import time
+import socket
+import argparse
+import datetime
+import threading
+import multiprocessing
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from Config import BaseConfig
+from Utils import BaseUtils
+from Table import TaskBatch, TaskInfo
+from .RunBatch import TaskDescriptor, execute_task_once, get_task_info_fields
+from .Dependence import DependResolver
+from .ScriptRegistry import registry
+from .TaskInfoCache import task_info_cache
+from .TagStatusIndex import tag_status_index
+from .Supervisor import init_worker
+from .Lease import BACKFILL_STATUS, BACKFILL_CLAIM_PREFIX, get_lease_expire_time
+import common_logger
+
+UNIT_SECONDS = dict(minute=60, hour=3600, day=86400)
+
+
+def _to_dt(ts, cache):
+    """时间戳转换为 datetime，相邻批次的 start/end/plan 时间大量重复，按时间戳缓存转换结果"""
+
+    dt = cache.get(ts)
+    if dt is None:
+        dt = cache[ts] = datetime.datetime.fromtimestamp(ts)
+    return dt
+
+
+def build_backfill_rows(task, start_dt, end_dt, batch_num):
+    """
+    生成时间区间左边界在 [start_dt, end_dt) 内的全部回溯批次字段字典
+    各时间字段由时间戳序列整体平移得到，不逐行进行 datetime 运算
+    :param task: TaskInfo 对象
+    :param start_dt: 回溯开始时间，按任务执行周期向下取整
+    :param end_dt: 回溯结束时间（不含）
+    :param batch_num: 回溯批次序号
+    """
+
+    unit = UNIT_SECONDS[task.exec_unit]
+    first_ts = int(task.get_init_start_dt(start_dt + datetime.timedelta(seconds=unit)).timestamp())
+    start_ts_list = range(first_ts, int(end_dt.timestamp()), unit * task.exec_unit_param)
+    end_ts_list = range(first_ts + unit, first_ts + unit + len(start_ts_list) * start_ts_list.step, start_ts_list.step)
+    plan_delta = task.delay * 60
+    plan_expire_delta = (task.delay + task.start_expire) * 60
+    depend_list = [
+        (item["task_name"], item["offset"][0] * 86400 + item["offset"][1] * 3600 + item["offset"][2] * 60,
+         item["exec_unit"])
+        for item in json.loads(task.dependence)
+    ]
+
+    cache, rows = dict(), list()
+    task_name, exec_unit = task.task_name, task.exec_unit
+    for start_ts, end_ts in zip(start_ts_list, end_ts_list):
+        start_dt = _to_dt(start_ts, cache)
+        tag_name = TaskInfo.TaskInfo._format_tag_name(task_name, start_dt.isoformat(" ", "seconds"), exec_unit)
+        rows.append(dict(
+            task_name=task_name,
+            task_tag_name=tag_name,
+            task_batch_name=f"{tag_name}_{batch_num}",
+            batch_num=batch_num,
+            exec_status=BACKFILL_STATUS,
+            dependence=json.dumps([
+                TaskInfo.TaskInfo._format_tag_name(name, _to_dt(start_ts + offset, cache).isoformat(" ", "seconds"), u)
+                for name, offset, u in depend_list
+            ]),
+            start_time=start_dt,
+            end_time=_to_dt(end_ts, cache),
+            plan_time=_to_dt(end_ts + plan_delta, cache),
+            plan_expire_time=_to_dt(end_ts + plan_expire_delta, cache),
+            exec_time=None,
+            exit_time=None,
+            duration=0,
+            retry=0,
+            claim_host="",
+        ))
+    return rows
+
+
+class Backfill(object):
+    """回溯执行器"""
+
+    def __init__(self, task_name, start_dt, end_dt, parallelism=None, rate=None):
+        """
+        初始化
+        :param task_name: 任务名称
+        :param start_dt: 回溯开始时间，datetime 对象
+        :param end_dt: 回溯结束时间（不含），datetime 对象
+        :param parallelism: 并发执行批次数上限，默认为 cpu 数量的 1/4
+        :param rate: 每分钟最多启动的批次数，默认不限制
+        """
+
+        self.task_name = task_name
+        self.start_dt, self.end_dt = start_dt, end_dt
+        self.parallelism = parallelism or max(multiprocessing.cpu_count() // 4, 1)
+        self.dispatch_interval = 60 / rate if rate else 0
+        self.claim_host = f"{BACKFILL_CLAIM_PREFIX}{socket.gethostname()}:{os.getpid()}"
+        self.batch_num = None
+        self.script = None
+        self.running = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.state_path = "{}/backfill/{}_{}_{}.json".format(
+            BaseConfig.path_tmp, task_name, start_dt.strftime("%Y%m%d%H%M"), end_dt.strftime("%Y%m%d%H%M"))
+
+    def prepare(self):
+        """生成回溯批次，已有进度文件时沿用其 batch_num，并将上次崩溃时执行中的批次恢复为待执行"""
+
+        session_w = BaseUtils.init_mysql_session("w")
+        t = TaskBatch.TaskBatch
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path) as fp:
+                    self.batch_num = json.load(fp)["batch_num"]
+                count = session_w.query(t).filter_by(
+                    task_name=self.task_name, batch_num=self.batch_num, exec_status=2
+                ).update(dict(exec_status=BACKFILL_STATUS), synchronize_session=False)
+                common_logger.info(f'{self.task_name}:从断点继续回溯，batch_num={self.batch_num}，恢复{count}个执行中批次')
+            else:
+                batch_num = session_w.query(func.max(t.batch_num)).filter(
+                    (t.task_name == self.task_name) & (t.start_time >= self.start_dt) & (t.start_time < self.end_dt)
+                ).scalar()
+                self.batch_num = (batch_num or 0) + 1
+                # 先保存 batch_num，生成过程中崩溃时重新执行可以依赖唯一键跳过已生成的批次
+                os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+                with open(self.state_path, "w") as fp:
+                    json.dump(dict(batch_num=self.batch_num), fp)
+
+            task_info_cache.refresh(session_w)
+            task = task_info_cache.get(self.task_name)
+            self.script = task.script
+            rows = build_backfill_rows(task, self.start_dt, self.end_dt, self.batch_num)
+            count = t.insert_ignore(session_w, rows)
+            session_w.commit()
+            common_logger.info(f'{self.task_name}:回溯批次{len(rows)}个，新增{count}个')
+        except SQLAlchemyError as e:
+            session_w.rollback()
+            raise e
+        # 回溯批次成为 tag 的最新批次，删除索引中旧批次的状态
+        if BaseConfig.tag_index:
+            tag_status_index.delete_many([row["task_tag_name"] for row in rows])
+
+    def claim(self, limit):
+        """
+        认领依赖已满足的回溯批次，包括失败后按退避时间重新入队的批次，返回 TaskDescriptor 列表
+        每次扫描 limit * claim_scan_factor 个待执行批次，依赖未满足的批次留待下次认领
+        """
+
+        session_w = BaseUtils.init_mysql_session("w")
+        now = datetime.datetime.now().replace(microsecond=0)
+        t = TaskBatch.TaskBatch
+        try:
+            task_info_cache.refresh(session_w)
+            task_info = get_task_info_fields(task_info_cache.get(self.task_name))
+            records = session_w.query(
+                t.id, t.task_name, t.task_tag_name, t.task_batch_name, t.batch_num, t.start_time, t.end_time, t.retry,
+                t.plan_expire_time, t.dependence,
+            ).filter(
+                (t.task_name == self.task_name) & (t.batch_num == self.batch_num)
+                & (t.exec_status == BACKFILL_STATUS) & (t.plan_time <= now)
+            ).order_by(t.start_time).limit(limit * BaseConfig.claim_scan_factor).with_for_update().all()
+            candidate_list = [(record, DependResolver.parse(record.dependence)) for record in records]
+            resolver = DependResolver(session_w, index=tag_status_index if BaseConfig.tag_index else None)
+            resolver.load({tag for _, tags in candidate_list for tag in tags})
+            records = [record for record, tags in candidate_list if resolver.is_ready(tags)][:limit]
+            if records:
+                session_w.query(t).filter(t.id.in_([record.id for record in records])).update(
+                    dict(exec_status=2, exec_time=now, claim_host=self.claim_host,
+                         lease_expire_time=get_lease_expire_time(now)), synchronize_session=False)
+            session_w.commit()
+        except SQLAlchemyError as e:
+            session_w.rollback()
+            raise e
+        return [TaskDescriptor(
+            *record[:7], now, record.retry, record.plan_expire_time, self.claim_host, *task_info) for record in records]
+
+    def get_progress(self):
+        """回溯进度，返回 exec_status -> 批次数"""
+
+        session_w = BaseUtils.init_mysql_session("w")
+        t = TaskBatch.TaskBatch
+        progress = dict(
+            session_w.query(t.exec_status, func.count(t.id))
+            .filter_by(task_name=self.task_name, batch_num=self.batch_num).group_by(t.exec_status).all()
+        )
+        session_w.commit()
+        return progress
+
+    def on_task_exit(self, result):
+        """批次执行结束回调"""
+
+        if isinstance(result, BaseException):
+            common_logger.error(f'回溯批次执行异常:{result}')
+        with self.lock:
+            self.running -= 1
+        self.wakeup.set()
+
+    def run(self):
+        """执行回溯，直到不存在待执行或执行中的回溯批次"""
+
+        self.prepare()
+        registry.preload([self.script])
+        BaseUtils.dispose_mysql_session()
+        pool = multiprocessing.Pool(self.parallelism, initializer=init_worker)
+        last_report = last_dispatch = 0
+        try:
+            while True:
+                self.wakeup.clear()
+                with self.lock:
+                    free_slots = self.parallelism - self.running
+                # 限速时每个间隔最多启动一个批次
+                if self.dispatch_interval:
+                    free_slots = min(free_slots, int(time.time() - last_dispatch >= self.dispatch_interval))
+                for descriptor in self.claim(free_slots) if free_slots > 0 else list():
+                    with self.lock:
+                        self.running += 1
+                    pool.apply_async(
+                        execute_task_once, (descriptor,), callback=self.on_task_exit, error_callback=self.on_task_exit
+                    )
+                    last_dispatch = time.time()
+
+                # 循环任务失败后的 exec_status=1 批次由常驻调度进程处理，不计入待执行
+                progress = self.get_progress()
+                pending = sum(progress.get(status, 0) for status in (0, 2, BACKFILL_STATUS))
+                if time.time() - last_report >= 10 or not pending:
+                    done = progress.get(3, 0) + progress.get(4, 0)
+                    failed = progress.get(-1, 0) + progress.get(-2, 0)
+                    common_logger.info(
+                        f'{self.task_name}:回溯进度 {done + failed}/{sum(progress.values())}，成功{done}，失败{failed}')
+                    last_report = time.time()
+                BaseUtils.dispose_mysql_session()
+                if not pending:
+                    break
+                self.wakeup.wait(self.dispatch_interval or 10)
+        finally:
+            pool.close()
+            pool.join()
+        os.remove(self.state_path)
+
+
+@common_logger.logging_wrapper
+def run():
+    """功能入口函数"""
+
+    parser = argparse.ArgumentParser(description="历史区间回溯执行")
+    parser.add_argument("task_name")
+    parser.add_argument("start_time", help="%%Y-%%m-%%d %%H:%%M:%%S")
+    parser.add_argument("end_time", help="%%Y-%%m-%%d %%H:%%M:%%S，不含")
+    parser.add_argument("--parallelism", type=int, default=None, help="并发执行批次数上限")
+    parser.add_argument("--rate", type=float, default=None, help="每分钟最多启动的批次数")
+    args = parser.parse_args()
+
+    start_dt = datetime.datetime.strptime(args.start_time, "%Y-%m-%d %H:%M:%S")
+    end_dt = datetime.datetime.strptime(args.end_time, "%Y-%m-%d %H:%M:%S")
+    Backfill(args.task_name, start_dt, end_dt, args.parallelism, args.rate).run()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,97 @@
+import json
+import redis.exceptions
+from sqlalchemy import func
+
+from Utils import BaseUtils
+from Table import TaskBatch
+import common_logger
+
+# 依赖批次的终态：3 执行成功，4 人工置为成功
+DONE_STATUS = (3, 4)
+
+# 批次执行成功后发布 tag 的 redis 频道
+TAG_DONE_CHANNEL = "taskcenter:tag_done"
+
+
+def publish_tag_done(task_tag_name):
+    """发布 tag 执行成功事件，调度进程收到后立即认领依赖该 tag 的批次；发布失败不影响批次状态，由轮询兜底"""
+
+    try:
+        BaseUtils.init_redis_client(is_log=False).publish(TAG_DONE_CHANNEL, task_tag_name)
+    except redis.exceptions.RedisError as e:
+        common_logger.error(f'{task_tag_name}:发布执行成功事件失败:{e}')
+
+
+class DependResolver(object):
+    """
+    批量依赖判定
+    先收集候选批次引用的全部 tag，按 tag 分组查询最新批次（batch_num 最大）的执行状态，
+    再在内存中的 tag -> exec_status 映射上判定就绪，避免逐 tag 查询
+    指定 index 时先从 redis 索引批量读取，仅未命中的 tag 查询 MySQL 并回填索引
+    """
+
+    def __init__(self, session, chunk_size=500, index=None):
+        """
+        初始化
+        :param session: 数据库 session
+        :param chunk_size: 单次 IN 查询的 tag 数量上限
+        :param index: 可选，TagStatusIndex 对象
+        """
+
+        self.session = session
+        self.chunk_size = chunk_size
+        self.index = index
+        self.status_map = dict()
+        self.query_count = 0
+        self.index_hit = 0
+
+    @staticmethod
+    def parse(dependence):
+        """解析批次的 dependence 字段，返回依赖 tag 列表"""
+
+        return json.loads(dependence) if dependence else list()
+
+    def load(self, tags):
+        """
+        查询 tag 最新批次的执行状态，写入 self.status_map，已加载的 tag 不再查询
+        :param tags: 依赖 tag 可迭代对象
+        """
+
+        tags = sorted(set(tags) - set(self.status_map))
+        if self.index and tags:
+            try:
+                hit_map = self.index.get_many(tags)
+            except redis.exceptions.RedisError as e:
+                common_logger.error(f'tag 状态索引读取失败，回落 MySQL:{e}')
+            else:
+                self.index_hit += len(hit_map)
+                self.status_map.update(hit_map)
+                tags = [tag for tag in tags if tag not in hit_map]
+        t = TaskBatch.TaskBatch
+        for i in range(0, len(tags), self.chunk_size):
+            chunk = tags[i: i + self.chunk_size]
+            latest = self.session.query(
+                t.task_tag_name, func.max(t.batch_num).label("batch_num")
+            ).filter(t.task_tag_name.in_(chunk)).group_by(t.task_tag_name).subquery()
+            rows = self.session.query(t.task_tag_name, t.batch_num, t.exec_status).join(
+                latest, (t.task_tag_name == latest.c.task_tag_name) & (t.batch_num == latest.c.batch_num)
+            ).all()
+            self.query_count += 1
+            self.status_map.update((tag, exec_status) for tag, _, exec_status in rows)
+            if self.index and rows:
+                try:
+                    self.index.fill_many(rows)
+                except redis.exceptions.RedisError as e:
+                    common_logger.error(f'tag 状态索引回填失败:{e}')
+
+    def is_ready(self, tags):
+        """依赖 tag 的最新批次全部处于终态时返回 True，不存在的 tag 视为未就绪"""
+
+        status_map = self.status_map
+        return all(status_map.get(tag) in DONE_STATUS for tag in tags)
+
+    def pending_tags(self, tags):
+        """未处于终态的依赖 tag 列表"""
+
+        status_map = self.status_map
+        return [tag for tag in tags if status_map.get(tag) not in DONE_STATUS]
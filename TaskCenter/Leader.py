@@ -0,0 +1,135 @@
+"""
+调度单例职责的选主
+各节点的 LeaderElector 在后台线程中以 notify + watchdog 模式阻塞获取 redis 锁 leader:{name}，获得锁的节点成为 leader，
+锁由 watchdog 每隔 lease / 3 秒续期；leader 正常退出时释放锁并唤醒等待方，进程崩溃时锁在 lease 秒后过期
+每次当选时 INCR leader:{name}:fencing 得到单调递增的 fencing token，leader 在写库事务中通过 fence 以 token 条件更新
+task_leader，被新 leader 取代后仍在执行的旧 leader 事务更新失败并回滚
+redis 计数器丢失（清空、无持久化的主从切换）后 INCR 从 1 重新计数，token 取 max(INCR, task_leader 中的 token + 1)，
+并将计数器回写为该值，保证新 leader 的 token 大于已写入的 token
+"""
+import os
+import socket
+import threading
+import redis.lock
+import redis.exceptions
+from sqlalchemy.exc import SQLAlchemyError
+
+from Config import BaseConfig
+from Utils import BaseUtils
+from Table import TaskLeader
+import common_logger
+
+# 调度进程的选主名称，对应 task_leader.name
+SCHEDULER_LEADER = "scheduler"
+
+
+class LeaderLost(Exception):
+    """leader 身份已失效，已有更新的 leader 写入"""
+
+    pass
+
+
+def fence(session, token, name=SCHEDULER_LEADER):
+    """
+    在调用方事务中校验 fencing token，失败时抛出 LeaderLost，调用方应回滚
+    :param session: 数据库 session，由调用方提交事务
+    :param token: 当选时获得的 fencing token
+    """
+
+    if not TaskLeader.TaskLeader.fence(session, name, token, f"{socket.gethostname()}:{os.getpid()}"):
+        raise LeaderLost(f'{name}:fencing token {token} 已失效')
+
+
+class LeaderElector(object):
+    """选主，后台线程持续竞选，当选后定期确认锁仍被持有"""
+
+    def __init__(self, name=SCHEDULER_LEADER, lease_seconds=None, on_elected=None):
+        """
+        初始化
+        :param name: 选主名称
+        :param lease_seconds: 锁的过期时间（秒），即 leader 崩溃后的最长切换时间，默认读取 BaseConfig.leader_lease_seconds
+        :param on_elected: 可选，当选后的回调，参数为 fencing token
+        """
+
+        self.name = name
+        self.lease_seconds = lease_seconds or BaseConfig.leader_lease_seconds
+        self.on_elected = on_elected
+        self.client = BaseUtils.init_redis_client(is_log=False)
+        # 锁由竞选线程获取，由调度主循环释放，不使用本地线程保存 token
+        self.lock = self.client.lock(
+            f"leader:{name}", timeout=self.lease_seconds, thread_local=False, notify=True, watchdog=True)
+        self.token = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"leader:{name}", daemon=True)
+
+    def start(self):
+        """启动竞选线程"""
+
+        self.thread.start()
+
+    def is_leader(self):
+        """当前是否为 leader，返回 fencing token，不是 leader 时返回 None"""
+
+        return self.token
+
+    def _run(self):
+        """竞选循环"""
+
+        while not self.stopped.is_set():
+            try:
+                if not self.lock.acquire(blocking=True, blocking_timeout=self.lease_seconds):
+                    continue
+                if self.stopped.is_set():
+                    self.lock.release()
+                    break
+                self.token = self.next_token()
+                common_logger.info(f'{self.name}:当选 leader，fencing token {self.token}')
+                if self.on_elected:
+                    self.on_elected(self.token)
+                # 锁由 watchdog 续期，续期失败或锁被删除后重新竞选
+                while not self.stopped.wait(self.lease_seconds / 3) and self.lock.owned():
+                    pass
+                if not self.stopped.is_set():
+                    common_logger.error(f'{self.name}:leader 锁已丢失，重新竞选')
+                    self.token = None
+            except redis.exceptions.RedisError as e:
+                common_logger.error(f'{self.name}:选主异常:{e}')
+                self.token = None
+                self.stopped.wait(1)
+            except SQLAlchemyError as e:
+                # 读取 task_leader 失败时放弃本次当选，释放锁后重新竞选
+                common_logger.error(f'{self.name}:读取 fencing token 失败:{e}')
+                self.token = None
+                try:
+                    self.lock.release()
+                except (redis.exceptions.RedisError, redis.lock.LockError):
+                    pass
+                self.stopped.wait(1)
+
+    def next_token(self):
+        """当选时生成 fencing token，仅由持有锁的竞选线程调用"""
+
+        key = f"leader:{self.name}:fencing"
+        token = self.client.incr(key)
+        session_w = BaseUtils.init_mysql_session("w")
+        try:
+            stored = TaskLeader.TaskLeader.get_token(session_w, self.name)
+        finally:
+            session_w.close()
+        if token <= stored:
+            common_logger.error(f'{self.name}:fencing 计数器{token}小于已写入的 token {stored}，按 task_leader 重置')
+            token = stored + 1
+            self.client.set(key, token)
+        return token
+
+    def stop(self):
+        """停止竞选，是 leader 时释放锁，等待方立即被唤醒接管"""
+
+        self.stopped.set()
+        token, self.token = self.token, None
+        if token is not None:
+            try:
+                self.lock.release()
+                common_logger.info(f'{self.name}:释放 leader')
+            except (redis.exceptions.RedisError, redis.lock.LockError) as e:
+                common_logger.error(f'{self.name}:释放 leader 失败:{e}')
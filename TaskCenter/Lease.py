@@ -0,0 +1,225 @@
+"""
+执行中批次的租约
+认领批次时写入 lease_expire_time = 认领时间 + BaseConfig.lease_seconds，执行进程中的 LeaseKeeper 每隔
+lease_renew_interval 秒续期；执行进程被 OOM kill 或主机宕机后租约不再续期，调度进程的 reap_expired 将租约过期的
+执行中批次按 retry_max_times 重新入队或置为失败，恢复时间不超过 lease_seconds + 调度周期
+认领时写入的 (claim_host, exec_time) 为认领凭证，随 TaskDescriptor 下发，续期和执行结果写入均要求批次仍处于执行中且凭证一致；
+批次被回收并重新认领后，原执行进程续期失败时停止等待（Supervisor 子进程直接退出），迟到的执行结果不会覆盖新的执行
+"""
+import datetime
+import threading
+from sqlalchemy.exc import SQLAlchemyError
+
+from Config import BaseConfig
+from Utils import BaseUtils
+from Table import TaskBatch
+from .RetryPolicy import RetryPolicy, clamp_loop_plan_time
+from .TaskInfoCache import task_info_cache
+import common_logger
+
+# 执行进程因租约被回收而退出的退出码
+LEASE_LOST_EXITCODE = 75
+
+# 回溯批次待执行状态，回溯批次认领时 claim_host 以 BACKFILL_CLAIM_PREFIX 开头，失败重试或租约过期后恢复为该状态
+BACKFILL_STATUS = 5
+BACKFILL_CLAIM_PREFIX = "backfill:"
+
+
+def get_requeue_status(claim_host, task_type):
+    """失败重试时批次恢复的待执行状态：回溯批次为 BACKFILL_STATUS，循环任务为 1，其他任务为 0"""
+
+    if claim_host and claim_host.startswith(BACKFILL_CLAIM_PREFIX):
+        return BACKFILL_STATUS
+    return 1 if task_type == 1 else 0
+
+
+class LeaseExpired(Exception):
+    """批次租约过期，执行进程异常退出或主机宕机"""
+
+    pass
+
+
+def get_lease_expire_time(now=None):
+    """租约到期时间"""
+
+    now = now or datetime.datetime.now()
+    return (now + datetime.timedelta(seconds=BaseConfig.lease_seconds)).replace(microsecond=0)
+
+
+def get_claim_token(descriptor):
+    """批次的认领凭证"""
+
+    return descriptor.claim_host, descriptor.exec_time
+
+
+def get_claim_filter(batch_id, claim_host, exec_time):
+    """批次仍处于执行中且认领凭证一致的过滤条件"""
+
+    t = TaskBatch.TaskBatch
+    return (t.id == batch_id) & (t.exec_status == 2) & (t.claim_host == claim_host) & (t.exec_time == exec_time)
+
+
+def get_claim_tokens(session, batch_ids):
+    """
+    加锁查询执行中批次当前的认领凭证，锁在调用方事务提交后释放
+    :return: 批次 id -> (claim_host, exec_time)，不处于执行中的批次不包含在内
+    """
+
+    t = TaskBatch.TaskBatch
+    rows = session.query(t.id, t.claim_host, t.exec_time).filter(
+        t.id.in_(list(batch_ids)) & (t.exec_status == 2)).with_for_update().all()
+    return {row.id: (row.claim_host, row.exec_time) for row in rows}
+
+
+def get_owned_ids(session, token_map):
+    """
+    加锁查询仍由指定认领持有的批次
+    :param token_map: 批次 id -> (claim_host, exec_time)
+    :return: 批次 id 集合
+    """
+
+    current_map = get_claim_tokens(session, token_map)
+    return {batch_id for batch_id, token in current_map.items() if token == tuple(token_map[batch_id])}
+
+
+def extend_leases(session, token_map):
+    """
+    为仍由指定认领持有的批次续期，由调用方提交事务
+    :param token_map: 批次 id -> (claim_host, exec_time)
+    :return: 续期成功的批次 id 集合
+    """
+
+    owned_ids = get_owned_ids(session, token_map) if token_map else set()
+    if owned_ids:
+        t = TaskBatch.TaskBatch
+        session.query(t).filter(t.id.in_(list(owned_ids))).update(
+            dict(lease_expire_time=get_lease_expire_time()), synchronize_session=False)
+    return owned_ids
+
+
+class LeaseKeeper(object):
+    """
+    执行进程中的租约续期线程，进程内持有的全部批次在一个事务中续期
+    续期时批次已不处于执行中或认领凭证不一致，说明租约已被回收，置位该批次的 lost 事件并调用 on_lost
+    首次 add 时启动线程，进程 fork 后线程不会被继承，子进程首次 add 时重新启动
+    """
+
+    def __init__(self):
+        """初始化"""
+
+        self.lock = threading.Lock()
+        # 批次 id -> (认领凭证, lost 事件, on_lost 回调)
+        self.batch_map = dict()
+        self.thread = None
+
+    def add(self, batch_id, token, on_lost=None):
+        """
+        开始为批次续期
+        :param token: 认领凭证 (claim_host, exec_time)
+        :param on_lost: 可选，租约被回收时在续期线程中调用
+        :return: 租约被回收时置位的 threading.Event
+        """
+
+        lost = threading.Event()
+        with self.lock:
+            self.batch_map[batch_id] = (token, lost, on_lost)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return lost
+
+    def discard(self, batch_id):
+        """停止为批次续期"""
+
+        with self.lock:
+            self.batch_map.pop(batch_id, None)
+
+    def renew(self):
+        """续期，仅更新仍由本次认领持有的批次，其余批次视为租约已被回收"""
+
+        with self.lock:
+            token_map = {batch_id: value[0] for batch_id, value in self.batch_map.items()}
+        if not token_map:
+            return
+        session_w = BaseUtils.init_mysql_session("w")
+        try:
+            owned_ids = extend_leases(session_w, token_map)
+            session_w.commit()
+        except SQLAlchemyError as e:
+            session_w.rollback()
+            common_logger.error(f'{len(token_map)}个批次租约续期失败:{e}')
+            return
+        finally:
+            session_w.close()
+        for batch_id in set(token_map) - owned_ids:
+            with self.lock:
+                value = self.batch_map.pop(batch_id, None)
+            if value is None:
+                # 续期期间批次已执行结束
+                continue
+            common_logger.error(f'批次{batch_id}的租约已被回收，停止执行')
+            _, lost, on_lost = value
+            lost.set()
+            if on_lost:
+                on_lost()
+
+    def _run(self):
+        """续期循环"""
+
+        event = threading.Event()
+        while not event.wait(BaseConfig.lease_renew_interval):
+            self.renew()
+
+
+# 进程级租约续期
+lease_keeper = LeaseKeeper()
+
+
+def reap_expired(session, now=None):
+    """
+    回收租约过期的执行中批次
+    未超过 retry_max_times 时按重试策略重新入队（回溯批次恢复为 BACKFILL_STATUS），否则循环任务恢复为 exec_status=1，
+    其他任务置为执行失败
+    :param session: 数据库 session，由调用方提交事务
+    :return: 回收的批次 id 列表
+    """
+
+    now = now or datetime.datetime.now().replace(microsecond=0)
+    t = TaskBatch.TaskBatch
+    query = session.query(
+        t.id, t.task_name, t.task_batch_name, t.retry, t.exec_time, t.claim_host, t.plan_expire_time,
+    ).filter(
+        (t.exec_status == 2) & (t.lease_expire_time < now))
+    if BaseConfig.claim_skip_locked:
+        query = query.with_for_update(skip_locked=True)
+    else:
+        query = query.with_for_update()
+
+    error, reaped_ids = LeaseExpired(), list()
+    for record in query.all():
+        task = task_info_cache.get(record.task_name)
+        retry = record.retry + 1
+        plan_time = None
+        if task is not None and retry <= task.retry_max_times:
+            policy = RetryPolicy(task.retry_base, task.retry_multiplier, task.retry_cap, task.retry_jitter)
+            plan_time = policy.get_plan_time(error, retry, now)
+            if task.task_type == 1:
+                plan_time = clamp_loop_plan_time(plan_time, record.plan_expire_time, now)
+        if plan_time is not None:
+            kwargs = dict(
+                retry=retry,
+                exec_status=get_requeue_status(record.claim_host, task.task_type),
+                plan_time=plan_time.replace(microsecond=0),
+                exec_time=None,
+            )
+            common_logger.error(f'{record.task_batch_name}:租约过期，计划于{plan_time:%Y-%m-%d %H:%M:%S}第{retry}次重试')
+        elif task is not None and task.task_type == 1:
+            kwargs = dict(retry=0, duration=0, exec_status=1, exec_time=None)
+            common_logger.error(f'{record.task_batch_name}:租约过期，循环任务恢复待执行')
+        else:
+            kwargs = dict(exec_status=-1)
+            common_logger.error(f'{record.task_batch_name}:租约过期，置为执行失败')
+        session.query(t).filter_by(id=record.id, exec_status=2).update(
+            dict(kwargs, exit_time=now, lease_expire_time=None), synchronize_session=False)
+        reaped_ids.append(record.id)
+    return reaped_ids
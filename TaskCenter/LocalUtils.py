@@ -30,4 +30,60 @@ class Interval(object):
             interval = map(datetime.datetime.fromtimestamp, interval)
         if time_type == "str":
             interval = map(lambda x: x.strftime(time_format), interval)
-        return tuple(interval)
\ No newline at end of file
+        return tuple(interval)
+
+    def __repr__(self):
+        return f"Interval({self.ts_start}, {self.ts_end})"
+
+    def __eq__(self, other):
+        return isinstance(other, Interval) and (self.ts_start, self.ts_end) == (other.ts_start, other.ts_end)
+
+    def __hash__(self):
+        return hash((self.ts_start, self.ts_end))
+
+    @property
+    def seconds(self):
+        """区间长度（秒）"""
+
+        return self.ts_end - self.ts_start
+
+    def iter_split(self, n=None, step_seconds=None):
+        """
+        按顺序生成子区间，n 与 step_seconds 二选一，子区间首尾相接且覆盖原区间
+        长度为 0 的区间（开始时间等于结束时间）生成一个与原区间相同的子区间，保证分片执行的批次至少执行一次
+        :param n: 等分数量，区间长度不足 n 秒时子区间数量少于 n
+        :param step_seconds: 子区间长度（秒），最后一个子区间可能不足 step_seconds
+        """
+
+        if (n is None) == (step_seconds is None):
+            raise ValueError("n 与 step_seconds 必须且只能指定一个")
+        if n is not None:
+            if n <= 0:
+                raise ValueError(f"n 必须为正整数:{n}")
+            bounds = sorted({self.ts_start + self.seconds * i // n for i in range(n + 1)})
+        else:
+            if step_seconds <= 0:
+                raise ValueError(f"step_seconds 必须为正整数:{step_seconds}")
+            bounds = list(range(self.ts_start, self.ts_end, step_seconds)) + [self.ts_end]
+        if self.ts_end <= self.ts_start:
+            yield Interval(self.ts_start, self.ts_end)
+            return
+        for ts_start, ts_end in zip(bounds, bounds[1:]):
+            yield Interval(ts_start, ts_end)
+
+    def split(self, n=None, step_seconds=None):
+        """切分为子区间列表，参数同 iter_split"""
+
+        return list(self.iter_split(n, step_seconds))
+
+    @staticmethod
+    def merge(intervals):
+        """合并重叠或首尾相接的区间，返回按开始时间排序的区间列表"""
+
+        merged = list()
+        for interval in sorted(intervals, key=lambda x: (x.ts_start, x.ts_end)):
+            if merged and interval.ts_start <= merged[-1].ts_end:
+                merged[-1] = Interval(merged[-1].ts_start, max(merged[-1].ts_end, interval.ts_end))
+            else:
+                merged.append(Interval(interval.ts_start, interval.ts_end))
+        return merged
@@ -0,0 +1,251 @@
+"""
+调度指标
+批次维度：排队延迟（plan_time 到认领）、启动延迟（认领到执行进程开始执行）、执行耗时、重试次数、最终状态
+认领维度：get_ready_task 的查询耗时、扫描候选批次数、依赖 tag 数及依赖查询次数
+指标以直方图 / 计数器汇总在调度进程中，按 Prometheus 文本格式每隔 metrics_export_interval 秒写入 metrics_file，
+或由 metrics_http_port 端口的 /metrics 提供
+标签仅使用执行方式、任务类型、最终状态等取值固定的字段，不使用任务名或批次名
+"""
+import os
+import time
+import bisect
+import threading
+import collections
+import http.server
+
+from Config import BaseConfig
+import common_logger
+
+# 执行进程返回调度进程的批次执行统计，时间单位为秒
+BatchStats = collections.namedtuple("BatchStats", ("start_delay", "run_time", "retry", "status"))
+
+# 时间类直方图的桶上界（秒）
+TIME_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200)
+# 数量类直方图的桶上界
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+
+def get_status_label(exec_status, retry_planned):
+    """按批次退出时写入的 exec_status 得到状态标签"""
+
+    if exec_status == 3:
+        return "success"
+    if retry_planned:
+        return "retry"
+    if exec_status == -2:
+        return "timeout"
+    return "failed"
+
+
+class Histogram(object):
+    """累计直方图，按标签值元组分别统计，线程安全"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        """
+        初始化
+        :param name: 指标名
+        :param help_text: 指标说明
+        :param label_names: 标签名元组
+        :param buckets: 桶上界，升序
+        """
+
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # 标签值元组 -> [各桶计数（最后一个为 +Inf）, 总和, 次数]
+        self.series = dict()
+
+    def observe(self, value, *labels):
+        """记录一次观测值"""
+
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Prometheus 文本格式"""
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series_list = [
+                (labels, list(counts), total, count) for labels, (counts, total, count) in self.series.items()]
+        for labels, counts, total, count in sorted(series_list):
+            label_text = ",".join(f'{key}="{label}"' for key, label in zip(self.label_names, labels))
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{suffix} {total:g}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Counter(object):
+    """累计计数器，按标签值元组分别统计，线程安全"""
+
+    def __init__(self, name, help_text, label_names):
+        """
+        初始化
+        :param name: 指标名
+        :param help_text: 指标说明
+        :param label_names: 标签名元组
+        """
+
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.lock = threading.Lock()
+        self.series = collections.Counter()
+
+    def inc(self, value, *labels):
+        """累加"""
+
+        with self.lock:
+            self.series[labels] += value
+
+    def render(self):
+        """Prometheus 文本格式"""
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            series_list = sorted(self.series.items())
+        for labels, value in series_list:
+            label_text = ",".join(f'{key}="{label}"' for key, label in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{label_text}}} {value:g}" if label_text else f"{self.name} {value:g}")
+        return lines
+
+
+class SchedulerMetrics(object):
+    """调度进程内的指标汇总"""
+
+    def __init__(self):
+        """初始化"""
+
+        batch_labels = ("mode", "task_type", "status")
+        self.queue_delay = Histogram(
+            "taskcenter_batch_queue_delay_seconds", "plan_time 到认领的延迟", ("mode", "task_type"), TIME_BUCKETS)
+        self.start_delay = Histogram(
+            "taskcenter_batch_start_delay_seconds", "认领到执行进程开始执行的延迟", batch_labels, TIME_BUCKETS)
+        self.run_time = Histogram("taskcenter_batch_run_seconds", "批次执行耗时", batch_labels, TIME_BUCKETS)
+        self.retry = Histogram("taskcenter_batch_retry", "批次结束时的已重试次数", batch_labels, COUNT_BUCKETS)
+        self.batch_total = Counter("taskcenter_batch_total", "结束的批次数", batch_labels)
+        self.claim_query = Histogram(
+            "taskcenter_claim_query_seconds", "get_ready_task 查询及判定耗时", ("mode",), TIME_BUCKETS)
+        self.claim_candidates = Histogram(
+            "taskcenter_claim_candidates", "单次认领扫描的候选批次数", ("mode",), COUNT_BUCKETS)
+        self.claim_dependency_tags = Histogram(
+            "taskcenter_claim_dependency_tags", "单次认领判定的依赖 tag 数", ("mode",), COUNT_BUCKETS)
+        self.claim_dependency_queries = Counter(
+            "taskcenter_claim_dependency_queries_total", "依赖判定的 MySQL 查询次数", ("mode",))
+        self.claim_index_hits = Counter(
+            "taskcenter_claim_dependency_index_hits_total", "依赖判定命中 tag 状态索引的 tag 数", ("mode",))
+        self.claimed_total = Counter("taskcenter_claimed_batch_total", "认领的批次数", ("mode",))
+        self.metric_list = [
+            self.queue_delay, self.start_delay, self.run_time, self.retry, self.batch_total,
+            self.claim_query, self.claim_candidates, self.claim_dependency_tags, self.claim_dependency_queries,
+            self.claim_index_hits, self.claimed_total,
+        ]
+        self.export_ts = 0
+        self.server = None
+
+    def observe_claim(self, mode, task_manager):
+        """
+        记录一次认领
+        :param mode: 认领的执行方式，pool / supervised / async
+        :param task_manager: 已执行 get_ready_task 的 TaskManager
+        """
+
+        stats = task_manager.claim_stats
+        if not stats:
+            return
+        self.claim_query.observe(stats["query_time"], mode)
+        self.claim_candidates.observe(stats["candidates"], mode)
+        self.claim_dependency_tags.observe(stats["dependency_tags"], mode)
+        self.claim_dependency_queries.inc(stats["dependency_queries"], mode)
+        self.claim_index_hits.inc(stats["index_hits"], mode)
+        self.claimed_total.inc(len(task_manager.task_list), mode)
+        for descriptor, queue_delay in zip(task_manager.task_list, stats["queue_delays"]):
+            self.queue_delay.observe(queue_delay, mode, str(descriptor.task_type))
+
+    def observe_batch(self, mode, descriptor, stats):
+        """
+        记录一个结束的批次
+        :param mode: 执行方式，pool / supervised / shard / async
+        :param descriptor: TaskDescriptor
+        :param stats: BatchStats，被终止的监管子进程 start_delay 为 None
+        """
+
+        labels = (mode, str(descriptor.task_type), stats.status)
+        if stats.start_delay is not None:
+            self.start_delay.observe(stats.start_delay, *labels)
+        self.run_time.observe(stats.run_time, *labels)
+        self.retry.observe(stats.retry, *labels)
+        self.batch_total.inc(1, *labels)
+
+    def render(self):
+        """全部指标的 Prometheus 文本"""
+
+        lines = list()
+        for metric in self.metric_list:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def export(self, force=False):
+        """距上次写入超过 metrics_export_interval 秒时写入 metrics_file，先写临时文件再重命名"""
+
+        path = BaseConfig.metrics_file
+        if not path or (not force and time.time() - self.export_ts < BaseConfig.metrics_export_interval):
+            return
+        self.export_ts = time.time()
+        try:
+            with open(f"{path}.tmp", "w") as fp:
+                fp.write(self.render())
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            common_logger.error(f'指标写入失败:{e}')
+
+    def serve(self, port):
+        """在守护线程中启动 /metrics HTTP 服务"""
+
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        common_logger.info(f'指标服务启动，端口{port}')
+
+    def close(self):
+        """停止 HTTP 服务，写入最终指标"""
+
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.export(force=True)
+
+
+# 调度进程的指标汇总
+scheduler_metrics = SchedulerMetrics()
@@ -0,0 +1,119 @@
+"""
+关键路径优先级：按 task_info.dependence 构建任务级依赖图，为就绪批次计算权重
+权重 = 关键路径长度（本任务及其下游最长链路的历史平均耗时之和，分钟）+ fanout_weight * 传递下游任务数
+认领时按权重降序填充空闲进程，权重相同时按 plan_time 升序
+依赖图按任务构建，不区分批次的时间区间偏移，依赖自身（上一周期）的边不计入，其余环上的回边按 0 计算
+"""
+import time
+import json
+import datetime
+from sqlalchemy import func
+
+from Config import BaseConfig
+from Table import TaskBatch
+from .TaskInfoCache import task_info_cache
+import common_logger
+
+
+def compute_weights(dependence_map, duration_map, fanout_weight=1.0, default_duration=1):
+    """
+    计算任务权重
+    :param dependence_map: task_name -> 上游 task_name 列表
+    :param duration_map: task_name -> 历史平均耗时（分钟），缺失时使用 default_duration
+    :param fanout_weight: 每个传递下游任务折算的权重
+    :param default_duration: 无历史耗时的任务的预估耗时（分钟）
+    :return: task_name -> 权重
+    """
+
+    downstream_map = {task_name: set() for task_name in dependence_map}
+    for task_name, upstream_list in dependence_map.items():
+        for upstream in upstream_list:
+            if upstream != task_name:
+                downstream_map.setdefault(upstream, set()).add(task_name)
+
+    path_map, descendant_map = dict(), dict()
+    for root in downstream_map:
+        if root in path_map:
+            continue
+        # 迭代后序遍历，visiting 中的节点为当前路径上的节点，指向它们的边为环上的回边
+        stack, visiting = [(root, iter(downstream_map[root]))], {root}
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                visiting.discard(node)
+                done_children = [c for c in downstream_map[node] if c in path_map]
+                descendants = set(downstream_map[node])
+                for c in done_children:
+                    descendants |= descendant_map[c]
+                descendants.discard(node)
+                descendant_map[node] = descendants
+                path_map[node] = duration_map.get(node, default_duration) + max(
+                    (path_map[c] for c in done_children), default=0)
+            elif child not in path_map and child not in visiting:
+                visiting.add(child)
+                stack.append((child, iter(downstream_map[child])))
+
+    return {
+        task_name: path_map[task_name] + fanout_weight * len(descendant_map[task_name])
+        for task_name in downstream_map
+    }
+
+
+class TaskGraph(object):
+    """进程级依赖图与任务权重缓存，task_info 缓存重新加载或历史耗时过期时重新计算"""
+
+    def __init__(self, duration_refresh_interval=600, duration_days=7):
+        """
+        初始化
+        :param duration_refresh_interval: 历史耗时刷新周期（秒）
+        :param duration_days: 历史耗时统计范围（天）
+        """
+
+        self.duration_refresh_interval = duration_refresh_interval
+        self.duration_days = duration_days
+        self.duration_map = dict()
+        self.duration_ts = 0
+        self.task_map = None
+        self.weight_map = dict()
+
+    def load_duration(self, session):
+        """统计最近 duration_days 天执行成功批次的平均耗时（分钟），使用 (exec_status, plan_time) 索引"""
+
+        t = TaskBatch.TaskBatch
+        since = datetime.datetime.now() - datetime.timedelta(days=self.duration_days)
+        rows = session.query(t.task_name, func.avg(t.duration)).filter(
+            (t.exec_status == 3) & (t.plan_time >= since)
+        ).group_by(t.task_name).all()
+        return {task_name: float(duration) for task_name, duration in rows if duration}
+
+    def refresh(self, session):
+        """
+        按需重新计算权重，调用前需已刷新 task_info_cache
+        :param session: 数据库 session，由调用方管理事务
+        """
+
+        duration_expired = time.time() - self.duration_ts >= self.duration_refresh_interval
+        if self.task_map is task_info_cache.task_map and not duration_expired:
+            return
+        if duration_expired:
+            self.duration_map = self.load_duration(session)
+            self.duration_ts = time.time()
+        self.task_map = task_info_cache.task_map
+        dependence_map = {
+            task.task_name: [item["task_name"] for item in json.loads(task.dependence or "[]")]
+            for task in task_info_cache.online()
+        }
+        self.weight_map = compute_weights(dependence_map, self.duration_map, BaseConfig.priority_fanout_weight)
+        common_logger.info(f'依赖图权重刷新，共{len(self.weight_map)}个任务')
+
+    def sort(self, records):
+        """按任务权重降序、plan_time 升序排列批次，records 需包含 task_name 和 plan_time"""
+
+        weight_map = self.weight_map
+        return sorted(records, key=lambda record: (-weight_map.get(record.task_name, 0), record.plan_time))
+
+
+# 进程级依赖图
+task_graph = TaskGraph()
@@ -0,0 +1,143 @@
+"""
+批次性能采集
+task_info.profile 或环境变量 TASKCENTER_PROFILE 开启后，Batch.run 中的 run_task 由 BatchProfiler 包装：
+PROFILE_CPU 使用 cProfile 采集，结果写入 {task_batch_name}.prof，日志输出累计耗时最高的函数
+PROFILE_MEMORY 使用 tracemalloc 采集，按代码行统计的内存分配写入 {task_batch_name}.mem.txt
+结果目录总大小超过 BaseConfig.profile_max_mb 时删除最早的文件。未开启时 run_task 不被包装，没有额外开销
+"""
+import os
+import pstats
+import cProfile
+import functools
+import tracemalloc
+
+from Config import BaseConfig
+import common_logger
+
+PROFILE_CPU = 1
+PROFILE_MEMORY = 2
+
+# 性能采集结果目录
+path_profile = f"{BaseConfig.path_tmp}/profile"
+
+
+def parse_profile_env(value):
+    """
+    解析 TASKCENTER_PROFILE，无法解析的项记录日志后忽略，不影响进程启动
+    :param value: "3" 表示全部任务，"task_a:1,task_b:3" 表示指定任务，"task_a:0" 关闭指定任务
+    :return: (全部任务的开关, task_name -> 开关)
+    """
+
+    default, task_map = 0, dict()
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        task_name, _, flags = item.rpartition(":")
+        try:
+            flags = int(flags)
+        except ValueError:
+            common_logger.error(f'TASKCENTER_PROFILE 无法解析，忽略:{item}')
+            continue
+        if task_name:
+            task_map[task_name] = flags
+        else:
+            default = flags
+    return default, task_map
+
+
+_env_default, _env_task_map = parse_profile_env(BaseConfig.profile_env)
+
+
+def get_profile_flags(task_name, profile):
+    """批次的性能采集开关，环境变量中指定任务的开关（包括 0）优先，其次为全部任务的开关，最后为 task_info.profile"""
+
+    if task_name in _env_task_map:
+        return _env_task_map[task_name]
+    return _env_default or profile or 0
+
+
+def rotate(path, max_bytes):
+    """目录总大小超过 max_bytes 时按修改时间从早到晚删除文件"""
+
+    try:
+        entries = [entry for entry in os.scandir(path) if entry.is_file()]
+    except FileNotFoundError:
+        return
+    entries = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries), reverse=True)
+    total = 0
+    for _, size, file_path in entries:
+        total += size
+        if total > max_bytes:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+
+class BatchProfiler(object):
+    """单个批次的性能采集"""
+
+    def __init__(self, task_batch_name, flags):
+        """
+        初始化
+        :param task_batch_name: 批次名称，用于结果文件命名
+        :param flags: PROFILE_CPU / PROFILE_MEMORY 按位组合
+        """
+
+        self.task_batch_name = task_batch_name
+        self.flags = flags
+
+    def wrap(self, func):
+        """包装 run_task，分片执行时每个分片单独采集"""
+
+        @functools.wraps(func)
+        def wrapper(**kwargs):
+            name = self.task_batch_name
+            if kwargs.get("shard_index") is not None:
+                name = f"{name}_shard{kwargs['shard_index']}"
+            return self.run(name, func, kwargs)
+
+        return wrapper
+
+    def run(self, name, func, kwargs):
+        """执行并采集，采集结果写入失败不影响批次执行结果"""
+
+        profile = cProfile.Profile() if self.flags & PROFILE_CPU else None
+        trace_memory = self.flags & PROFILE_MEMORY and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        if profile:
+            profile.enable()
+        try:
+            return func(**kwargs)
+        finally:
+            if profile:
+                profile.disable()
+            snapshot = tracemalloc.take_snapshot() if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+            try:
+                self.save(name, profile, snapshot)
+            except Exception as e:
+                common_logger.error(f'{name}:性能采集结果保存失败:{e}')
+
+    @staticmethod
+    def save(name, profile, snapshot):
+        """写入结果文件并输出摘要"""
+
+        os.makedirs(path_profile, exist_ok=True)
+        top_n = BaseConfig.profile_top_n
+        if profile:
+            profile.dump_stats(f"{path_profile}/{name}.prof")
+            # stats: (文件, 行号, 函数) -> (原始调用次数, 调用次数, 自身耗时, 累计耗时, 调用方)
+            stats = pstats.Stats(profile).stats
+            top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+            summary = "\n".join(
+                f'  {ct:.3f}s {tt:.3f}s {nc:>8} {func}  {os.path.basename(file)}:{line}'
+                for (file, line, func), (_, nc, tt, ct, _) in top
+            )
+            common_logger.info(f'{name}:cProfile 累计耗时/自身耗时/调用次数\n{summary}')
+        if snapshot:
+            top = snapshot.statistics("lineno")[:top_n]
+            with open(f"{path_profile}/{name}.mem.txt", "w") as fp:
+                fp.write("\n".join(str(stat) for stat in top) + "\n")
+            common_logger.info(f'{name}:内存分配最多的代码行\n' + "\n".join(f'  {stat}' for stat in top[:3]))
+        rotate(path_profile, BaseConfig.profile_max_mb << 20)
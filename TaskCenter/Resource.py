@@ -0,0 +1,156 @@
+"""
+资源感知的准入控制
+task_info 声明单个批次的资源需求：cpu_weight（占用 cpu 核数，IO 密集任务应小于 1）、memory_mb（内存峰值）、
+max_concurrency（同一任务同时执行的批次数上限，0 为不限制）
+执行进程采样每个批次的 cpu 时间和 RSS 峰值写入 task_batch，内存需求取声明值与最近实测峰值的较大者
+调度进程按声明的主机预算依次装入就绪批次，预算不足的批次跳过，由后续需求更小的批次填充剩余容量
+"""
+import time
+import datetime
+import resource
+import threading
+import collections
+import psutil
+from sqlalchemy import func
+
+from Table import TaskBatch
+from .TaskInfoCache import task_info_cache
+
+
+class ResourceSampler(object):
+    """批次资源采样，在执行进程中围绕批次执行使用，进程内同一时间只执行一个批次"""
+
+    def __init__(self, interval=1):
+        """
+        初始化
+        :param interval: RSS 采样周期（秒）
+        """
+
+        self.interval = interval
+        self.process = psutil.Process()
+        self.stopped = threading.Event()
+        self.cpu_start = 0
+        self.max_rss = 0
+        self.thread = None
+
+    @staticmethod
+    def _cpu_time():
+        """进程累计 cpu 时间（秒），包含用户态和内核态"""
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def _sample(self):
+        """采样线程"""
+
+        while True:
+            try:
+                self.max_rss = max(self.max_rss, self.process.memory_info().rss)
+            except psutil.Error:
+                pass
+            if self.stopped.wait(self.interval):
+                break
+
+    def start(self):
+        """开始采样"""
+
+        self.cpu_start = self._cpu_time()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """结束采样，返回 task_batch 资源字段字典"""
+
+        self.stopped.set()
+        self.thread.join()
+        return dict(
+            cpu_time=round(self._cpu_time() - self.cpu_start, 2),
+            max_rss_mb=self.max_rss // (1 << 20),
+        )
+
+
+class ResourceBudget(object):
+    """主机资源预算，记录执行中批次占用的资源，线程安全"""
+
+    def __init__(self, cpu, memory_mb, usage_refresh_interval=600, usage_days=7):
+        """
+        初始化
+        :param cpu: 可分配的 cpu 核数
+        :param memory_mb: 可分配的内存（MB）
+        :param usage_refresh_interval: 实测内存峰值刷新周期（秒）
+        :param usage_days: 实测内存峰值统计范围（天）
+        """
+
+        self.cpu = cpu
+        self.memory_mb = memory_mb
+        self.usage_refresh_interval = usage_refresh_interval
+        self.usage_days = usage_days
+        self.rss_map = dict()
+        self.usage_ts = 0
+        self.lock = threading.Lock()
+        self.used_cpu = 0
+        self.used_memory_mb = 0
+        self.running_map = collections.Counter()
+        # 批次 id -> (task_name, cpu, memory_mb)
+        self.reserved_map = dict()
+
+    def refresh(self, session):
+        """
+        按需刷新各任务最近 usage_days 天的实测内存峰值
+        :param session: 数据库 session，由调用方管理事务
+        """
+
+        if time.time() - self.usage_ts < self.usage_refresh_interval:
+            return
+        t = TaskBatch.TaskBatch
+        since = datetime.datetime.now() - datetime.timedelta(days=self.usage_days)
+        rows = session.query(t.task_name, func.max(t.max_rss_mb)).filter(
+            (t.exec_status == 3) & (t.plan_time >= since)
+        ).group_by(t.task_name).all()
+        self.rss_map = {task_name: max_rss_mb for task_name, max_rss_mb in rows if max_rss_mb}
+        self.usage_ts = time.time()
+
+    def demand(self, task_name):
+        """批次资源需求，返回 (cpu, memory_mb, max_concurrency)"""
+
+        task = task_info_cache.get(task_name)
+        return task.cpu_weight, max(task.memory_mb, self.rss_map.get(task_name, 0)), task.max_concurrency
+
+    def admit(self, batch_id, task_name):
+        """
+        预算充足时为批次占用资源并返回 True，否则返回 False
+        没有执行中批次时总是准入，避免需求超过主机预算的批次永远无法执行
+        """
+
+        cpu, memory_mb, max_concurrency = self.demand(task_name)
+        with self.lock:
+            if max_concurrency and self.running_map[task_name] >= max_concurrency:
+                return False
+            if self.reserved_map and (
+                    self.used_cpu + cpu > self.cpu or self.used_memory_mb + memory_mb > self.memory_mb):
+                return False
+            self.used_cpu += cpu
+            self.used_memory_mb += memory_mb
+            self.running_map[task_name] += 1
+            self.reserved_map[batch_id] = (task_name, cpu, memory_mb)
+            return True
+
+    def release(self, batch_id):
+        """批次结束后按准入时的占用释放资源"""
+
+        with self.lock:
+            reserved = self.reserved_map.pop(batch_id, None)
+            if reserved is None:
+                return
+            task_name, cpu, memory_mb = reserved
+            self.used_cpu -= cpu
+            self.used_memory_mb -= memory_mb
+            self.running_map[task_name] -= 1
+            if not self.running_map[task_name]:
+                del self.running_map[task_name]
+
+    def usage(self):
+        """当前占用，用于日志"""
+
+        with self.lock:
+            return f'cpu {self.used_cpu:g}/{self.cpu:g}，内存 {self.used_memory_mb}/{self.memory_mb}MB'
@@ -0,0 +1,99 @@
+import random
+import datetime
+import requests.exceptions
+import redis.exceptions
+import sqlalchemy.exc
+
+# 重试策略
+RETRY = "retry"  # 按任务配置指数退避后重试
+FAST = "fast"  # 瞬时故障，从 FAST_BASE 秒开始退避，尽快重试
+FAIL = "fail"  # 数据错误，重试无意义，直接失败
+
+FAST_BASE = 1
+
+# 异常类型 -> 重试策略，按异常类型的 MRO 匹配，未匹配的异常使用 RETRY
+# ValueError 等通用异常不在默认项中，数据错误需要直接失败的脚本在 retry_policy 中声明，如 {ValueError: FAIL}
+DEFAULT_POLICY_MAP = {
+    sqlalchemy.exc.OperationalError: FAST,
+    sqlalchemy.exc.DisconnectionError: FAST,
+    redis.exceptions.ConnectionError: FAST,
+    redis.exceptions.TimeoutError: FAST,
+    requests.exceptions.ConnectionError: FAST,
+    requests.exceptions.Timeout: FAST,
+    ConnectionError: FAST,
+    TimeoutError: FAST,
+    sqlalchemy.exc.IntegrityError: FAIL,
+    sqlalchemy.exc.DataError: FAIL,
+}
+
+
+class RetryPolicy(object):
+    """批次失败重试策略，计算是否重试及下次计划执行时间"""
+
+    def __init__(self, base=5, multiplier=2, cap=600, jitter=0.1, policy_map=None):
+        """
+        初始化
+        :param base: 首次重试延迟（秒）
+        :param multiplier: 退避倍数，第 n 次重试延迟 = base * multiplier ** (n - 1)
+        :param cap: 延迟上限（秒）
+        :param jitter: 随机抖动比例，延迟在 [delay * (1 - jitter), delay * (1 + jitter)] 内随机
+        :param policy_map: 异常类型 -> 重试策略，覆盖 DEFAULT_POLICY_MAP 中的同类项
+        """
+
+        self.base = base
+        self.multiplier = multiplier
+        self.cap = cap
+        self.jitter = jitter
+        self.policy_map = dict(DEFAULT_POLICY_MAP)
+        self.policy_map.update(policy_map or dict())
+
+    def classify(self, error):
+        """按异常类型 MRO 查找重试策略"""
+
+        for cls in type(error).__mro__:
+            if cls in self.policy_map:
+                return self.policy_map[cls]
+        return RETRY
+
+    def get_delay(self, retry, policy=RETRY):
+        """
+        计算第 retry 次重试的延迟
+        :param retry: 将要开始的重试次数，从 1 开始
+        :param policy: RETRY / FAST
+        :return: 延迟秒数，float 类型
+        """
+
+        base = FAST_BASE if policy == FAST else self.base
+        delay = min(self.cap, base * self.multiplier ** (retry - 1))
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(delay, 0)
+
+    def get_plan_time(self, error, retry, now=None):
+        """
+        计算重试计划执行时间
+        :param error: 本次执行的异常
+        :param retry: 将要开始的重试次数，从 1 开始
+        :param now: 当前时间，datetime 对象
+        :return: 计划执行时间，datetime 对象；不可重试时返回 None
+        """
+
+        policy = self.classify(error)
+        if policy == FAIL:
+            return None
+        now = now or datetime.datetime.now()
+        return now + datetime.timedelta(seconds=self.get_delay(retry, policy))
+
+
+def clamp_loop_plan_time(plan_time, plan_expire_time, now=None):
+    """
+    循环批次的重试计划时间不晚于当前时间与 plan_expire_time 的中点，保证过期判定前至少有一次认领机会
+    :param plan_time: 按退避计算的计划执行时间
+    :param plan_expire_time: 批次的启动过期时间，为 None 时不限制
+    :param now: 当前时间，datetime 对象
+    """
+
+    if plan_expire_time is None:
+        return plan_time
+    now = now or datetime.datetime.now()
+    return max(min(plan_time, now + (plan_expire_time - now) / 2), now)
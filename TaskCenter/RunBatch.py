@@ -1,18 +1,39 @@
 import os
-import sys
 import json
 import math
 import time
+import pickle
+import shutil
+import asyncio
+import socket
 import datetime
-import importlib
+import collections
 import threading
 import multiprocessing
+from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 
 from Config import BaseConfig
 from Utils import BaseUtils
-from Table import TaskBatch, TaskInfo
+from Table import TaskBatch
 from . import LocalUtils
+from .Dependence import DependResolver
+from .ScriptRegistry import registry
+from .RetryPolicy import RetryPolicy, clamp_loop_plan_time
+from .TaskInfoCache import task_info_cache
+from .TagStatusIndex import tag_status_index
+from . import StatusWriter
+from .StatusWriter import StatusRecord, after_status_commit
+from .TaskScript import AsyncBaseTaskScript
+from .Priority import task_graph
+from .Resource import ResourceSampler
+from .Lease import (
+    lease_keeper, get_lease_expire_time, get_requeue_status, get_claim_token, get_claim_filter, LeaseExpired,
+    LEASE_LOST_EXITCODE,
+)
+from .Metrics import BatchStats, get_status_label
+from .Profiler import BatchProfiler, get_profile_flags
+from . import Leader
 import common_logger
 
 
@@ -20,33 +41,64 @@ import common_logger
 common_logger.init_logger(BaseConfig.path_log, 'common_logger', is_need_console=True)
 
 
+# 下发给执行进程的批次描述，由认领查询的列直接构造，以元组形式序列化，避免 pickle TaskManager 及 dict
+TaskDescriptor = collections.namedtuple("TaskDescriptor", (
+    "id", "task_name", "task_tag_name", "task_batch_name", "batch_num", "start_time", "end_time", "exec_time",
+    "retry", "plan_expire_time", "claim_host", "task_type", "script", "script_args", "retry_max_times", "run_expire",
+    "retry_base", "retry_multiplier", "retry_cap", "retry_jitter", "profile",
+))
+# TaskDescriptor 中取自 task_info 的字段
+TASK_INFO_FIELDS = TaskDescriptor._fields[TaskDescriptor._fields.index("task_type"):]
+
+
+def get_task_info_fields(task_info):
+    """按 TASK_INFO_FIELDS 顺序取出 TaskInfo 的字段值"""
+
+    return tuple(getattr(task_info, field) for field in TASK_INFO_FIELDS)
+
+
 class Batch(threading.Thread):
     """任务类，对应 task_exec 表中一项待执行任务"""
 
-    def __init__(self, **kwargs):
-        """初始化，kwargs 为待执行任务的信息"""
+    def __init__(self, descriptor):
+        """初始化，descriptor 为待执行批次的 TaskDescriptor"""
 
         # 任务初始化信息
-        self.retry = kwargs.get("retry")
-        self.record_id = kwargs.get("id")
-        self.script = kwargs.get("script")
-        self.task_type = kwargs.get("task_type")
-        self.task_name = kwargs.get("task_name")
-        self.task_tag_name = kwargs.get("task_tag_name")
-        self.run_expire = kwargs.get("run_expire")
-        self.script_args = kwargs.get("script_args")
-        self.start_expire = kwargs.get("start_expire")
-        self.task_batch_name = kwargs.get("task_batch_name")
-        self.retry_max_times = kwargs.get("retry_max_times")
-        self.thread_name = self.batch_num = f"{kwargs.get('batch_num')}"
-        self.end_time = datetime.datetime.strptime(kwargs.get("end_time"), "%Y-%m-%d %H:%M:%S")
-        self.start_time = datetime.datetime.strptime(kwargs.get("start_time"), "%Y-%m-%d %H:%M:%S")
+        self.retry = descriptor.retry
+        self.record_id = descriptor.id
+        self.script = descriptor.script
+        self.task_type = descriptor.task_type
+        self.task_name = descriptor.task_name
+        self.task_tag_name = descriptor.task_tag_name
+        self.run_expire = descriptor.run_expire
+        self.script_args = descriptor.script_args
+        self.task_batch_name = descriptor.task_batch_name
+        self.retry_max_times = descriptor.retry_max_times
+        self.profile = get_profile_flags(descriptor.task_name, descriptor.profile)
+        self.retry_policy = RetryPolicy(
+            descriptor.retry_base, descriptor.retry_multiplier, descriptor.retry_cap, descriptor.retry_jitter
+        )
+        self.thread_name = self.batch_num = f"{descriptor.batch_num}"
+        # 认领凭证，执行结果仅在批次仍由本次认领持有时写入
+        self.exec_time = descriptor.exec_time
+        self.claim_host = descriptor.claim_host
+        self.plan_expire_time = descriptor.plan_expire_time
+        # 失败重试时恢复的待执行状态，回溯批次不会被常驻调度进程认领
+        self.requeue_status = get_requeue_status(descriptor.claim_host, descriptor.task_type)
+        # 执行进程实际开始执行的时间，由 execute_task_once 设置
+        self.run_start_time = None
+        self.end_time = descriptor.end_time
+        self.start_time = descriptor.start_time
         self.interval = LocalUtils.Interval(int(self.start_time.timestamp()), int(self.end_time.timestamp()))
 
-        # 任务执行状态
+        # 任务执行状态，失败后需要重试时 retry_plan_time 为重新入队的计划执行时间
         self.success = False
+        self.retry_plan_time = None
+        # 分片已在其他进程执行时为各失败分片的异常列表，为 None 时在本线程内串行执行未完成的分片
+        self.shard_errors = None
 
         # 任务执行函数
+        self.script_obj = None
         self.run_task = None
         self.run_success_callback = None
         self.run_failure_callback = None
@@ -57,7 +109,7 @@ class Batch(threading.Thread):
     def run(self):
         """
         任务执行入口函数，任务执行成功设置 self.success 属性
-        为了动态配置重试次数并且获取异常堆栈，未使用 retrying 模块
+        执行失败时不在进程内等待重试，按重试策略计算 self.retry_plan_time，由调度进程重新入队，立即释放进程
         """
 
         self.get_task_script()
@@ -66,35 +118,103 @@ class Batch(threading.Thread):
         task_batch_name = self.task_batch_name
         task_tag_name = self.task_tag_name
         common_logger.info(f'{task_batch_name}:开始执行')
-        while True:
-            try:
-                if self.retry:
-                    common_logger.info(f'{task_batch_name}:第{self.retry}次重试')
+        try:
+            if self.retry:
+                common_logger.info(f'{task_batch_name}:第{self.retry}次重试')
+            if self.script_obj.shard_count or self.script_obj.shard_seconds:
+                if self.shard_errors is None:
+                    shard_list = self.get_pending_shards(self.script_obj)
+                    self.shard_errors = [error for error in (self.run_shard(*shard) for shard in shard_list) if error]
+                if self.shard_errors:
+                    raise self.shard_errors[0]
+                self.merge_shards()
+            else:
                 self.run_task(interval=interval, script_args=script_args, task_tag_name=task_tag_name)
-                self.run_success_callback(interval=interval, task_batch_name=task_batch_name)
-                self.success = True
-                common_logger.info(f'{task_batch_name}:执行成功')
-                break
+            self.run_success_callback(interval=interval, task_batch_name=task_batch_name)
+            self.success = True
+            common_logger.info(f'{task_batch_name}:执行成功')
+            return
+        except Exception as e:
+            error = e
+            try:
+                self.run_failure_callback(
+                    interval=interval, task_batch_name=task_batch_name, error=e
+                )
+                common_logger.error(f'{task_batch_name}执行失败:{e}')
             except Exception as e:
-                try:
-                    self.run_failure_callback(
-                        interval=interval, task_batch_name=task_batch_name, error=e
-                    )
-                    common_logger.error(f'{task_batch_name}执行失败:{e}')
-                except Exception as e:
-                    common_logger.error(e)
-
-
-            # 将要开始的重试次数，首次执行不计算在内
-            self.retry += 1
-            if self.retry > self.retry_max_times:
-                # 非循环任务失败，发送DC
-                if self.task_type == 0:
-                    #
-                    BaseUtils.err_to_dc(task_batch_name)
-                break
-            self.update_record(retry=self.retry)
-            time.sleep(5)
+                common_logger.error(e)
+        self.plan_retry(error)
+
+    def get_shard_path(self, index=None):
+        """分片结果目录，指定 index 时为该分片的结果文件"""
+
+        path = f"{BaseConfig.path_tmp}/shard/{self.task_batch_name}"
+        return path if index is None else f"{path}/{index}.pkl"
+
+    def get_shards(self, script_cls):
+        """按脚本的分片配置切分批次时间区间，返回 [(index, Interval)]"""
+
+        if script_cls.shard_count:
+            return list(enumerate(self.interval.split(n=script_cls.shard_count)))
+        return list(enumerate(self.interval.split(step_seconds=script_cls.shard_seconds)))
+
+    def get_pending_shards(self, script_cls):
+        """尚未执行成功（不存在结果文件）的分片"""
+
+        return [shard for shard in self.get_shards(script_cls) if not os.path.exists(self.get_shard_path(shard[0]))]
+
+    def run_shard(self, index, interval):
+        """执行单个分片并保存结果，返回异常，执行成功时返回 None"""
+
+        common_logger.info(f'{self.task_batch_name}:开始执行分片{index} {interval}')
+        try:
+            result = self.run_task(
+                interval=interval, script_args=self.script_args, task_tag_name=self.task_tag_name, shard_index=index)
+        except Exception as e:
+            common_logger.error(f'{self.task_batch_name}:分片{index}执行失败:{e}')
+            return e
+        # 先写临时文件再重命名，进程中断时不会留下不完整的结果文件
+        path = self.get_shard_path(index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as fp:
+            pickle.dump(result, fp)
+        os.replace(f"{path}.tmp", path)
+        return None
+
+    def merge_shards(self):
+        """读取全部分片结果调用脚本的 merge_shards，成功后删除结果目录"""
+
+        results = list()
+        for index, _ in self.get_shards(self.script_obj):
+            with open(self.get_shard_path(index), "rb") as fp:
+                results.append(pickle.load(fp))
+        self.script_obj.merge_shards(interval=self.interval, task_batch_name=self.task_batch_name, results=results)
+        shutil.rmtree(self.get_shard_path(), ignore_errors=True)
+
+    def remove_shards(self, kwargs):
+        """批次最终失败（不再重试）时删除已保存的分片结果，结果目录位于执行主机本地"""
+
+        if kwargs["exec_status"] in (-1, -2):
+            shutil.rmtree(self.get_shard_path(), ignore_errors=True)
+
+    def plan_retry(self, error):
+        """执行失败后按重试策略计算 self.retry_plan_time，不再重试时为 None"""
+
+        # 将要开始的重试次数，首次执行不计算在内
+        retry = self.retry + 1
+        if retry <= self.retry_max_times:
+            self.retry_plan_time = self.retry_policy.get_plan_time(error, retry)
+        if self.retry_plan_time is not None and self.task_type == 1:
+            # 循环批次在 plan_expire_time 前仍未启动会被置为失败，退避时间不超过过期时间
+            self.retry_plan_time = clamp_loop_plan_time(self.retry_plan_time, self.plan_expire_time)
+        if self.retry_plan_time is None:
+            # 非循环任务失败，发送DC
+            if self.task_type == 0:
+                #
+                BaseUtils.err_to_dc(self.task_batch_name)
+            return
+        self.retry = retry
+        common_logger.info(f'{self.task_batch_name}:计划于{self.retry_plan_time:%Y-%m-%d %H:%M:%S}第{retry}次重试')
 
     def get_task_script(self):
         """
@@ -102,151 +222,257 @@ class Batch(threading.Thread):
         必须需要提供 run_task、run_success_callback、run_failure_callback 三个函数
         函数接收可变关键字参数 **kwargs，传入参数由 self.run 中定义，至少包含描述任务执行时间区间 interval
         函数存放于 self.task_name 属性同名脚本，脚本存储于 /path/to/project/TaskCenter/TaskScript 目录下
+        脚本模块和 Script 实例由进程级 ScriptRegistry 缓存，同一任务的批次复用同一实例
+        开启性能采集时 run_task 由 BatchProfiler 包装
         """
 
-        sys.path.append(os.path.abspath(f"{ BaseConfig.path_project}/TaskCenter/TaskScript"))
-        script_module = importlib.import_module(self.script)
-        script_obj = script_module.Script()
-        self.run_task = script_obj.run_task
-        self.run_success_callback = script_obj.run_success_callback
-        self.run_failure_callback = script_obj.run_failure_callback
+        script_obj = self.script_obj = registry.get_script(self.script)
+        self.retry_policy.policy_map.update(script_obj.retry_policy)
+        if isinstance(script_obj, AsyncBaseTaskScript):
+            # 未分配到异步执行进程的异步脚本，在批次线程内以独立事件循环执行
+            self.run_task = lambda **kwargs: asyncio.run(script_obj.run_task(**kwargs))
+            self.run_success_callback = lambda **kwargs: asyncio.run(script_obj.run_success_callback(**kwargs))
+            self.run_failure_callback = lambda **kwargs: asyncio.run(script_obj.run_failure_callback(**kwargs))
+        else:
+            self.run_task = script_obj.run_task
+            self.run_success_callback = script_obj.run_success_callback
+            self.run_failure_callback = script_obj.run_failure_callback
+        if self.profile:
+            self.run_task = BatchProfiler(self.task_batch_name, self.profile).wrap(self.run_task)
 
     def update_record(self, **kwargs):
-        """更新任务信息"""
+        """
+        更新任务信息，执行进程设置了状态队列时交给调度进程批量提交
+        仅在批次仍处于执行中且认领凭证一致时更新，租约已被回收时不覆盖新的执行
+        :return: 是否已写入或已交给调度进程
+        """
 
+        if StatusWriter.status_queue is not None:
+            StatusWriter.status_queue.put(self.get_status_record(kwargs))
+            return True
         session_w = BaseUtils.init_mysql_session("w")
         t = TaskBatch.TaskBatch
         try:
-            session_w.query(t).filter_by(id=self.record_id).update(kwargs)
+            count = session_w.query(t).filter(get_claim_filter(self.record_id, self.claim_host, self.exec_time)).update(
+                kwargs, synchronize_session=False)
             session_w.commit()
         except SQLAlchemyError as e:
             session_w.rollback()
-            common_logger.error(f'{json.dumps(kwargs)}数据提交失败:{e}')
+            common_logger.error(f'{json.dumps(kwargs, default=str)}数据提交失败:{e}')
             raise e
+        if not count:
+            common_logger.error(f'{self.task_batch_name}:租约已被回收，丢弃执行结果:{json.dumps(kwargs, default=str)}')
+            return False
+        after_status_commit([self.get_status_record(kwargs)])
+        return True
+
+    def get_status_record(self, kwargs):
+        """构造 StatusRecord"""
+
+        return StatusRecord(
+            self.record_id, self.task_tag_name, self.task_batch_name, int(self.batch_num), kwargs,
+            self.claim_host, self.exec_time,
+        )
 
 
 class TaskManager(object):
     """任务管理器"""
 
-    def __init__(self, task_num):
+    def __init__(self, task_num, skip_locked=None, budget=None, task_filter=None, sweep=True):
         """
         初始化
-        :param task_num: 同时执行的任务数量
+        :param task_num: 同时执行的任务数量，即本次最多认领的批次数量
+        :param skip_locked: 是否使用 FOR UPDATE SKIP LOCKED 认领，默认读取 BaseConfig.claim_skip_locked
+        :param budget: 可选，ResourceBudget 对象，按主机资源预算装入就绪批次
+        :param task_filter: 可选，参数为 TaskInfo 的函数，仅认领返回 True 的任务的批次
+        :param sweep: 是否在认领时将过期的循环批次置为失败，开启选主时由 leader 通过 sweep_expired 执行
         """
         # 初始化logging,注意日志目录要存在
 
         self.task_num = task_num
-        self.task_kwargs_list = list()
-        self.exec_time = datetime.datetime.now()
+        self.skip_locked = BaseConfig.claim_skip_locked if skip_locked is None else skip_locked
+        self.budget = budget
+        self.task_filter = task_filter
+        self.sweep = sweep
+        self.claim_host = f"{socket.gethostname()}:{os.getpid()}"
+        self.task_list = list()
+        # 反向依赖索引，依赖 tag -> 等待该 tag 的批次名称集合，仅包含本次扫描到的候选批次
+        self.waiting_map = dict()
+        self.exec_time = datetime.datetime.now().replace(microsecond=0)
+        # 本次认领的统计：查询耗时、候选批次数、依赖 tag 数、依赖查询次数、索引命中数，以及各认领批次的排队延迟
+        self.claim_stats = None
 
     def get_ready_task(self):
-        """获取待执行任务"""
+        """获取待执行任务，返回 TaskDescriptor 列表"""
 
         # 初始化
         session_w = BaseUtils.init_mysql_session("w")
-        now = self.exec_time.strftime("%Y-%m-%d %H:%M:%S")
+        now = self.exec_time
 
         # 记录参数，但不直接初始化 Task 对象，避免多进程传参时，因为继承 Thread 类，Task 无法被 pickle 模块序列化的问题
-        task_kwargs_list = self.task_kwargs_list
+        task_list = self.task_list
+        ready_batch_list = list()
+        query_start = time.perf_counter()
         try:
-            # 区分预发、生产的batch
-            batch_infos = session_w.query(TaskInfo.TaskInfo.task_name).filter(
-                TaskInfo.TaskInfo.online == BaseConfig.ENV_TYPE).all()
-            run_batch_list = [batch_info[0] for batch_info in batch_infos]
-            common_logger.info(f'待执行任务数：{len(run_batch_list)}')
-            # 加锁查询
+            # 区分预发、生产的batch，任务配置读取进程内缓存
+            task_info_cache.refresh(session_w)
+            task_info_map = {
+                task.task_name: get_task_info_fields(task) for task in task_info_cache.online()
+                if self.task_filter is None or self.task_filter(task)
+            }
+            common_logger.info(f'待执行任务数：{len(task_info_map)}')
+            # 加锁查询，仅查询下发和依赖判定需要的列
             t = TaskBatch.TaskBatch
-            records = session_w.query(t).filter(
-                t.exec_status.in_((0, 1)) & (t.plan_time <= now) & (t.task_name.in_(run_batch_list))).order_by(
-                t.plan_time) \
-                .with_for_update().all()
-            ready_batch_list = list()
-            for record in records:
-                if len(ready_batch_list) == self.task_num:
+            query = session_w.query(
+                t.id, t.task_name, t.task_tag_name, t.task_batch_name, t.batch_num, t.start_time, t.end_time,
+                t.retry, t.exec_status, t.plan_time, t.plan_expire_time, t.dependence,
+            ).filter(
+                t.exec_status.in_((0, 1)) & (t.plan_time <= now) & (t.task_name.in_(list(task_info_map)))).order_by(
+                t.plan_time, t.id)
+            resolver = DependResolver(session_w, index=tag_status_index if BaseConfig.tag_index else None)
+            records, dependency_tags, expired_ids = list(), set(), list()
+            ready_batch_list, waiting_map = list(), self.waiting_map
+            # 开启优先级调度或资源预算时多扫描就绪批次，供排序和装入时选择
+            target = self.task_num
+            if BaseConfig.priority_scheduling or self.budget:
+                target *= BaseConfig.claim_scan_factor
+            for page in self.scan(query):
+                records.extend(page)
+                candidate_list = list()
+                for record in page:
+                    # 循环任务失败判定，发送DC报警
+                    if record.exec_status == 1 and record.plan_expire_time < now:
+                        if not self.sweep:
+                            continue
+                        expired_ids.append(record.id)
+                        # todo：替换告警函数
+                        BaseUtils.err_to_dc(record.task_batch_name)
+                        continue
+                    candidate_list.append((record, DependResolver.parse(record.dependence)))
+                # 一次性加载本页全部依赖 tag 的最新状态，在内存中判定
+                page_tags = {tag for _, tags in candidate_list for tag in tags}
+                resolver.load(page_tags)
+                dependency_tags |= page_tags
+                for record, tags in candidate_list:
+                    pending_tags = resolver.pending_tags(tags)
+                    if pending_tags:
+                        for tag in pending_tags:
+                            waiting_map.setdefault(tag, set()).add(record.task_batch_name)
+                    else:
+                        ready_batch_list.append(record)
+                if len(ready_batch_list) >= target:
                     break
-                # 循环任务失败判定，发送DC报警
-                if record.exec_status == 1 and record.plan_expire_time < now:
-                    record.exec_status = -1
-                    # todo：替换告警函数
-                    BaseUtils.err_to_dc(record.task_batch_name)
-                    continue
-                dependence = json.loads(record.dependence)
-                for tag in dependence:
-                    b = session_w.query(t).filter_by(task_tag_name=tag).order_by(t.task_batch_name.desc()).first()
-                    if b is None or b.exec_status not in (3, 4):
+            if expired_ids:
+                session_w.query(t).filter(t.id.in_(expired_ids)).update(
+                    dict(exec_status=-1), synchronize_session=False)
+            # 就绪批次多于空闲进程或需要按预算装入时，优先认领关键路径上的批次，否则按 plan_time 顺序
+            if BaseConfig.priority_scheduling and (len(ready_batch_list) > self.task_num or self.budget):
+                task_graph.refresh(session_w)
+                ready_batch_list = task_graph.sort(ready_batch_list)
+            if self.budget:
+                # 依次装入，超出剩余预算的批次跳过，剩余容量由后续需求更小的批次填充
+                self.budget.refresh(session_w)
+                admitted_list = list()
+                for record in ready_batch_list:
+                    if len(admitted_list) == self.task_num:
                         break
-                else:
-                    ready_batch_list.append(record)
+                    if self.budget.admit(record.id, record.task_name):
+                        admitted_list.append(record)
+                ready_batch_list = admitted_list
+            else:
+                ready_batch_list = ready_batch_list[:self.task_num]
             common_logger.info(f'符合执行条件任务数：{len(ready_batch_list)}')
-            # 初始化 Task 对象，进入待执行状态，返回 Task 对象列表
-            t = TaskInfo.TaskInfo
+            # 批量置为执行中，按认领结果构造下发描述
+            if ready_batch_list:
+                session_w.query(t).filter(t.id.in_([record.id for record in ready_batch_list])).update(
+                    dict(exec_status=2, exec_time=now, claim_host=self.claim_host,
+                         lease_expire_time=get_lease_expire_time(now)), synchronize_session=False)
             for record in ready_batch_list:
-                task_info = session_w.query(t).filter_by(task_name=record.task_name).one()
-                record.exec_status, record.exec_time = 2, now
-                task_kwargs = record.to_dict()
-                task_kwargs.update(
-                    retry_max_times=task_info.retry_max_times,
-                    run_expire=task_info.run_expire,
-                    task_type=task_info.task_type,
-                    script=task_info.script,
-                    script_args=task_info.script_args
-                )
-                task_kwargs_list.append(task_kwargs)
+                task_list.append(TaskDescriptor(
+                    *record[:7], now, record.retry, record.plan_expire_time, self.claim_host,
+                    *task_info_map[record.task_name]))
             session_w.commit()
+            self.claim_stats = dict(
+                query_time=time.perf_counter() - query_start,
+                candidates=len(records),
+                dependency_tags=len(dependency_tags),
+                dependency_queries=resolver.query_count,
+                index_hits=resolver.index_hit,
+                queue_delays=[(now - record.plan_time).total_seconds() for record in ready_batch_list],
+            )
         except SQLAlchemyError as e:
             session_w.rollback()
+            if self.budget:
+                for record in ready_batch_list:
+                    self.budget.release(record.id)
             common_logger.error(f'获取任务时, 修改任务状态失败:{e}')
             raise e
 
-        return task_kwargs_list
+        return task_list
 
-    def execute_task_once(self, **kwargs):
+    def scan(self, query):
         """
-        执行任务，多进程目标函数
-        :param kwargs: Task 对象初始化参数
+        加锁扫描到期的待执行批次，按页返回记录列表
+        未开启 skip_locked 时一次锁定全部到期批次；开启时按 (plan_time, id) 分页，每页 task_num * claim_scan_factor 条，
+        最多 claim_scan_max_pages 页，由调用方在就绪批次足够时停止，依赖未满足的批次不会占满扫描窗口
+        :param query: 按 (plan_time, id) 排序的批次查询
         """
 
-        # 任务执行
-        task = Batch(**kwargs)
-        task.start()
-        task.join(task.run_expire * 60)
-
-        # 更新执行状态
-        exit_time = datetime.datetime.now()
-        duration = math.ceil((exit_time.timestamp() - self.exec_time.timestamp()) / 60)
-
-        # # 执行成功
-        if task.success:
-            kwargs = dict(
-                exec_status=3,
-                duration=duration,
-                exit_time=exit_time.strftime("%Y-%m-%d %H:%M:%S"),
-            )
-        # # 执行失败，且需要循环执行的任务，初始化相关状态
-        elif task.task_type == 1:
-            kwargs = dict(
-                retry=0,
-                duration=0,
-                exec_status=1,
-                exec_time="0000-00-00 00:00:00",
-                exit_time=exit_time.strftime("%Y-%m-%d %H:%M:%S"),
-            )
-        # # 线程未结束，认为超时，随主线程结束退出，因为先判断超时再退出线程，存在标识任务超时但正常执行完毕的微小可能
-        # # 超时执行失败
-        elif task.is_alive():
-            kwargs = dict(
-                exec_status=-2,
-                duration=duration,
-                exit_time=exit_time.strftime("%Y-%m-%d %H:%M:%S"),
-            )
-        # # 出现异常执行失败
-        else:
-            kwargs = dict(
-                exec_status=-1,
-                duration=duration,
-                exit_time=exit_time.strftime("%Y-%m-%d %H:%M:%S"),
-            )
-        task.update_record(**kwargs)
+        if not self.skip_locked:
+            yield query.with_for_update().all()
+            return
+        t = TaskBatch.TaskBatch
+        page_size = max(self.task_num * BaseConfig.claim_scan_factor, 1)
+        last = None
+        for _ in range(BaseConfig.claim_scan_max_pages):
+            page_query = query
+            if last is not None:
+                page_query = query.filter(
+                    (t.plan_time > last.plan_time) | ((t.plan_time == last.plan_time) & (t.id > last.id)))
+            page = page_query.limit(page_size).with_for_update(skip_locked=True).all()
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+    def sweep_expired(self, fencing_token):
+        """
+        将过期的循环批次置为失败并发送报警，选主模式下由 leader 执行，以 fencing token 校验身份后提交
+        :param fencing_token: 当选时获得的 fencing token
+        :return: 置为失败的批次数量
+        """
+
+        session_w = BaseUtils.init_mysql_session("w")
+        t = TaskBatch.TaskBatch
+        try:
+            records = session_w.query(t.id, t.task_batch_name).filter(
+                (t.exec_status == 1) & (t.plan_expire_time < self.exec_time)).with_for_update(skip_locked=True).all()
+            if records:
+                session_w.query(t).filter(t.id.in_([record.id for record in records])).update(
+                    dict(exec_status=-1), synchronize_session=False)
+                Leader.fence(session_w, fencing_token)
+            session_w.commit()
+        except (SQLAlchemyError, Leader.LeaderLost) as e:
+            session_w.rollback()
+            common_logger.error(f'过期批次判定失败:{e}')
+            return 0
+        for record in records:
+            # todo：替换告警函数
+            BaseUtils.err_to_dc(record.task_batch_name)
+        return len(records)
+
+    def get_next_plan_time(self):
+        """获取下一个未到期待执行批次的计划执行时间，无待执行批次时返回 None"""
+
+        session_w = BaseUtils.init_mysql_session("w")
+        now = self.exec_time
+        t = TaskBatch.TaskBatch
+        online_task = [task.task_name for task in task_info_cache.online()]
+        plan_time = session_w.query(func.min(t.plan_time)).filter(
+            t.exec_status.in_((0, 1)) & (t.plan_time > now) & (t.task_name.in_(online_task))).scalar()
+        session_w.commit()
+        return plan_time
 
     def execute_task(self):
         """执行任务，多进程入口函数"""
@@ -254,12 +480,13 @@ class TaskManager(object):
         # 关闭父进程创建的数据库连接，保证数据库连接使用进程安全
         session_r = BaseUtils.init_mysql_session("r")
         session_w = BaseUtils.init_mysql_session("w")
+        registry.preload(descriptor.script for descriptor in self.task_list)
         session_r.bind.dispose()
         session_w.bind.dispose()
 
         pool = multiprocessing.Pool(self.task_num)
-        for task_kwargs in self.task_kwargs_list:
-            pool.apply_async(self.execute_task_once, kwds=task_kwargs, error_callback=self.handle_error)
+        for descriptor in self.task_list:
+            pool.apply_async(execute_task_once, (descriptor,), error_callback=self.handle_error)
         pool.close()
         pool.join()
 
@@ -270,6 +497,204 @@ class TaskManager(object):
         pass
 
 
+def execute_task_once(descriptor, supervised=False, shard_errors=None):
+    """
+    执行任务，多进程目标函数
+    定义为模块级函数，进程池仅序列化函数引用和 descriptor，不序列化 TaskManager
+    :param descriptor: TaskDescriptor 对象
+    :param supervised: 是否在 Supervisor 监管的子进程中执行，超时由 Supervisor 终止进程并记录状态
+    :param shard_errors: 分片执行的批次，各分片已由 execute_shard 执行完毕时传入失败分片的异常列表，仅执行合并
+    :return: BatchStats，由调度进程汇总为指标，租约已被回收时返回 None
+    """
+
+    # 任务执行，采样批次的 cpu 时间和内存峰值，执行期间续期租约
+    # 租约被回收后 Supervisor 子进程直接退出，进程池中不等待执行线程结束，也不写入执行结果
+    task = Batch(descriptor)
+    task.shard_errors = shard_errors
+    task.run_start_time = datetime.datetime.now()
+    run_start = time.monotonic()
+    sampler = ResourceSampler()
+    sampler.start()
+    on_lost = (lambda: os._exit(LEASE_LOST_EXITCODE)) if supervised else None
+    lost = lease_keeper.add(descriptor.id, get_claim_token(descriptor), on_lost=on_lost)
+    try:
+        if supervised:
+            task.run()
+        else:
+            task.start()
+            join_lost(task, run_start + task.run_expire * 60, lost)
+    finally:
+        lease_keeper.discard(descriptor.id)
+    usage = sampler.stop()
+    run_time = time.monotonic() - run_start
+    if lost.is_set():
+        common_logger.error(f'{task.task_batch_name}:租约已被回收，停止等待执行结果')
+        return None
+
+    # 更新执行状态
+    exit_time = datetime.datetime.now().replace(microsecond=0)
+    kwargs = get_exit_record(task, exit_time, task.is_alive())
+    kwargs.update(usage)
+    if task.update_record(**kwargs):
+        task.remove_shards(kwargs)
+    return get_batch_stats(task, kwargs, run_time)
+
+
+def join_lost(thread, deadline, lost):
+    """等待执行线程结束，超过 deadline（time.monotonic）或租约被回收时返回"""
+
+    while thread.is_alive() and not lost.is_set():
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        thread.join(min(timeout, 1))
+
+
+def get_batch_stats(task, kwargs, run_time):
+    """
+    批次执行统计
+    :param task: 执行结束（或超时）的 Batch 对象
+    :param kwargs: get_exit_record 生成的更新字段
+    :param run_time: 执行耗时（秒）
+    """
+
+    start_delay = None
+    if task.run_start_time is not None:
+        start_delay = max((task.run_start_time - task.exec_time).total_seconds(), 0)
+    return BatchStats(
+        start_delay=start_delay,
+        run_time=run_time,
+        retry=task.retry - (task.retry_plan_time is not None),
+        status=get_status_label(kwargs["exec_status"], task.retry_plan_time is not None),
+    )
+
+
+def execute_shard(descriptor, index, ts_start, ts_end):
+    """
+    执行单个分片，多进程目标函数，不更新批次状态
+    分片在工作进程的守护线程中执行，超时后线程无法被终止，会继续占用所在工作进程的 cpu 直到脚本返回，
+    工作进程同时接收新的任务；脚本可能长时间阻塞时应开启 BaseConfig.supervised_execution，由 Supervisor 终止子进程
+    :return: 分片执行失败时返回异常，成功时返回 None
+    """
+
+    task = Batch(descriptor)
+    task.get_task_script()
+    result = list()
+    thread = threading.Thread(
+        target=lambda: result.append(task.run_shard(index, LocalUtils.Interval(ts_start, ts_end))), daemon=True)
+    # 分片执行期间续期所属批次的租约
+    lost = lease_keeper.add(descriptor.id, get_claim_token(descriptor))
+    try:
+        thread.start()
+        join_lost(thread, time.monotonic() + task.run_expire * 60, lost)
+    finally:
+        lease_keeper.discard(descriptor.id)
+    if lost.is_set():
+        return LeaseExpired(f'{task.task_batch_name}:分片{index}执行期间租约已被回收')
+    if thread.is_alive():
+        common_logger.error(f'{task.task_batch_name}:分片{index}执行超时，执行线程仍在运行')
+        return TimeoutError(f'{task.task_batch_name}:分片{index}执行超时')
+    error = result[0] if result else RuntimeError(f'{task.task_batch_name}:分片{index}执行异常')
+    # 异常需要返回调度进程，无法序列化时以异常描述代替
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = RuntimeError(repr(error))
+    return error
+
+
+def get_exit_record(task, exit_time, timed_out):
+    """
+    按批次执行结果生成 task_batch 更新字段
+    :param task: 执行结束（或超时）的 Batch 对象
+    :param exit_time: 结束时间
+    :param timed_out: 是否执行超时
+    """
+
+    # 按批次实际开始执行的时间计算耗时，不包含认领后的等待
+    duration = math.ceil((exit_time - (task.run_start_time or task.exec_time)).total_seconds() / 60)
+
+    # # 执行成功
+    if task.success:
+        kwargs = dict(
+            exec_status=3,
+            duration=duration,
+            exit_time=exit_time,
+        )
+    # # 执行失败，按退避时间重新入队，循环任务保持 exec_status=1 以继续判定启动超时，回溯批次恢复为回溯待执行状态
+    elif task.retry_plan_time is not None:
+        kwargs = dict(
+            retry=task.retry,
+            exec_status=task.requeue_status,
+            plan_time=task.retry_plan_time.replace(microsecond=0),
+            exec_time=None,
+            exit_time=exit_time,
+        )
+    # # 执行失败，且需要循环执行的任务，初始化相关状态
+    elif task.task_type == 1:
+        kwargs = dict(
+            retry=0,
+            duration=0,
+            exec_status=1,
+            exec_time=None,
+            exit_time=exit_time,
+        )
+    # # 线程未结束，认为超时，随主线程结束退出，因为先判断超时再退出线程，存在标识任务超时但正常执行完毕的微小可能
+    # # 超时执行失败
+    elif timed_out:
+        kwargs = dict(
+            exec_status=-2,
+            duration=duration,
+            exit_time=exit_time,
+        )
+    # # 出现异常执行失败
+    else:
+        kwargs = dict(
+            exec_status=-1,
+            duration=duration,
+            exit_time=exit_time,
+        )
+    return kwargs
+
+
+def execute_task_supervised(descriptor):
+    """Supervisor 子进程执行函数"""
+
+    execute_task_once(descriptor, supervised=True)
+
+
+def mark_failed(descriptor, exit_time, exitcode=None):
+    """
+    记录被 Supervisor 终止的超时批次，或未写入执行结果即异常退出的批次，仅在批次仍处于执行中且认领凭证一致时更新，
+    避免覆盖已写入的执行结果或租约回收后重新认领的执行
+    更新字段由 get_exit_record 生成，与线程执行方式一致：循环任务恢复为待执行，异常退出的批次按重试策略重新入队
+    :param exitcode: 子进程退出码，为 None 时表示超时被终止
+    :return: BatchStats，批次已有执行结果或租约已被回收时返回 None
+    """
+
+    task = Batch(descriptor)
+    timed_out = exitcode is None
+    if not timed_out:
+        task.plan_retry(ChildProcessError(f'{descriptor.task_batch_name}:执行进程异常退出，退出码{exitcode}'))
+    exit_time = exit_time.replace(microsecond=0)
+    kwargs = get_exit_record(task, exit_time, timed_out)
+    session_w = BaseUtils.init_mysql_session("w")
+    t = TaskBatch.TaskBatch
+    try:
+        count = session_w.query(t).filter(get_claim_filter(descriptor.id, *get_claim_token(descriptor))).update(
+            kwargs, synchronize_session=False)
+        session_w.commit()
+    except SQLAlchemyError as e:
+        session_w.rollback()
+        common_logger.error(f'{json.dumps(kwargs, default=str)}数据提交失败:{e}')
+        raise e
+    if not count:
+        return None
+    after_status_commit([task.get_status_record(kwargs)])
+    task.remove_shards(kwargs)
+    return get_batch_stats(task, kwargs, (exit_time - descriptor.exec_time).total_seconds())
+
+
 @common_logger.logging_wrapper
 def run():
     """功能入口函数"""
@@ -280,7 +705,7 @@ def run():
     batch_count = task_manager.get_ready_task()
     common_logger.info(f'共{len(batch_count)}个批次任务待执行.')
     task_manager.execute_task()
-    # task_manager.execute_task_once(**task_manager.task_kwargs_list[0])
+    # execute_task_once(task_manager.task_list[0])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,583 @@
+"""
+常驻调度进程，替代 cron 定时拉起 RunBatch.run
+Usage：
+python -m TaskCenter.Scheduler
+kill -USR1 <pid>    # 立即唤醒调度循环
+kill -TERM <pid>    # 停止认领，等待执行中批次结束后退出
+BaseConfig.supervised_execution 开启时每个批次在可强制终止的独立子进程中执行，否则使用常驻进程池
+BaseConfig.async_worker_num 大于 0 时 AsyncBaseTaskScript 任务的批次由异步执行进程并发执行，不占用进程池
+进程池模式下开启分片执行的脚本（shard_count / shard_seconds）按子区间分别提交进程池，全部结束后提交合并
+BaseConfig.event_trigger 开启时订阅 tag 执行成功事件，被等待的 tag 完成后立即唤醒调度循环，不等待下一次轮询
+认领和批次执行指标按 BaseConfig.metrics_file 定期写入文件，或由 BaseConfig.metrics_http_port 端口的 /metrics 提供
+BaseConfig.leader_election 开启时多个调度进程选出一个 leader，仅由 leader 生成批次和判定过期的循环批次，各节点均认领执行和回收租约
+"""
+import time
+import signal
+import traceback
+import datetime
+import functools
+import psutil
+import threading
+import multiprocessing
+import redis.exceptions
+from sqlalchemy.exc import SQLAlchemyError
+
+from Utils import BaseUtils
+from Config import BaseConfig
+from .Dependence import TAG_DONE_CHANNEL
+from .RunBatch import TaskManager, Batch, execute_task_once, execute_task_supervised, execute_shard, mark_failed
+from .Metrics import BatchStats, scheduler_metrics
+from .Supervisor import Supervisor, init_worker
+from .ScriptRegistry import registry
+from .TagStatusIndex import tag_status_index
+from .Resource import ResourceBudget
+from .AsyncExecutor import serve_async
+from .Lease import reap_expired
+from .Leader import LeaderElector, LeaderLost
+from .TaskScript import CreateBatch
+from . import LocalUtils
+from .StatusWriter import BackgroundStatusWriter, init_status_queue
+import common_logger
+
+# CreateBatch 脚本的模块名，开启选主时不认领该任务的批次
+CREATE_BATCH_SCRIPT = CreateBatch.__name__.rpartition(".")[2]
+
+
+def init_pool_worker(status_queue):
+    """进程池工作进程初始化，status_queue 不为 None 时批次状态交给调度进程批量提交"""
+
+    init_worker()
+    init_status_queue(status_queue)
+
+
+class Scheduler(object):
+    """常驻调度器，保持进程池常驻，批次执行结束后立即补充空闲进程"""
+
+    def __init__(self, task_num, poll_interval=60, supervised=None, admission=None):
+        """
+        初始化
+        :param task_num: 同时执行的批次数量，即进程池大小
+        :param poll_interval: 无唤醒事件时的最长休眠时间（秒）
+        :param supervised: 是否使用 Supervisor 监管执行，默认读取 BaseConfig.supervised_execution
+        :param admission: 是否按主机资源预算准入，默认读取 BaseConfig.resource_admission
+        """
+
+        self.task_num = task_num
+        self.poll_interval = poll_interval
+        self.supervised = BaseConfig.supervised_execution if supervised is None else supervised
+        self.running = 0
+        self.stopped = False
+        self.pool = None
+        self.supervisor = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        # 反向依赖索引，依赖 tag -> 等待该 tag 的批次名称集合，每次认领后整体替换
+        self.waiting_map = dict()
+        self.reconcile_ts = 0
+        # 调度循环连续异常次数，按 2 的指数退避，上限为 poll_interval
+        self.error_count = 0
+        # 异步执行进程的任务队列、已下发批次数，以及批次 id -> (进程序号, TaskDescriptor)
+        self.async_queues = list()
+        self.async_load = list()
+        self.async_batch_map = dict()
+        self.async_done_queue = None
+        # 分片执行中的批次，批次 id -> [执行中分片数, 失败分片异常列表, 待提交分片列表, TaskDescriptor]
+        self.shard_map = dict()
+        # 已提交进程池或 Supervisor 的批次，批次 id -> TaskDescriptor
+        self.submitted_map = dict()
+        # 租约已被回收、执行进程尚未退出的批次，TaskDescriptor -> [占用进程数, 强制释放时间（time.monotonic）]
+        # 执行进程在下次续期时发现租约丢失后退出，进程崩溃未回调时在强制释放时间后释放
+        self.lost_map = dict()
+        # 选主，未开启时每个调度进程在认领时判定过期批次，批次生成由 CreateBatch 任务执行
+        self.elector = None
+        self.generate_ts = 0
+        self.budget = None
+        if BaseConfig.resource_admission if admission is None else admission:
+            self.budget = ResourceBudget(
+                BaseConfig.host_cpu_budget or multiprocessing.cpu_count(),
+                BaseConfig.host_memory_budget_mb or psutil.virtual_memory().total * 0.8 // (1 << 20),
+            )
+
+    def free_slots(self):
+        """空闲进程数量"""
+
+        with self.lock:
+            return self.task_num - self.running
+
+    def on_task_exit(self, result, descriptor, mode="pool"):
+        """
+        批次执行结束回调（进程池结果线程或监管线程中执行），记录执行指标，释放进程和资源预算并唤醒调度循环
+        批次已因租约过期被回收时释放 lost_map 中占用的进程
+        :param result: execute_task_once 返回的 BatchStats，执行异常时为异常对象，监管子进程未返回时为退出码
+        """
+
+        if isinstance(result, BaseException):
+            common_logger.error(f'批次执行异常:{result}')
+        elif isinstance(result, BatchStats):
+            scheduler_metrics.observe_batch("supervised" if self.supervisor else mode, descriptor, result)
+        with self.lock:
+            if self.submitted_map.get(descriptor.id) != descriptor:
+                lost = True
+            else:
+                lost = False
+                del self.submitted_map[descriptor.id]
+                self.running -= 1
+        if lost:
+            self.release_lost(descriptor)
+            return
+        if self.budget:
+            self.budget.release(descriptor.id)
+        self.wakeup.set()
+
+    def reap_leases(self):
+        """
+        回收租约过期的执行中批次
+        本进程下发到进程池或 Supervisor 的批次转入 lost_map，执行进程退出后才释放进程名额和资源预算，避免回收后超额提交；
+        异步批次由执行进程取消，立即释放名额
+        """
+
+        session_w = BaseUtils.init_mysql_session("w")
+        try:
+            reaped_ids = reap_expired(session_w)
+            session_w.commit()
+        except SQLAlchemyError as e:
+            session_w.rollback()
+            raise e
+        deadline = time.monotonic() + BaseConfig.lease_seconds
+        for batch_id in reaped_ids:
+            with self.lock:
+                descriptor = self.submitted_map.pop(batch_id, None)
+                slots = int(descriptor is not None)
+                shard_state = self.shard_map.pop(batch_id, None)
+                if shard_state:
+                    # 待提交分片不再提交，已提交分片结束后释放进程
+                    descriptor = shard_state[3]
+                    slots += shard_state[0]
+                    shard_state[2].clear()
+                if slots:
+                    self.lost_map[descriptor] = [slots, deadline]
+                async_value = self.async_batch_map.pop(batch_id, None)
+                if async_value is not None:
+                    self.async_load[async_value[0]] -= 1
+            if async_value is not None and not slots and self.budget:
+                self.budget.release(batch_id)
+        if reaped_ids:
+            common_logger.error(f'回收{len(reaped_ids)}个租约过期批次')
+
+    def release_lost(self, descriptor):
+        """租约已被回收的批次的执行进程退出，释放一个进程名额，全部退出后释放资源预算"""
+
+        with self.lock:
+            value = self.lost_map.get(descriptor)
+            if value is None:
+                return
+            self.running -= 1
+            value[0] -= 1
+            if value[0]:
+                return
+            del self.lost_map[descriptor]
+        if self.budget:
+            self.budget.release(descriptor.id)
+        self.wakeup.set()
+
+    def expire_lost(self):
+        """强制释放超过等待时间仍未退出的已回收批次，执行进程已崩溃或结果回调丢失"""
+
+        now = time.monotonic()
+        with self.lock:
+            expired = [(descriptor, value[0]) for descriptor, value in self.lost_map.items() if value[1] <= now]
+            for descriptor, slots in expired:
+                del self.lost_map[descriptor]
+                self.running -= slots
+        for descriptor, slots in expired:
+            common_logger.error(f'{descriptor.task_batch_name}:租约回收后执行进程未退出，强制释放{slots}个进程名额')
+            if self.budget:
+                self.budget.release(descriptor.id)
+
+    def on_elected(self, token):
+        """当选 leader 回调（竞选线程中执行），立即唤醒调度循环执行 leader 职责"""
+
+        self.generate_ts = 0
+        self.wakeup.set()
+
+    def lead(self):
+        """
+        leader 职责：判定过期的循环批次，每隔 leader_generate_interval 秒生成批次，不是 leader 时跳过
+        两项职责的异常分别记录日志，不影响另一项职责和本轮认领
+        """
+
+        token = self.elector.is_leader() if self.elector else None
+        if token is None:
+            return
+        try:
+            swept = TaskManager(0).sweep_expired(token)
+            if swept:
+                common_logger.error(f'{swept}个循环批次过期，置为失败')
+        except Exception as e:
+            common_logger.error(f'循环批次过期判定异常:{e}\n{traceback.format_exc()}')
+        if time.time() - self.generate_ts < BaseConfig.leader_generate_interval:
+            return
+        now = int(time.time())
+        try:
+            CreateBatch.Script().run_task(interval=LocalUtils.Interval(now, now), fencing_token=token)
+            self.generate_ts = time.time()
+        except LeaderLost as e:
+            common_logger.error(f'批次生成已回滚:{e}')
+        except Exception as e:
+            common_logger.error(f'批次生成异常:{e}\n{traceback.format_exc()}')
+
+    def reconcile_index(self):
+        """
+        按 MySQL 重建 tag 状态索引，启动时及每隔 tag_index_reconcile_interval 秒执行
+        读取主库，从库延迟时回填的旧状态会被依赖判定信任，导致下游批次阻塞到下一次重建
+        """
+
+        if not BaseConfig.tag_index or time.time() - self.reconcile_ts < BaseConfig.tag_index_reconcile_interval:
+            return
+        session_w = BaseUtils.init_mysql_session("w")
+        try:
+            tag_status_index.reconcile(session_w)
+            self.reconcile_ts = time.time()
+        except redis.exceptions.RedisError as e:
+            common_logger.error(f'tag 状态索引重建失败:{e}')
+        finally:
+            session_w.commit()
+
+    def async_free_slots(self):
+        """异步执行进程剩余名额"""
+
+        with self.lock:
+            return len(self.async_queues) * BaseConfig.async_batch_limit - sum(self.async_load)
+
+    @staticmethod
+    def is_async_task(task):
+        """任务脚本是否为异步脚本，分片执行的异步脚本由进程池执行"""
+
+        return registry.is_async(task.script) and not registry.is_sharded(task.script)
+
+    def submit_shards(self, descriptor, slots):
+        """
+        将分片批次的未完成分片提交进程池，每个分片占用一个进程
+        :param slots: 本次可使用的进程数，其余分片在已提交分片结束或有空闲进程时依次提交
+        """
+
+        shard_list = Batch(descriptor).get_pending_shards(registry.get_module(descriptor.script).Script)
+        state = [0, list(), shard_list, descriptor]
+        with self.lock:
+            self.shard_map[descriptor.id] = state
+        if not shard_list:
+            # 上次执行时全部分片已成功，仅需合并
+            self.finish_shards(descriptor)
+            return
+        common_logger.info(f'{descriptor.task_batch_name}:共{len(shard_list)}个分片，提交{min(slots, len(shard_list))}个')
+        for _ in range(slots):
+            if not self.submit_shard(state):
+                break
+
+    def submit_shard(self, state):
+        """提交一个待提交分片，占用一个进程，无待提交分片时返回 False"""
+
+        with self.lock:
+            if not state[2]:
+                return False
+            index, interval = state[2].pop(0)
+            state[0] += 1
+            self.running += 1
+        descriptor = state[3]
+        on_exit = functools.partial(self.on_shard_exit, descriptor)
+        self.pool.apply_async(
+            execute_shard, (descriptor, index, interval.ts_start, interval.ts_end),
+            callback=on_exit, error_callback=on_exit,
+        )
+        return True
+
+    def fill_shards(self):
+        """将空闲进程优先分配给已开始执行的分片批次"""
+
+        with self.lock:
+            state_list = [state for state in self.shard_map.values() if state[2]]
+        for state in state_list:
+            while self.free_slots() > 0 and self.submit_shard(state):
+                pass
+
+    def on_shard_exit(self, descriptor, error):
+        """分片执行结束回调（进程池结果线程中执行），释放的进程用于提交下一个分片，全部分片结束后提交合并"""
+
+        with self.lock:
+            state = self.shard_map.get(descriptor.id)
+            lost = state is None or state[3] != descriptor
+            if not lost:
+                state[0] -= 1
+                self.running -= 1
+                if error is not None:
+                    state[1].append(error)
+        if lost:
+            # 批次已因租约过期被回收
+            self.release_lost(descriptor)
+            return
+        self.submit_shard(state)
+        with self.lock:
+            finished = not state[0] and not state[2] and self.shard_map.get(descriptor.id) is state
+        if finished:
+            self.finish_shards(descriptor)
+        self.wakeup.set()
+
+    def finish_shards(self, descriptor):
+        """提交合并，由 execute_task_once 根据失败分片判定批次成功或按重试策略重新入队"""
+
+        with self.lock:
+            shard_errors = self.shard_map.pop(descriptor.id)[1]
+            self.running += 1
+            self.submitted_map[descriptor.id] = descriptor
+        on_exit = functools.partial(self.on_task_exit, descriptor=descriptor, mode="shard")
+        self.pool.apply_async(
+            execute_task_once, (descriptor,), dict(shard_errors=shard_errors), callback=on_exit, error_callback=on_exit
+        )
+
+    def submit_async(self, task_list):
+        """将批次下发到负载最小的异步执行进程"""
+
+        for descriptor in task_list:
+            with self.lock:
+                index = min(range(len(self.async_queues)), key=self.async_load.__getitem__)
+                self.async_load[index] += 1
+                self.async_batch_map[descriptor.id] = (index, descriptor)
+            self.async_queues[index].put(descriptor)
+
+    def on_async_exit(self):
+        """接收异步执行进程的批次结束通知（守护线程中执行），记录执行指标，释放名额并唤醒调度循环"""
+
+        for batch_id, stats in iter(self.async_done_queue.get, None):
+            with self.lock:
+                value = self.async_batch_map.pop(batch_id, None)
+                if value is not None:
+                    self.async_load[value[0]] -= 1
+            if value is not None and stats is not None:
+                scheduler_metrics.observe_batch("async", value[1], stats)
+            self.wakeup.set()
+
+    @staticmethod
+    def is_create_batch(task):
+        """任务脚本是否为 CreateBatch，脚本可以以模块名或完整包路径配置"""
+
+        return task.script.rpartition(".")[2] == CREATE_BATCH_SCRIPT
+
+    def claim(self, mode, task_num, waiting_map, task_filter=None, **kwargs):
+        """
+        认领批次，记录认领指标并合并反向依赖索引，返回 (TaskManager, TaskDescriptor 列表)
+        开启选主时批次由 leader 生成，不认领 CreateBatch 任务的批次，避免与 leader 重复生成
+        """
+
+        if self.elector:
+            task_filter = (lambda task, task_filter=task_filter: not self.is_create_batch(task) and (
+                task_filter is None or task_filter(task)))
+        task_manager = TaskManager(task_num, sweep=self.elector is None, task_filter=task_filter, **kwargs)
+        task_list = task_manager.get_ready_task()
+        scheduler_metrics.observe_claim(mode, task_manager)
+        for tag, batch_names in task_manager.waiting_map.items():
+            waiting_map.setdefault(tag, set()).update(batch_names)
+        return task_manager, task_list
+
+    def dispatch(self):
+        """按空闲进程数认领批次并提交进程池，返回下次调度前的休眠时间（秒）"""
+
+        if self.supervisor:
+            for descriptor, exit_time, exitcode in self.supervisor.pop_failed():
+                stats = mark_failed(descriptor, exit_time, exitcode)
+                if stats:
+                    scheduler_metrics.observe_batch("supervised", descriptor, stats)
+
+        self.expire_lost()
+        if self.pool:
+            self.fill_shards()
+
+        # full：每个有空闲名额的执行方式都已认领满
+        task_manager, full, waiting_map = None, True, dict()
+        async_free_slots = self.async_free_slots()
+        if async_free_slots > 0:
+            task_manager, task_list = self.claim(
+                "async", async_free_slots, waiting_map, task_filter=self.is_async_task)
+            self.submit_async(task_list)
+            full = len(task_list) == async_free_slots
+            if task_list:
+                common_logger.info(f'认领{len(task_list)}个异步批次，执行中{sum(self.async_load)}个.')
+
+        free_slots = self.free_slots()
+        if free_slots > 0:
+            task_filter = (lambda task: not self.is_async_task(task)) if self.async_queues else None
+            task_manager, task_list = self.claim(
+                "supervised" if self.supervisor else "pool", free_slots, waiting_map,
+                budget=self.budget, task_filter=task_filter)
+            if self.supervisor:
+                # 子进程由调度进程 fork，启动前关闭已持有的数据库连接
+                BaseUtils.dispose_mysql_session()
+            shard_list = list()
+            for descriptor in task_list:
+                if self.pool and registry.is_sharded(descriptor.script):
+                    shard_list.append(descriptor)
+                    continue
+                with self.lock:
+                    self.running += 1
+                    self.submitted_map[descriptor.id] = descriptor
+                if self.supervisor:
+                    self.supervisor.submit(descriptor)
+                else:
+                    on_exit = functools.partial(self.on_task_exit, descriptor=descriptor)
+                    self.pool.apply_async(execute_task_once, (descriptor,), callback=on_exit, error_callback=on_exit)
+            # 分片批次认领时各占一个名额，剩余空闲进程分配给先认领的分片批次
+            for i, descriptor in enumerate(shard_list):
+                self.submit_shards(descriptor, max(self.free_slots() - (len(shard_list) - i - 1), 1))
+            full = full and len(task_list) == free_slots
+            if task_list:
+                common_logger.info(f'认领{len(task_list)}个批次，执行中{self.task_num - self.free_slots()}个.')
+                if self.budget:
+                    common_logger.info(f'资源占用：{self.budget.usage()}')
+        self.waiting_map = waiting_map
+
+        # 进程已满时等待批次结束唤醒，否则休眠到下一个批次的计划执行时间
+        if task_manager is None or full:
+            return self.poll_interval
+        next_plan_time = task_manager.get_next_plan_time()
+        if next_plan_time is None:
+            return self.poll_interval
+        wait = (next_plan_time - datetime.datetime.now()).total_seconds()
+        return min(max(wait, 1), self.poll_interval)
+
+    def on_tag_done(self, task_tag_name):
+        """tag 执行成功事件，存在等待该 tag 的批次时唤醒调度循环"""
+
+        if task_tag_name in self.waiting_map:
+            common_logger.info(f'{task_tag_name}:执行成功，唤醒{len(self.waiting_map[task_tag_name])}个下游批次')
+            self.wakeup.set()
+
+    def listen_tag_done(self):
+        """订阅 tag 执行成功事件（守护线程中执行），连接断开后重新订阅"""
+
+        while not self.stopped:
+            pubsub = BaseUtils.init_redis_client().pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(TAG_DONE_CHANNEL)
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.on_tag_done(message["data"].decode())
+            except redis.exceptions.RedisError as e:
+                common_logger.error(f'tag 执行成功事件订阅异常:{e}')
+                time.sleep(5)
+            finally:
+                pubsub.close()
+
+    def stop(self, *_):
+        """停止认领新批次"""
+
+        self.stopped = True
+        self.wakeup.set()
+
+    def start_async_workers(self):
+        """启动 BaseConfig.async_worker_num 个异步执行进程，返回进程列表"""
+
+        processes = list()
+        if BaseConfig.async_worker_num <= 0:
+            return processes
+        self.async_done_queue = multiprocessing.Queue()
+        for _ in range(BaseConfig.async_worker_num):
+            task_queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=serve_async, args=(task_queue, self.async_done_queue), daemon=True)
+            process.start()
+            processes.append(process)
+            self.async_queues.append(task_queue)
+            self.async_load.append(0)
+        threading.Thread(target=self.on_async_exit, daemon=True).start()
+        return processes
+
+    def serve_forever(self):
+        """调度主循环"""
+
+        registry.preload()
+        BaseUtils.dispose_mysql_session()
+        status_writer = None
+        if self.supervised:
+            self.supervisor = Supervisor(
+                execute_task_supervised, on_exit=self.on_task_exit, grace=BaseConfig.supervised_kill_grace
+            )
+        else:
+            if BaseConfig.status_write_behind:
+                # 队列在进程池创建前建立，由工作进程继承
+                status_writer = BackgroundStatusWriter(multiprocessing.Queue())
+                self.pool = multiprocessing.Pool(
+                    self.task_num, initializer=init_pool_worker, initargs=(status_writer.queue,))
+                status_writer.start()
+            else:
+                self.pool = multiprocessing.Pool(self.task_num, initializer=init_worker)
+        async_processes = self.start_async_workers()
+        if BaseConfig.event_trigger:
+            # 监听线程在进程池创建后启动，工作进程不会继承订阅连接
+            threading.Thread(target=self.listen_tag_done, daemon=True).start()
+        if BaseConfig.metrics_http_port:
+            scheduler_metrics.serve(BaseConfig.metrics_http_port)
+        if BaseConfig.leader_election:
+            # 竞选线程在进程池创建后启动，工作进程不会继承锁和续期线程
+            self.elector = LeaderElector(on_elected=self.on_elected)
+            self.elector.start()
+        signal.signal(signal.SIGUSR1, lambda *_: self.wakeup.set())
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        common_logger.info(f'调度进程启动，共开启{self.task_num}个进程.')
+
+        while not self.stopped:
+            self.wakeup.clear()
+            try:
+                self.reconcile_index()
+                self.reap_leases()
+                self.lead()
+                wait = self.dispatch()
+                if self.elector and self.elector.is_leader() is not None:
+                    wait = min(wait, BaseConfig.leader_generate_interval)
+                self.error_count = 0
+            except Exception as e:
+                # 数据库、redis 或其他异常均不退出调度进程，退避后重试
+                self.error_count += 1
+                wait = min(2 ** self.error_count, self.poll_interval)
+                common_logger.error(f'调度循环异常，{wait}秒后重试:{e}\n{traceback.format_exc()}')
+            finally:
+                BaseUtils.dispose_mysql_session()
+            scheduler_metrics.export()
+            self.wakeup.wait(wait)
+
+        if self.elector:
+            # 先释放 leader，其他节点在本进程等待执行中批次期间接管
+            self.elector.stop()
+        common_logger.info(f'调度进程退出，等待{self.task_num - self.free_slots()}个执行中批次结束.')
+        if self.supervisor:
+            self.supervisor.join()
+            for descriptor, exit_time, exitcode in self.supervisor.pop_failed():
+                mark_failed(descriptor, exit_time, exitcode)
+        else:
+            # 分片全部结束后才会提交合并，关闭进程池前等待
+            while self.shard_map:
+                time.sleep(1)
+            self.pool.close()
+            self.pool.join()
+            if status_writer:
+                status_writer.close()
+        for task_queue in self.async_queues:
+            task_queue.put(None)
+        for process in async_processes:
+            process.join()
+        if self.async_done_queue:
+            self.async_done_queue.put(None)
+        scheduler_metrics.close()
+
+
+@common_logger.logging_wrapper
+def run():
+    """功能入口函数"""
+
+    task_num = multiprocessing.cpu_count()
+    if BaseConfig.resource_admission:
+        # 并发上限由资源预算决定，进程数留出余量供 IO 密集任务填充空闲 cpu
+        task_num *= BaseConfig.admission_slot_factor
+    Scheduler(task_num).serve_forever()
+
+
+if __name__ == '__main__':
+    run()
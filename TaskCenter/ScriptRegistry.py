@@ -0,0 +1,105 @@
+import os
+import sys
+import importlib
+import threading
+
+from Config import BaseConfig
+from .TaskInfoCache import task_info_cache
+from .TaskScript import AsyncBaseTaskScript
+import common_logger
+
+# 任务脚本目录，脚本可以以模块名（如 Demo）或完整包路径（如 TaskCenter.TaskScript.CreateBatch）配置
+path_script = os.path.abspath(f"{BaseConfig.path_project}/TaskCenter/TaskScript")
+
+
+class ScriptRegistry(object):
+    """
+    任务脚本注册表，进程内缓存脚本模块和 Script 实例
+    同一任务的多个批次复用同一个 Script 实例，脚本文件修改时间变化时重新加载模块并重建实例
+    """
+
+    def __init__(self):
+        """初始化"""
+
+        self.lock = threading.RLock()
+        # script -> (module, mtime)
+        self.module_map = dict()
+        # script -> Script 实例
+        self.script_map = dict()
+
+    @staticmethod
+    def _get_mtime(module):
+        """脚本文件修改时间，无法获取时返回 None"""
+
+        try:
+            return os.stat(module.__file__).st_mtime
+        except (AttributeError, TypeError, OSError):
+            return None
+
+    def get_module(self, script):
+        """获取脚本模块，首次导入或文件变化时加载"""
+
+        with self.lock:
+            if path_script not in sys.path:
+                sys.path.append(path_script)
+            cached = self.module_map.get(script)
+            if cached is None:
+                module = importlib.import_module(script)
+            else:
+                module, mtime = cached
+                if self._get_mtime(module) == mtime:
+                    return module
+                common_logger.info(f'{script}:脚本文件已修改，重新加载')
+                module = importlib.reload(module)
+                self.script_map.pop(script, None)
+            self.module_map[script] = (module, self._get_mtime(module))
+            return module
+
+    def get_script(self, script):
+        """获取 Script 实例"""
+
+        with self.lock:
+            module = self.get_module(script)
+            script_obj = self.script_map.get(script)
+            if script_obj is None:
+                script_obj = self.script_map[script] = module.Script()
+            return script_obj
+
+    def is_async(self, script):
+        """脚本是否为 AsyncBaseTaskScript 子类，无法导入时返回 False"""
+
+        try:
+            return issubclass(self.get_module(script).Script, AsyncBaseTaskScript)
+        except Exception as e:
+            common_logger.error(f'{script}:脚本加载失败:{e}')
+            return False
+
+    def is_sharded(self, script):
+        """脚本是否开启分片执行，无法导入时返回 False"""
+
+        try:
+            script_cls = self.get_module(script).Script
+        except Exception as e:
+            common_logger.error(f'{script}:脚本加载失败:{e}')
+            return False
+        return bool(script_cls.shard_count or script_cls.shard_seconds)
+
+    def preload(self, scripts=None):
+        """
+        导入脚本模块，在创建进程池前调用，子进程以写时复制方式共享已导入的模块
+        仅导入模块，不创建 Script 实例，避免实例持有的连接等资源被子进程继承
+        :param scripts: 脚本名称列表，默认为当前环境全部上线任务的脚本
+        """
+
+        if scripts is None:
+            task_info_cache.refresh()
+            scripts = {task.script for task in task_info_cache.online()}
+        for script in scripts:
+            try:
+                self.get_module(script)
+            except Exception as e:
+                common_logger.error(f'{script}:脚本预加载失败:{e}')
+
+
+# 进程级注册表
+registry = ScriptRegistry()
@@ -0,0 +1,270 @@
+"""
+批次状态批量写入
+StatusRecord 描述一次状态变更，StatusWriter 将多条变更按更新字段分组，在一个事务中以 CASE id WHEN 多行更新
+或 executemany 提交，提交后统一同步 tag 状态索引并发布 tag 执行成功事件
+开启 BaseConfig.status_write_behind 时，进程池中的执行进程将状态变更写入队列，由调度进程的 BackgroundStatusWriter
+每隔 status_flush_interval_ms 毫秒或累计 status_flush_size 条批量提交，调度进程退出前同步提交剩余记录
+同一批次的状态变更由同一执行进程按顺序写入队列，队列和合并均保持到达顺序
+批量提交失败时整体重试，某一批次连续失败 status_flush_max_failures 次后改为逐条提交，单条记录失败不阻塞其他记录，
+未提交的记录在等待重试期间续期所属批次的租约
+变更仅写入仍处于执行中且认领凭证 (claim_host, exec_time) 一致的批次，租约被回收后迟到的执行结果被丢弃
+"""
+import time
+import queue
+import threading
+import collections
+import redis.exceptions
+from sqlalchemy import bindparam, case
+from sqlalchemy.exc import SQLAlchemyError
+
+from Config import BaseConfig
+from Utils import BaseUtils
+from Table import TaskBatch
+from .Dependence import publish_tag_done
+from .TagStatusIndex import tag_status_index
+from .Lease import get_claim_tokens, extend_leases
+import common_logger
+
+# 批次状态变更，kwargs 为 task_batch 更新字段，claim_host / exec_time 为执行该批次的认领凭证
+StatusRecord = collections.namedtuple("StatusRecord", (
+    "id", "task_tag_name", "task_batch_name", "batch_num", "kwargs", "claim_host", "exec_time",
+))
+
+# 执行进程的状态队列，由 init_status_queue 在进程池初始化时设置，未设置时 Batch.update_record 同步写入
+status_queue = None
+
+
+def init_status_queue(queue_):
+    """设置执行进程的状态队列"""
+
+    global status_queue
+    status_queue = queue_
+
+
+def after_status_commit(records):
+    """
+    状态提交后同步 tag 状态索引，并为执行成功的批次发布事件
+    索引写入失败时保留旧状态，等待调度进程按 MySQL 重建
+    """
+
+    records = [record for record in records if "exec_status" in record.kwargs]
+    if BaseConfig.tag_index and records:
+        try:
+            tag_status_index.set_many(
+                (record.task_tag_name, record.batch_num, record.kwargs["exec_status"]) for record in records)
+        except redis.exceptions.RedisError as e:
+            common_logger.error(f'tag 状态索引写入失败:{e}')
+    if BaseConfig.event_trigger:
+        for record in records:
+            if record.kwargs["exec_status"] == 3:
+                publish_tag_done(record.task_tag_name)
+
+
+class StatusWriter(object):
+    """批量写入批次状态"""
+
+    def __init__(self, mode=None):
+        """
+        初始化
+        :param mode: case 为 CASE id WHEN 多行更新（每组字段一条语句），executemany 为逐行参数批量执行，
+            默认读取 BaseConfig.status_writer_mode
+        """
+
+        self.mode = mode or BaseConfig.status_writer_mode
+
+    @staticmethod
+    def coalesce(records):
+        """
+        合并同一批次同一次认领的多次变更，按到达顺序依次覆盖字段，保证同一批次的最终状态与逐条写入一致
+        :return: StatusRecord 列表，按批次首次出现的顺序排列
+        """
+
+        merged = dict()
+        for record in records:
+            key = (record.id, record.claim_host, record.exec_time)
+            previous = merged.get(key)
+            merged[key] = record if previous is None else record._replace(
+                kwargs={**previous.kwargs, **record.kwargs})
+        return list(merged.values())
+
+    def write_many(self, records):
+        """
+        在一个事务中写入多条状态变更，更新字段相同的变更合并为一次 executemany
+        先加锁查询仍由对应认领持有的批次，认领凭证不一致（租约已被回收）的变更不写入
+        :param records: StatusRecord 列表
+        :return: 合并后实际写入的批次数
+        """
+
+        records = self.coalesce(records)
+        if not records:
+            return 0
+
+        table = TaskBatch.TaskBatch.__table__
+        session_w = BaseUtils.init_mysql_session("w")
+        try:
+            token_map = get_claim_tokens(session_w, {record.id for record in records})
+            owned_list = list()
+            for record in records:
+                if token_map.get(record.id) == (record.claim_host, record.exec_time):
+                    owned_list.append(record)
+                else:
+                    common_logger.error(f'{record.task_batch_name}:租约已被回收，丢弃执行结果:{record.kwargs}')
+            records = owned_list
+            group_map = collections.defaultdict(list)
+            for record in records:
+                group_map[tuple(sorted(record.kwargs))].append(record)
+            for keys, group in group_map.items():
+                if self.mode == "case":
+                    stmt = table.update().where(
+                        table.c.id.in_([record.id for record in group]) & (table.c.exec_status == 2)
+                    ).values({
+                        # whens 以位置参数的 (条件, 值) 序列传入，SQLAlchemy 1.4.0 不支持字典形式
+                        key: case(
+                            *[(table.c.id == record.id, record.kwargs[key]) for record in group],
+                            else_=getattr(table.c, key),
+                        )
+                        for key in keys
+                    })
+                    session_w.execute(stmt)
+                else:
+                    stmt = table.update().where(
+                        (table.c.id == bindparam("_id")) & (table.c.exec_status == 2)
+                        & (table.c.claim_host == bindparam("_claim_host"))
+                        & (table.c.exec_time == bindparam("_exec_time"))
+                    ).values({key: bindparam(key) for key in keys})
+                    session_w.execute(stmt, [
+                        dict(record.kwargs, _id=record.id, _claim_host=record.claim_host, _exec_time=record.exec_time)
+                        for record in group
+                    ])
+            session_w.commit()
+        except SQLAlchemyError as e:
+            session_w.rollback()
+            common_logger.error(f'{len(records)}个批次状态批量提交失败:{e}')
+            raise e
+        after_status_commit(records)
+        return len(records)
+
+
+def extend_pending_leases(records):
+    """
+    为等待重试的记录续期所属批次的租约，执行进程已停止续期，避免执行结果提交前批次被回收后重新执行
+    续期失败时仅记录日志，租约过期后由调度进程回收
+    """
+
+    if not records:
+        return
+    session_w = BaseUtils.init_mysql_session("w")
+    try:
+        extend_leases(session_w, {record.id: (record.claim_host, record.exec_time) for record in records})
+        session_w.commit()
+    except SQLAlchemyError as e:
+        session_w.rollback()
+        common_logger.error(f'{len(records)}个待提交批次租约续期失败:{e}')
+
+
+class BackgroundStatusWriter(object):
+    """调度进程中的后台写入线程，从队列读取 StatusRecord 批量提交"""
+
+    def __init__(self, queue_, flush_interval_ms=None, flush_size=None, writer=None, max_failures=None):
+        """
+        初始化
+        :param queue_: multiprocessing.Queue，执行进程写入 StatusRecord，None 表示退出
+        :param flush_interval_ms: 提交周期（毫秒），默认读取 BaseConfig.status_flush_interval_ms
+        :param flush_size: 触发立即提交的缓冲条数，默认读取 BaseConfig.status_flush_size
+        :param writer: StatusWriter 对象
+        :param max_failures: 批次连续提交失败多少次后逐条提交，默认读取 BaseConfig.status_flush_max_failures
+        """
+
+        self.queue = queue_
+        self.flush_interval = (flush_interval_ms or BaseConfig.status_flush_interval_ms) / 1000
+        self.flush_size = flush_size or BaseConfig.status_flush_size
+        self.writer = writer or StatusWriter()
+        self.max_failures = max_failures or BaseConfig.status_flush_max_failures
+        # 批次 id -> 连续提交失败次数
+        self.failure_map = dict()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """启动写入线程"""
+
+        self.thread.start()
+
+    def flush(self, records):
+        """
+        提交缓冲，返回未提交的记录等待下次提交
+        存在连续失败 max_failures 次的批次时逐条提交，逐条提交再失败 max_failures 次的记录放弃并记录日志
+        """
+
+        records = StatusWriter.coalesce(records)
+        try:
+            if any(self.failure_map.get(record.id, 0) >= self.max_failures for record in records):
+                pending = self.flush_each(records)
+            else:
+                try:
+                    self.writer.write_many(records)
+                    pending = list()
+                except Exception as e:
+                    common_logger.error(f'批次状态提交失败，{len(records)}条记录等待重试:{e}')
+                    for record in records:
+                        self.failure_map[record.id] = self.failure_map.get(record.id, 0) + 1
+                    pending = records
+                else:
+                    for record in records:
+                        self.failure_map.pop(record.id, None)
+            extend_pending_leases(pending)
+            return pending
+        finally:
+            # 仅归还写入线程的连接，连接池由调度主线程共用，fork 保护由 InitUtils.guard_fork 处理
+            BaseUtils.init_mysql_session("w").close()
+
+    def flush_each(self, records):
+        """逐条提交，返回未提交的记录"""
+
+        pending = list()
+        for record in records:
+            try:
+                self.writer.write_many([record])
+                self.failure_map.pop(record.id, None)
+            except Exception as e:
+                failures = self.failure_map[record.id] = self.failure_map.get(record.id, 0) + 1
+                if failures >= self.max_failures * 2:
+                    # 批次保持执行中，租约过期后由调度进程回收
+                    self.failure_map.pop(record.id)
+                    common_logger.error(f'{record.task_batch_name}:状态多次提交失败，放弃提交:{record.kwargs}:{e}')
+                else:
+                    pending.append(record)
+        return pending
+
+    def _run(self):
+        """写入循环"""
+
+        buffer, stopped, flush_at = list(), False, time.monotonic() + self.flush_interval
+        while not stopped:
+            try:
+                record = self.queue.get(timeout=max(flush_at - time.monotonic(), 0))
+                if record is None:
+                    stopped = True
+                else:
+                    buffer.append(record)
+                    if len(buffer) < self.flush_size and time.monotonic() < flush_at:
+                        continue
+            except queue.Empty:
+                pass
+            if buffer:
+                buffer = self.flush(buffer)
+            flush_at = time.monotonic() + (1 if buffer else self.flush_interval)
+
+        # 退出前同步提交剩余记录，多次失败后记录日志
+        for _ in range(3):
+            if not buffer:
+                break
+            time.sleep(1)
+            buffer = self.flush(buffer)
+        for record in buffer:
+            common_logger.error(f'{record.task_batch_name}:状态未能提交:{record.kwargs}')
+
+    def close(self):
+        """写入队列中已有记录后退出，阻塞到提交完成"""
+
+        self.queue.put(None)
+        self.thread.join()
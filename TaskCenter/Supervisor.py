@@ -0,0 +1,159 @@
+import os
+import time
+import signal
+import datetime
+import threading
+import multiprocessing
+import multiprocessing.connection
+
+import common_logger
+
+
+def init_worker():
+    """执行子进程初始化，恢复默认信号处理，避免继承调度进程的信号处理函数"""
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_supervised(target, descriptor, conn):
+    """受监管子进程入口，独立进程组，超时时连同脚本创建的子进程一起终止；执行函数的返回值写入 conn"""
+
+    os.setpgid(0, 0)
+    init_worker()
+    conn.send(target(descriptor))
+    conn.close()
+
+
+class _Worker(object):
+    """受监管的批次执行进程"""
+
+    __slots__ = ("process", "conn", "descriptor", "deadline", "kill_at", "killed")
+
+    def __init__(self, process, conn, descriptor, deadline):
+        self.process = process
+        self.conn = conn
+        self.descriptor = descriptor
+        self.deadline = deadline
+        self.kill_at = None
+        self.killed = False
+
+
+class Supervisor(object):
+    """
+    批次执行监管器，每个批次在独立子进程中执行
+    运行超时先发送 SIGTERM，宽限期后仍未退出则发送 SIGKILL，进程回收后释放执行位
+    监管线程不访问数据库，被终止的超时批次及未被终止但以非 0 退出码退出的批次暂存于 failed_list，由调度主循环写入状态
+    每个子进程使用独立的管道返回执行结果，子进程被终止时只会损坏自身的管道
+    """
+
+    def __init__(self, target, on_exit=None, grace=10):
+        """
+        初始化
+        :param target: 子进程执行函数，接收 TaskDescriptor
+        :param on_exit: 子进程回收后的回调，参数为执行函数的返回值（未返回时为进程退出码）和 TaskDescriptor
+        :param grace: SIGTERM 后等待退出的宽限期（秒）
+        """
+
+        self.target = target
+        self.on_exit = on_exit
+        self.grace = grace
+        self.lock = threading.Lock()
+        self.worker_map = dict()
+        self.failed_list = list()
+        self.context = multiprocessing.get_context("fork")
+        self.thread = threading.Thread(target=self._monitor, name="supervisor", daemon=True)
+        self.thread.start()
+
+    def submit(self, descriptor):
+        """启动子进程执行批次，调用前需关闭调度进程持有的数据库连接"""
+
+        reader, writer = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=_run_supervised, args=(self.target, descriptor, writer), name=descriptor.task_batch_name
+        )
+        process.start()
+        writer.close()
+        deadline = time.monotonic() + descriptor.run_expire * 60
+        with self.lock:
+            self.worker_map[process.sentinel] = _Worker(process, reader, descriptor, deadline)
+
+    def running(self):
+        """执行中的批次数量"""
+
+        with self.lock:
+            return len(self.worker_map)
+
+    def pop_failed(self):
+        """取出异常退出的批次，返回 [(TaskDescriptor, 退出时间, 退出码)]，超时被终止的批次退出码为 None"""
+
+        with self.lock:
+            failed_list, self.failed_list = self.failed_list, list()
+        return failed_list
+
+    def join(self):
+        """等待全部子进程结束"""
+
+        while self.running():
+            time.sleep(1)
+
+    def _signal(self, worker, sig):
+        """向批次进程组发送信号"""
+
+        try:
+            os.killpg(worker.process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            try:
+                os.kill(worker.process.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _monitor(self):
+        """监管线程：回收退出的子进程，对超时子进程依次发送 SIGTERM / SIGKILL"""
+
+        while True:
+            with self.lock:
+                workers = list(self.worker_map.values())
+            if not workers:
+                time.sleep(0.5)
+                continue
+
+            now = time.monotonic()
+            next_action = min(w.kill_at if w.killed else w.deadline for w in workers)
+            timeout = min(max(next_action - now, 0), 1)
+            ready = set(multiprocessing.connection.wait([w.process.sentinel for w in workers], timeout))
+
+            now = time.monotonic()
+            for worker in workers:
+                task_batch_name = worker.descriptor.task_batch_name
+                if worker.process.sentinel in ready:
+                    worker.process.join()
+                    exitcode = worker.process.exitcode
+                    result = exitcode
+                    try:
+                        if worker.conn.poll():
+                            result = worker.conn.recv()
+                    except Exception:
+                        # 子进程在写入过程中被终止，结果不完整
+                        pass
+                    finally:
+                        worker.conn.close()
+                    with self.lock:
+                        del self.worker_map[worker.process.sentinel]
+                        # 终止信号发出后仍正常退出，说明批次在终止前已执行完毕并写入状态
+                        if worker.killed and exitcode != 0:
+                            self.failed_list.append((worker.descriptor, datetime.datetime.now(), None))
+                        elif exitcode != 0:
+                            common_logger.error(f'{task_batch_name}:执行进程异常退出，退出码{exitcode}')
+                            self.failed_list.append((worker.descriptor, datetime.datetime.now(), exitcode))
+                    if self.on_exit:
+                        self.on_exit(result, worker.descriptor)
+                elif worker.killed and now >= worker.kill_at:
+                    common_logger.error(f'{task_batch_name}:宽限期内未退出，发送 SIGKILL')
+                    self._signal(worker, signal.SIGKILL)
+                    worker.kill_at = now + self.grace
+                elif not worker.killed and now >= worker.deadline:
+                    common_logger.error(f'{task_batch_name}:执行超时，发送 SIGTERM')
+                    self._signal(worker, signal.SIGTERM)
+                    worker.killed, worker.kill_at = True, now + self.grace
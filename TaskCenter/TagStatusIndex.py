@@ -0,0 +1,137 @@
+"""
+tag 最新批次执行状态的 redis 索引，依赖判定优先读取索引，未命中的 tag 回落到 MySQL 查询并回填
+索引为 hash：field 为 task_tag_name，value 为 "batch_num:exec_status"，MySQL 为唯一数据源
+写入时机：
+1. Batch.update_record 提交后写入，batch_num 小于索引中已有值时忽略（lua 脚本保证原子性）
+2. 依赖判定回落 MySQL 的查询结果仅在 field 不存在时回填，不覆盖执行进程写入的更新状态
+3. 新增更大 batch_num 的批次（回溯、重跑）后删除对应 field
+4. 调度进程启动及每隔 tag_index_reconcile_interval 秒按 MySQL 重建
+人工修改 task_batch 表的状态不会同步到索引，需等待下次重建或重启调度进程
+"""
+import hashlib
+import datetime
+import redis.exceptions
+from sqlalchemy import func
+
+from Config import BaseConfig
+from Utils import BaseUtils
+from Table import TaskBatch
+import common_logger
+
+# ARGV 为 (tag, batch_num, exec_status) 三元组序列
+LUA_SET_SCRIPT = """
+local count = 0
+for i = 1, #ARGV, 3 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current or tonumber(string.match(current, '^(%d+):')) <= tonumber(ARGV[i + 1]) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1] .. ':' .. ARGV[i + 2])
+        count = count + 1
+    end
+end
+return count
+"""
+
+
+class TagStatusIndex(object):
+    """tag -> 最新批次执行状态索引"""
+
+    set_script_sha1 = hashlib.sha1(LUA_SET_SCRIPT.encode()).hexdigest()
+
+    def __init__(self, key="taskcenter:tag_status", chunk_size=500):
+        """
+        初始化
+        :param key: 索引 hash 的键名
+        :param chunk_size: 单条 HMGET / HSET 命令的 field 数量上限
+        """
+
+        self.key = key
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _client():
+        """索引读写位于认领热路径，不记录命令日志"""
+
+        return BaseUtils.init_redis_client(is_log=False)
+
+    def get_many(self, tags):
+        """
+        批量查询 tag 状态，管道中按 chunk_size 拆分 HMGET
+        :param tags: tag 列表
+        :return: 命中的 tag -> exec_status
+        """
+
+        pipe = self._client().pipeline(transaction=False)
+        for i in range(0, len(tags), self.chunk_size):
+            pipe.hmget(self.key, tags[i: i + self.chunk_size])
+        values = [value for chunk in pipe.execute() for value in chunk]
+        return {
+            tag: int(value.split(b":")[1]) for tag, value in zip(tags, values) if value is not None
+        }
+
+    def set_many(self, items):
+        """
+        写入执行状态，batch_num 小于已有值时忽略
+        :param items: (tag, batch_num, exec_status) 可迭代对象
+        :return: 实际写入的 field 数量
+        """
+
+        client, count = self._client(), 0
+        items = list(items)
+        for i in range(0, len(items), self.chunk_size):
+            args = [arg for item in items[i: i + self.chunk_size] for arg in item]
+            try:
+                count += client.evalsha(self.set_script_sha1, 1, self.key, *args)
+            except redis.exceptions.NoScriptError:
+                count += client.eval(LUA_SET_SCRIPT, 1, self.key, *args)
+        return count
+
+    def set(self, tag, batch_num, exec_status):
+        """写入单个 tag 的执行状态"""
+
+        return self.set_many([(tag, batch_num, exec_status)])
+
+    def fill_many(self, items):
+        """
+        回填 MySQL 查询结果，仅写入不存在的 field
+        :param items: (tag, batch_num, exec_status) 可迭代对象
+        """
+
+        pipe = self._client().pipeline(transaction=False)
+        for tag, batch_num, exec_status in items:
+            pipe.hsetnx(self.key, tag, f"{batch_num}:{exec_status}")
+        pipe.execute()
+
+    def delete_many(self, tags):
+        """删除 tag，下次判定时回落 MySQL"""
+
+        client = self._client()
+        for i in range(0, len(tags), self.chunk_size):
+            client.hdel(self.key, *tags[i: i + self.chunk_size])
+
+    def reconcile(self, session, days=None):
+        """
+        按 MySQL 重建索引：先删除索引，再回填时间区间在最近 days 天内的 tag 最新批次状态
+        删除后执行进程写入的状态不会被较早的查询结果覆盖，更早的 tag 在判定时按需回落 MySQL
+        :param session: 数据库 session，应使用主库，从库延迟会回填旧状态
+        :param days: 重建范围（天），默认 BaseConfig.tag_index_reconcile_days
+        """
+
+        days = BaseConfig.tag_index_reconcile_days if days is None else days
+        t = TaskBatch.TaskBatch
+        self._client().delete(self.key)
+        latest = session.query(
+            t.task_tag_name, func.max(t.batch_num).label("batch_num")
+        ).filter(
+            t.start_time >= datetime.datetime.now() - datetime.timedelta(days=days)
+        ).group_by(t.task_tag_name).subquery()
+        rows = session.query(t.task_tag_name, t.batch_num, t.exec_status).join(
+            latest, (t.task_tag_name == latest.c.task_tag_name) & (t.batch_num == latest.c.batch_num)
+        ).all()
+        for i in range(0, len(rows), self.chunk_size * 10):
+            self.fill_many(rows[i: i + self.chunk_size * 10])
+        common_logger.info(f'tag 状态索引重建完成，共{len(rows)}个 tag')
+        return len(rows)
+
+
+# 进程级索引
+tag_status_index = TagStatusIndex()
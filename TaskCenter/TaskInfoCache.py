@@ -0,0 +1,82 @@
+import time
+import threading
+from sqlalchemy import func
+
+from Config import BaseConfig
+from Utils import BaseUtils
+from Table import TaskInfo
+import common_logger
+
+
+class TaskInfoCache(object):
+    """
+    进程内 task_info 缓存，按 task_name 索引
+    每次 refresh 仅执行一次 max(update_time) / count(id) 探测，update_time 变化时只重新加载 update_time 不早于上次最大值的行，
+    行数变化（新增或删除任务）时全量加载。修改 task_info 时必须同步更新 update_time
+    update_time 精度为秒，与上次探测同一秒内的修改无法被探测到，因此每隔 full_reload_interval 秒全量加载一次
+    """
+
+    def __init__(self, full_reload_interval=600):
+        """
+        初始化
+        :param full_reload_interval: 全量加载周期（秒）
+        """
+
+        self.lock = threading.Lock()
+        self.task_map = dict()
+        self.max_update_time = None
+        self.count = None
+        self.full_reload_interval = full_reload_interval
+        self.full_reload_ts = 0
+
+    @staticmethod
+    def _load(session, query):
+        """执行查询，结果从 session 中分离，返回 task_name -> TaskInfo"""
+
+        tasks = query.all()
+        for task in tasks:
+            session.expunge(task)
+        return {task.task_name: task for task in tasks}
+
+    def refresh(self, session=None):
+        """
+        探测 task_info 是否变化并增量刷新
+        :param session: 数据库 session，由调用方管理事务；默认使用读库 session，刷新后结束事务
+        """
+
+        own_session = session is None
+        session = session or BaseUtils.init_mysql_session("r")
+        i = TaskInfo.TaskInfo
+        try:
+            with self.lock:
+                max_update_time, count = session.query(func.max(i.update_time), func.count(i.id)).one()
+                full_reload = time.time() - self.full_reload_ts >= self.full_reload_interval
+                if (max_update_time, count) == (self.max_update_time, self.count) and not full_reload:
+                    return
+                if count != self.count or full_reload:
+                    loaded = self._load(session, session.query(i))
+                    self.task_map = loaded
+                    self.full_reload_ts = time.time()
+                else:
+                    # 上次探测后同一秒内提交的修改，update_time 与上次最大值相同，使用 >= 一并加载
+                    loaded = self._load(session, session.query(i).filter(i.update_time >= self.max_update_time))
+                    self.task_map = {**self.task_map, **loaded}
+                self.max_update_time, self.count = max_update_time, count
+                common_logger.info(f'task_info 缓存刷新，加载{len(loaded)}个任务')
+        finally:
+            if own_session:
+                session.commit()
+
+    def get(self, task_name):
+        """获取任务配置，不存在时返回 None"""
+
+        return self.task_map.get(task_name)
+
+    def online(self):
+        """当前环境上线的任务列表"""
+
+        return [task for task in self.task_map.values() if task.online == BaseConfig.ENV_TYPE]
+
+
+# 进程级缓存
+task_info_cache = TaskInfoCache()
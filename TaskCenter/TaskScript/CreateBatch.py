@@ -1,48 +1,62 @@
 import time
 import datetime
+from sqlalchemy import func
 
 from Utils import BaseUtils
 from TaskCenter import TaskScript
-from Table import TaskInfo, TaskBatch
+from Table import TaskBatch
 from .. import LocalUtils
-from Config.BaseConfig import ENV_TYPE
+from .. import Leader
+from ..TaskInfoCache import task_info_cache
 import common_logger
 
+# 批次生成的时间范围
+HORIZON = datetime.timedelta(hours=3)
+
 
 class Script(TaskScript.BaseTaskScript):
     """任务脚本基类"""
 
-    def __init__(self):
-        """初始化"""
+    @property
+    def session_w(self):
+        """写库 session，实例会被多个批次复用，按调用线程获取 scoped session，不在实例上持有连接"""
 
-        self.session_w = BaseUtils.init_mysql_session("w")
+        return BaseUtils.init_mysql_session("w")
 
     def run_task(self, **kwargs):
-        """执行任务"""
+        """
+        执行任务，为上线任务生成 HORIZON 时间范围内的批次
+        单次分组查询各任务最新批次，批量计算新批次后以 INSERT IGNORE 分块写入，依赖 task_batch_name 唯一键去重，不锁 task_info
+        由调度 leader 调用时传入 fencing_token，提交前校验 leader 身份，已被取代时回滚并抛出 LeaderLost
+        """
 
         session_w = self.session_w
         interval = kwargs.get("interval")
+        fencing_token = kwargs.get("fencing_token")
         current_dt = datetime.datetime.fromtimestamp(interval.ts_end)
+        stop_dt = current_dt + HORIZON
 
-        t = TaskInfo.TaskInfo
         try:
-            task_list = session_w.query(t).filter_by(online=ENV_TYPE).with_for_update().all()
+            task_info_cache.refresh(session_w)
+            task_list = task_info_cache.online()
+            t = TaskBatch.TaskBatch
+            last_start_map = dict(
+                session_w.query(t.task_name, func.max(t.start_time))
+                .filter(t.task_name.in_([task.task_name for task in task_list])).group_by(t.task_name).all()
+            )
+            rows = list()
             for task in task_list:
-                t = TaskBatch.TaskBatch
-                task_name = task.task_name
-                last_batch = session_w.query(t).filter_by(task_name=task_name).order_by(t.task_tag_name.desc()).first()
-                if last_batch:
-                    last_start_dt = datetime.datetime.strptime(last_batch.start_time, "%Y-%m-%d %H:%M:%S")
+                last_start_dt = last_start_map.get(task.task_name)
+                if last_start_dt:
                     next_start_dt = task.get_next_start_dt(last_start_dt)
                 else:
                     next_start_dt = task.get_init_start_dt(current_dt)
-                while True:
-                    if next_start_dt > current_dt + datetime.timedelta(hours=3):
-                        break
-                    task = task.create_new_task(next_start_dt, 1)
-                    session_w.add(task)
-                    next_start_dt = task.get_next_start_dt(next_start_dt)
+                rows.extend(task.iter_batch_rows(next_start_dt, stop_dt))
+            count = t.insert_ignore(session_w, rows)
+            if fencing_token is not None:
+                Leader.fence(session_w, fencing_token)
             session_w.commit()
+            common_logger.info(f'计算批次{len(rows)}个，新增{count}个')
         except Exception as e:
             session_w.rollback()
             raise e
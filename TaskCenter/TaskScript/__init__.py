@@ -1,14 +1,31 @@
-__all__ = ["BaseTaskScript"]
+__all__ = ["BaseTaskScript", "AsyncBaseTaskScript"]
 
 
 class BaseTaskScript(object):
-    """任务脚本基类"""
+    """
+    任务脚本基类
+    同一任务的多个批次复用同一个 Script 实例，实例上不应保存批次相关状态或进程相关的连接
+    """
+
+    # 脚本自定义的异常重试策略，异常类型 -> RetryPolicy.RETRY / FAST / FAIL，覆盖默认策略
+    retry_policy = dict()
+
+    # 分片执行，二选一：shard_count > 0 时将批次时间区间等分，shard_seconds > 0 时按固定长度切分
+    # 开启后 run_task 按子区间分别调用（kwargs 增加 shard_index），全部成功后调用 merge_shards
+    # 常驻调度进程的进程池模式下各分片分发到不同进程并行执行，失败重试时仅重新执行失败的分片
+    shard_count = 0
+    shard_seconds = 0
 
     def run_task(self, **kwargs):
         """执行任务"""
 
         raise NotImplementedError
 
+    def merge_shards(self, **kwargs):
+        """分片合并，kwargs 包含 interval、task_batch_name 及按子区间顺序排列的各分片 run_task 返回值 results"""
+
+        pass
+
     def run_success_callback(self, **kwargs):
         """成功回调"""
 
@@ -23,3 +40,29 @@ class BaseTaskScript(object):
         error = kwargs.get("error")
         interval = kwargs.get("interval")
         task_batch_name = kwargs.get("task_batch_name")
+
+
+class AsyncBaseTaskScript(BaseTaskScript):
+    """
+    异步任务脚本基类，适用于主要耗时在等待 HTTP、redis、MySQL 响应的任务
+    调度进程开启异步执行进程时，同一进程的事件循环上并发执行多个批次，脚本中不应调用阻塞函数
+    分片执行的异步脚本不分配到异步执行进程，merge_shards 仍为普通函数
+    """
+
+    async def run_task(self, **kwargs):
+        """执行任务"""
+
+        raise NotImplementedError
+
+    async def run_success_callback(self, **kwargs):
+        """成功回调"""
+
+        interval = kwargs.get("interval")
+        task_batch_name = kwargs.get("task_batch_name")
+
+    async def run_failure_callback(self, **kwargs):
+        """失败回调"""
+
+        error = kwargs.get("error")
+        interval = kwargs.get("interval")
+        task_batch_name = kwargs.get("task_batch_name")
@@ -0,0 +1,45 @@
+import datetime
+
+from Config import BaseConfig
+from Table import TaskBatch
+from Benchmark import BenchUtils
+
+# 测试批次的认领凭证
+CLAIM_HOST = "test_host:1"
+CLAIM_TIME = datetime.datetime(2024, 1, 1, 0, 0, 0)
+
+
+def reset_schema():
+    """重建测试库的 task_info / task_batch 表，关闭依赖 redis 的功能，返回 engine"""
+
+    BaseConfig.tag_index = False
+    BaseConfig.event_trigger = False
+    BaseConfig.mysql_session_factory_w.remove()
+    BaseConfig.mysql_session_factory_r.remove()
+    return BenchUtils.init_schema(BaseConfig.db_uri)
+
+
+def insert_batches(engine, count, **kwargs):
+    """写入 count 个批次，id 从 1 开始，kwargs 覆盖默认字段"""
+
+    now = datetime.datetime.now().replace(microsecond=0)
+    rows = [
+        dict(dict(
+            id=i, task_name="test", task_tag_name=f"test_{i}", task_batch_name=f"test_{i}_1", batch_num=1,
+            exec_status=0, dependence="[]", start_time=now, end_time=now, plan_time=now,
+            plan_expire_time=now + datetime.timedelta(hours=1), exec_time=None, exit_time=None, duration=0, retry=0,
+            claim_host="",
+        ), **kwargs)
+        for i in range(1, count + 1)
+    ]
+    with engine.begin() as conn:
+        conn.execute(TaskBatch.TaskBatch.__table__.insert(), rows)
+
+
+def get_batch(batch_id):
+    """读取批次当前字段"""
+
+    session_w = BaseConfig.mysql_session_factory_w()
+    record = session_w.query(TaskBatch.TaskBatch).filter_by(id=batch_id).one().to_dict()
+    session_w.commit()
+    return record
@@ -0,0 +1,10 @@
+"""
+单元测试，读写临时 sqlite 库，不依赖 MySQL / redis
+Usage：
+python -m unittest discover -s Tests -t .
+"""
+import os
+import tempfile
+
+# 在导入 BaseConfig 前设置，读写 session 工厂均绑定测试库
+os.environ.setdefault("TASKCENTER_DB_URI", f"sqlite:///{tempfile.gettempdir()}/taskcenter_test.db")
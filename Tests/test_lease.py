@@ -0,0 +1,110 @@
+import datetime
+import unittest
+
+from Config import BaseConfig
+from Table import TaskBatch, TaskInfo
+from Benchmark import BenchUtils
+from TaskCenter.RunBatch import Batch, TaskDescriptor, mark_failed
+from TaskCenter.StatusWriter import StatusWriter
+from TaskCenter.Lease import LeaseKeeper, reap_expired
+from TaskCenter.TaskInfoCache import task_info_cache
+from . import TestUtils
+
+# 回收后重新认领的凭证
+RECLAIM_HOST = "test_host:2"
+RECLAIM_TIME = TestUtils.CLAIM_TIME + datetime.timedelta(minutes=5)
+
+
+def make_descriptor(claim_host, exec_time):
+    """bench_0 批次 1 的 TaskDescriptor"""
+
+    now = datetime.datetime.now().replace(microsecond=0)
+    return TaskDescriptor(
+        1, "bench_0", "test_1", "test_1_1", 1, now, now, exec_time, 0, now + datetime.timedelta(hours=1), claim_host,
+        0, "Benchmark.NoopScript", "", 3, 10, 5, 2, 600, 0.1, 0,
+    )
+
+
+class ReclaimTest(unittest.TestCase):
+    """租约过期回收并重新认领后，原执行进程迟到的执行结果不覆盖新的执行"""
+
+    def setUp(self):
+        self.engine = TestUtils.reset_schema()
+        BenchUtils.seed_tasks(self.engine, 1)
+        with self.engine.begin() as conn:
+            conn.execute(TaskInfo.TaskInfo.__table__.update().values(retry_max_times=3))
+        task_info_cache.full_reload_ts = 0
+        expired = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(minutes=1)
+        TestUtils.insert_batches(
+            self.engine, 1, task_name="bench_0", exec_status=2, claim_host=TestUtils.CLAIM_HOST,
+            exec_time=TestUtils.CLAIM_TIME, lease_expire_time=expired)
+        self.stale = make_descriptor(TestUtils.CLAIM_HOST, TestUtils.CLAIM_TIME)
+        self.fresh = make_descriptor(RECLAIM_HOST, RECLAIM_TIME)
+
+    def reap_and_reclaim(self):
+        """回收过期租约，再以新的凭证认领"""
+
+        session_w = BaseConfig.mysql_session_factory_w()
+        task_info_cache.refresh(session_w)
+        self.assertEqual(reap_expired(session_w), [1])
+        session_w.commit()
+        batch = TestUtils.get_batch(1)
+        self.assertEqual((batch["exec_status"], batch["retry"]), (0, 1))
+
+        t = TaskBatch.TaskBatch.__table__
+        with self.engine.begin() as conn:
+            conn.execute(t.update().where(t.c.id == 1).values(
+                exec_status=2, claim_host=RECLAIM_HOST, exec_time=RECLAIM_TIME,
+                lease_expire_time=datetime.datetime.now() + datetime.timedelta(minutes=1)))
+
+    def assert_reclaimed(self):
+        batch = TestUtils.get_batch(1)
+        self.assertEqual((batch["exec_status"], batch["claim_host"]), (2, RECLAIM_HOST))
+
+    def test_late_update_record(self):
+        self.reap_and_reclaim()
+        self.assertFalse(Batch(self.stale).update_record(exec_status=3, duration=1))
+        self.assert_reclaimed()
+        self.assertTrue(Batch(self.fresh).update_record(exec_status=3, duration=1))
+        self.assertEqual(TestUtils.get_batch(1)["exec_status"], 3)
+
+    def test_late_write_many(self):
+        self.reap_and_reclaim()
+        for mode in ("case", "executemany"):
+            records = [
+                Batch(self.stale).get_status_record(dict(exec_status=-1)),
+                Batch(self.fresh).get_status_record(dict(exec_status=3)),
+            ]
+            self.assertEqual(StatusWriter(mode).write_many(records), 1)
+            self.assertEqual(TestUtils.get_batch(1)["exec_status"], 3)
+            self.restore_running()
+
+    def restore_running(self):
+        """恢复为新认领的执行中状态"""
+
+        t = TaskBatch.TaskBatch.__table__
+        with self.engine.begin() as conn:
+            conn.execute(t.update().where(t.c.id == 1).values(exec_status=2))
+
+    def test_late_mark_failed(self):
+        self.reap_and_reclaim()
+        self.assertIsNone(mark_failed(self.stale, datetime.datetime.now(), 1))
+        self.assert_reclaimed()
+
+    def test_renew_detects_lost_lease(self):
+        self.reap_and_reclaim()
+        keeper, called = LeaseKeeper(), list()
+        stale_lost = keeper.add(1, (self.stale.claim_host, self.stale.exec_time), on_lost=lambda: called.append(1))
+        keeper.renew()
+        self.assertTrue(stale_lost.is_set())
+        self.assertEqual(called, [1])
+        self.assertEqual(keeper.batch_map, dict())
+
+        fresh_lost = keeper.add(1, (self.fresh.claim_host, self.fresh.exec_time))
+        keeper.renew()
+        self.assertFalse(fresh_lost.is_set())
+        self.assertIn(1, keeper.batch_map)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import queue
+import unittest
+
+from TaskCenter.StatusWriter import StatusRecord, StatusWriter, BackgroundStatusWriter
+from . import TestUtils
+
+
+def make_record(batch_id, claim_host=TestUtils.CLAIM_HOST, exec_time=TestUtils.CLAIM_TIME, **kwargs):
+    """构造 StatusRecord，默认使用 TestUtils 的认领凭证"""
+
+    return StatusRecord(batch_id, f"test_{batch_id}", f"test_{batch_id}_1", 1, kwargs, claim_host, exec_time)
+
+
+class CoalesceTest(unittest.TestCase):
+    """同一批次多次变更的合并"""
+
+    def test_later_fields_override_in_arrival_order(self):
+        records = StatusWriter.coalesce([
+            make_record(2, exec_status=2),
+            make_record(1, exec_status=2, cpu_time=1.0),
+            make_record(2, exec_status=3, duration=1),
+            make_record(1, exec_status=-1),
+        ])
+        self.assertEqual([record.id for record in records], [2, 1])
+        self.assertEqual(records[0].kwargs, dict(exec_status=3, duration=1))
+        self.assertEqual(records[1].kwargs, dict(exec_status=-1, cpu_time=1.0))
+
+
+class WriteManyTest(unittest.TestCase):
+    """CASE id WHEN 与 executemany 写入的最终状态与逐条写入一致"""
+
+    def setUp(self):
+        self.engine = TestUtils.reset_schema()
+        TestUtils.insert_batches(
+            self.engine, 3, exec_status=2, claim_host=TestUtils.CLAIM_HOST, exec_time=TestUtils.CLAIM_TIME)
+
+    def check_mode(self, mode):
+        records = [
+            make_record(1, exec_status=2, retry=0),
+            make_record(2, exec_status=3, duration=2),
+            make_record(1, exec_status=0, retry=1),
+            make_record(3, exec_status=-1, duration=5),
+            make_record(2, exec_status=-2),
+        ]
+        expected = dict()
+        for record in records:
+            expected.setdefault(record.id, dict()).update(record.kwargs)
+
+        self.assertEqual(StatusWriter(mode).write_many(records), 3)
+        for batch_id, kwargs in expected.items():
+            batch = TestUtils.get_batch(batch_id)
+            self.assertEqual({key: batch[key] for key in kwargs}, kwargs)
+
+    def test_case(self):
+        self.check_mode("case")
+
+    def test_executemany(self):
+        self.check_mode("executemany")
+
+
+class FailingWriter(object):
+    """包含 bad_id 的提交失败"""
+
+    def __init__(self, bad_id):
+        self.bad_id = bad_id
+        self.written = list()
+
+    def write_many(self, records):
+        if any(record.id == self.bad_id for record in records):
+            raise RuntimeError("bad row")
+        self.written.extend(record.id for record in records)
+        return len(records)
+
+
+class FlushTest(unittest.TestCase):
+    """后台写入的失败处理"""
+
+    def setUp(self):
+        TestUtils.reset_schema()
+
+    def test_bad_record_does_not_block_others(self):
+        writer = FailingWriter(bad_id=2)
+        background = BackgroundStatusWriter(queue.Queue(), writer=writer, max_failures=2)
+        buffer = [make_record(1, exec_status=3), make_record(2, exec_status=3), make_record(3, exec_status=3)]
+
+        # 前 max_failures 次整体重试
+        for _ in range(2):
+            buffer = background.flush(buffer)
+            self.assertEqual(len(buffer), 3)
+        self.assertEqual(writer.written, [])
+
+        # 之后逐条提交，仅保留失败记录
+        buffer = background.flush(buffer)
+        self.assertEqual(writer.written, [1, 3])
+        self.assertEqual([record.id for record in buffer], [2])
+
+        # 逐条提交再失败 max_failures 次后放弃
+        buffer = background.flush(buffer)
+        self.assertEqual(buffer, [])
+        self.assertEqual(background.failure_map, dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
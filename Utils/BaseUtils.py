@@ -13,8 +13,8 @@ from functools import reduce
 import requests.sessions
 
 from Config import BaseConfig
-from Utils import RedisUtils
-from common_logger.wrapper_hook_requests import log_normal_trace, log_error_trace
+from Utils import RedisUtils, LogUtils
+from common_logger.wrapper_hook_requests import log_error_trace
 
 
 class CSVFileReader(object):
@@ -62,8 +62,11 @@ class CSVFileReader(object):
         pass
 
 
+http_log = LogUtils.get_logger("http")
+
+
 class RewriteSession(requests.sessions.Session):
-    """重写Session对象，添加log"""
+    """重写Session对象，添加log，按 BaseConfig.log_sample_rates["http"] 采样后在后台线程中记录"""
 
     def __init__(self, is_log=True):
         super(RewriteSession, self).__init__()
@@ -78,11 +81,25 @@ class RewriteSession(requests.sessions.Session):
                                    params=params, data=data, headers=headers, cookies=cookies, files=files,
                                    auth=auth, timeout=timeout, allow_redirects=allow_redirects, proxies=proxies,
                                    hooks=hooks, stream=stream, verify=verify, cert=cert, json=json)
-        if self.is_log:
-            log_normal_trace(method, params, response, start_time, url)
+        if self.is_log and http_log.sampled():
+            http_log.info("{} {} {} {:.1f}ms params={} response={}", method, url, response.status_code,
+                          (time.time() - start_time) * 1000, LogUtils.truncate(str(params)), get_response_text(response))
         return response
 
 
+def get_response_text(response):
+    """
+    在调用线程中截取响应内容用于日志，日志队列中仅保存字符串，不持有 response 对象
+    流式响应不读取内容，避免消费调用方尚未读取的数据
+    """
+
+    if not response._content_consumed:
+        return "<stream>"
+    content = response.content or b""
+    text = content[:LogUtils.max_payload].decode(response.encoding or "utf-8", errors="replace")
+    return text if len(content) <= LogUtils.max_payload else f"{text}...({len(content)})"
+
+
 def init_http_session(headers=None, params=None, retry=0, is_log=True):
     """初始化http session"""
     if is_log:
@@ -104,10 +121,13 @@ def init_http_session(headers=None, params=None, retry=0, is_log=True):
     return http_session
 
 
-def init_redis_client():
-    """初始化 redis 客户端，作为局部变量，复用连接池全局变量"""
+def init_redis_client(is_log=True):
+    """
+    初始化 redis 客户端，作为局部变量，复用连接池全局变量
+    :param is_log: 是否记录命令日志
+    """
 
-    return RedisUtils.Redis(connection_pool=BaseConfig.redis_conn_pool)
+    return RedisUtils.Redis(connection_pool=BaseConfig.redis_conn_pool, is_log=is_log)
 
 
 def init_mysql_session(mode="r"):
@@ -117,6 +137,15 @@ def init_mysql_session(mode="r"):
     return factory()
 
 
+def dispose_mysql_session():
+    """关闭当前进程持有的 mysql 连接，fork 子进程前调用，保证子进程不会继承父进程的连接"""
+
+    for factory in (BaseConfig.mysql_session_factory_r, BaseConfig.mysql_session_factory_w):
+        session = factory()
+        session.close()
+        session.bind.dispose()
+
+
 def md5(s):
     """计算md5"""
 
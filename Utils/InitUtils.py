@@ -1,6 +1,10 @@
 import os
 import redis
 import sqlalchemy.orm
+import sqlalchemy.event
+import sqlalchemy.exc
+
+from Utils import LogUtils
 
 
 def init_project_directory():
@@ -29,11 +33,34 @@ def init_redis_connection_pool(redis_server):
     return redis.ConnectionPool.from_url(f"redis://{redis_server}", retry_on_timeout=True)
 
 
+def guard_fork(engine):
+    """
+    连接池的进程保护：连接记录创建时的进程号，其他进程检出时丢弃该连接（不关闭，避免影响父进程）并重新建立
+    fork 出的子进程无需在 fork 前 dispose 连接池，父进程可以保留连接
+    """
+
+    @sqlalchemy.event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @sqlalchemy.event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info["pid"] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise sqlalchemy.exc.DisconnectionError(
+                f"connection record belongs to pid {connection_record.info['pid']}, attempting to check out in pid {pid}")
+
+    return engine
+
+
 def init_mysql_session_factory(uri):
     """初始化 mysql session 工厂"""
 
     # mysql，空闲链接或执行sql 超过 120s，连接将被中断   pool_pre_ping检查并保持连接的活性
-    engine = sqlalchemy.create_engine(uri, echo=True, pool_recycle=115, pool_pre_ping=True)
+    # 不使用 echo 同步输出全部语句，sql 日志按 LogUtils 的 sql 采样率异步记录
+    engine = LogUtils.instrument_engine(sqlalchemy.create_engine(uri, pool_recycle=115, pool_pre_ping=True))
+    guard_fork(engine)
 
     # scoped_session 使用本地线程
     return sqlalchemy.orm.scoped_session(sqlalchemy.orm.sessionmaker(bind=engine))
@@ -0,0 +1,188 @@
+"""
+高频路径的异步采样日志
+redis 命令、http 请求、sql 语句等子系统按 sample_rates 中的比例采样，未采样的调用不做任何格式化
+采样到的日志连同参数放入队列，由后台线程格式化、截断到 max_payload 个字符后写入 common_logger，调用线程不等待磁盘写入
+参数在放入队列后由后台线程读取，调用方只应传入不再修改的值，response 等对象应在调用线程中提取为字符串
+队列满时丢弃日志并计数，后台线程定期输出丢弃条数；进程 fork 后首次写入时重建队列和后台线程
+Usage：
+from Utils import LogUtils
+
+redis_log = LogUtils.get_logger("redis")
+if redis_log.sampled():
+    redis_log.info("{} -> {}", args, response)
+"""
+import os
+import time
+import queue
+import atexit
+import random
+import threading
+import sqlalchemy.event
+
+import common_logger
+
+# 各子系统的采样率，0 为关闭，1 为全部记录，由 configure 设置
+sample_rates = dict()
+# 单条日志的最大字符数
+max_payload = 512
+# 后台写入队列长度上限
+queue_size = 10000
+
+
+def configure(rates, payload=512, size=10000):
+    """
+    设置采样参数，已创建的 SampledLogger 同步生效
+    :param rates: 子系统 -> 采样率
+    :param payload: 单条日志的最大字符数
+    :param size: 后台写入队列长度上限
+    """
+
+    global max_payload, queue_size
+    sample_rates.update(rates)
+    max_payload, queue_size = payload, size
+
+
+def truncate(text):
+    """截断到 max_payload 个字符，保留原长度"""
+
+    if len(text) <= max_payload:
+        return text
+    return f"{text[:max_payload]}...({len(text)})"
+
+
+class LogWriter(object):
+    """后台写入线程，队列中的元素为 (函数, 参数元组)"""
+
+    def __init__(self):
+        """初始化"""
+
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+        self.thread = None
+        self.dropped = 0
+
+    def _ensure_started(self):
+        """首次写入或 fork 后启动写入线程，父进程的队列锁可能在 fork 时被持有，子进程中重建队列"""
+
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid, self.dropped = os.getpid(), 0
+                self.queue = queue.Queue(queue_size)
+                self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self.thread.start()
+
+    def submit(self, func, args):
+        """放入队列，队列满时丢弃"""
+
+        if self.pid != os.getpid():
+            self._ensure_started()
+        try:
+            self.queue.put_nowait((func, args))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        """写入循环"""
+
+        report_at = time.monotonic() + 60
+        log_queue = self.queue
+        while True:
+            try:
+                func, args = log_queue.get(timeout=1)
+            except queue.Empty:
+                func = None
+            if func is not None:
+                try:
+                    func(*args)
+                except Exception as e:
+                    common_logger.error(f'日志写入失败:{e}')
+                finally:
+                    log_queue.task_done()
+            if self.dropped and time.monotonic() >= report_at:
+                dropped, self.dropped = self.dropped, 0
+                common_logger.error(f'日志队列已满，丢弃{dropped}条')
+                report_at = time.monotonic() + 60
+
+    def flush(self, timeout=5):
+        """等待队列中的日志写入完成，最多等待 timeout 秒"""
+
+        if self.pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+# 进程级日志写入线程
+log_writer = LogWriter()
+atexit.register(log_writer.flush)
+
+
+def _write(level, fmt, args):
+    """后台线程中格式化并写入"""
+
+    text = truncate(fmt.format(*args) if args else fmt)
+    if level == "error":
+        common_logger.error(text)
+    else:
+        common_logger.info(text)
+
+
+class SampledLogger(object):
+    """子系统的采样日志"""
+
+    def __init__(self, subsystem):
+        """
+        初始化
+        :param subsystem: 子系统名称，对应 sample_rates 的键
+        """
+
+        self.subsystem = subsystem
+
+    def sampled(self):
+        """本次调用是否记录日志"""
+
+        rate = sample_rates.get(self.subsystem, 0)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def info(self, fmt, *args):
+        """记录日志，fmt 为 str.format 模板，格式化在后台线程中进行"""
+
+        log_writer.submit(_write, ("info", f"[{self.subsystem}] {fmt}", args))
+
+    def error(self, fmt, *args):
+        """记录错误日志，不采样"""
+
+        log_writer.submit(_write, ("error", f"[{self.subsystem}] {fmt}", args))
+
+
+_logger_map = dict()
+
+
+def get_logger(subsystem):
+    """获取子系统的 SampledLogger"""
+
+    logger = _logger_map.get(subsystem)
+    if logger is None:
+        logger = _logger_map[subsystem] = SampledLogger(subsystem)
+    return logger
+
+
+def instrument_engine(engine):
+    """为 sqlalchemy engine 注册采样的 sql 日志，记录语句、参数和耗时，替代 echo=True"""
+
+    sql_log = get_logger("sql")
+
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._log_start = time.perf_counter() if sql_log.sampled() else None
+
+    @sqlalchemy.event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_log_start", None)
+        if start is not None:
+            # 参数可能为调用方复用的 list / dict，在调用线程中转为字符串
+            sql_log.info("{:.1f}ms {} {}", (time.perf_counter() - start) * 1000, statement, truncate(str(parameters)))
+
+    return engine
@@ -14,28 +14,143 @@ try:
     pass
 finally:
     lock.release()
+
+# 3. 竞争激烈或持有时间较长的锁：notify 释放时唤醒下一个等待方，watchdog 在持有期间定期续期
+with redis_cli.lock(name=lock_name, timeout=60, notify=True, watchdog=True):
+    pass
 """
+import math
+import time
+import uuid
 import hashlib
+import threading
 import redis.lock
 import common_logger
 from Config.BaseConfig import path_log
+from Utils import LogUtils
 
 common_logger.init_logger(path_log, 'threatintel', is_need_console=True, backupCount=10,
                                rotate_type='MIDNIGHT')
 
+redis_log = LogUtils.get_logger("redis")
+
 
 class RedisLock(redis.lock.Lock):
-    """重写锁对象，修改 lua 脚本的调用方式"""
+    """
+    重写锁对象，修改 lua 脚本的调用方式
+    notify 模式下释放锁的同时向 {name}:notify 列表写入通知，等待方以 BLPOP 阻塞等待，释放后立即被唤醒；
+    持有方超时未释放时没有通知，等待方每隔 notify_fallback 秒重新尝试获取
+    watchdog 模式下获取锁后启动续期线程，每隔 timeout / 3 秒通过 do_extend 将过期时间重置为 timeout，释放后停止
+    """
+
+    # 释放锁并写入一条通知，通知列表最多保留一条，没有等待方时随列表过期
+    LUA_NOTIFY_RELEASE_SCRIPT = """
+        local token = redis.call('get', KEYS[1])
+        if not token or token ~= ARGV[1] then
+            return 0
+        end
+        redis.call('del', KEYS[1])
+        redis.call('rpush', KEYS[2], 1)
+        redis.call('ltrim', KEYS[2], -1, -1)
+        redis.call('pexpire', KEYS[2], ARGV[2])
+        return 1
+    """
 
     extend_script_sha1 = hashlib.sha1(redis.lock.Lock.LUA_EXTEND_SCRIPT.encode()).hexdigest()
     release_script_sha1 = hashlib.sha1(redis.lock.Lock.LUA_RELEASE_SCRIPT.encode()).hexdigest()
     reacquire_script_sha1 = hashlib.sha1(redis.lock.Lock.LUA_REACQUIRE_SCRIPT.encode()).hexdigest()
+    notify_release_script_sha1 = hashlib.sha1(LUA_NOTIFY_RELEASE_SCRIPT.encode()).hexdigest()
+
+    def __init__(self, *args, notify=False, watchdog=False, notify_fallback=1, notify_expire=60, **kwargs):
+        """
+        初始化，其余参数同 redis.lock.Lock
+        :param notify: 是否在释放时通知等待方
+        :param watchdog: 是否在持有期间定期续期，需要设置 timeout
+        :param notify_fallback: 未收到通知时重新尝试获取的周期（秒），BLPOP 超时精度为秒
+        :param notify_expire: 通知列表的过期时间（秒）
+        """
+
+        super().__init__(*args, **kwargs)
+        self.notify = notify
+        self.notify_name = f"{self.name}:notify"
+        self.notify_fallback = notify_fallback
+        self.notify_expire = notify_expire
+        self.watchdog = watchdog
+        if watchdog and not self.timeout:
+            raise redis.lock.LockError("watchdog requires a timeout")
+        # 续期线程的停止事件，按 token 区分，thread_local 时同一锁对象可能被多个线程分别持有
+        self.watchdog_map = dict()
 
     def register_scripts(self):
         """不再注册脚本，依赖 eval 命令执行后自动注册"""
 
         pass
 
+    def acquire(self, blocking=None, blocking_timeout=None, token=None):
+        """获取锁，notify 模式下阻塞等待释放通知，其余同 redis.lock.Lock.acquire"""
+
+        if not self.notify:
+            acquired = super().acquire(blocking, blocking_timeout, token)
+        else:
+            acquired = self._acquire_notify(blocking, blocking_timeout, token)
+        if acquired and self.watchdog:
+            self._start_watchdog(self.local.token)
+        return acquired
+
+    def _acquire_notify(self, blocking, blocking_timeout, token):
+        """notify 模式获取锁"""
+
+        if token is None:
+            token = uuid.uuid1().hex.encode()
+        else:
+            token = self.redis.connection_pool.get_encoder().encode(token)
+        blocking = self.blocking if blocking is None else blocking
+        blocking_timeout = self.blocking_timeout if blocking_timeout is None else blocking_timeout
+        stop_trying_at = None if blocking_timeout is None else time.time() + blocking_timeout
+        while True:
+            if self.do_acquire(token):
+                self.local.token = token
+                return True
+            if not blocking:
+                return False
+            wait = self.notify_fallback
+            if stop_trying_at is not None:
+                remaining = stop_trying_at - time.time()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            # 收到通知或超时后都重新尝试获取，通知可能已被其他等待方抢先消费
+            self.redis.blpop(self.notify_name, max(math.ceil(wait), 1))
+
+    def release(self):
+        """释放锁，先停止续期"""
+
+        stopped = self.watchdog_map.pop(self.local.token, None)
+        if stopped:
+            stopped.set()
+        super().release()
+
+    def _start_watchdog(self, token):
+        """启动续期线程"""
+
+        stopped = self.watchdog_map[token] = threading.Event()
+        threading.Thread(target=self._renew, args=(token, stopped), name=f"{self.name}:watchdog", daemon=True).start()
+
+    def _renew(self, token, stopped):
+        """续期循环，线程内设置 token 后调用 do_extend，锁已不再持有时退出"""
+
+        if self.thread_local:
+            self.local.token = token
+        while not stopped.wait(self.timeout / 3):
+            try:
+                self.do_extend(self.timeout, True)
+            except redis.lock.LockNotOwnedError:
+                common_logger.error(f'{self.name}:锁已过期或被其他持有方获取，停止续期')
+                break
+            except redis.exceptions.RedisError as e:
+                common_logger.error(f'{self.name}:锁续期失败:{e}')
+        self.watchdog_map.pop(token, None)
+
     def do_extend(self, additional_time, replace_ttl):
         """延长锁"""
 
@@ -54,12 +169,19 @@ class RedisLock(redis.lock.Lock):
         return True
 
     def do_release(self, expected_token):
-        """释放锁"""
-
-        try:
-            resp = self.redis.evalsha(self.release_script_sha1, 1, self.name, expected_token)
-        except redis.exceptions.NoScriptError:
-            resp = self.redis.eval(self.LUA_RELEASE_SCRIPT, 1, self.name, expected_token)
+        """释放锁，notify 模式下同时写入通知"""
+
+        if self.notify:
+            args = (2, self.name, self.notify_name, expected_token, self.notify_expire * 1000)
+            try:
+                resp = self.redis.evalsha(self.notify_release_script_sha1, *args)
+            except redis.exceptions.NoScriptError:
+                resp = self.redis.eval(self.LUA_NOTIFY_RELEASE_SCRIPT, *args)
+        else:
+            try:
+                resp = self.redis.evalsha(self.release_script_sha1, 1, self.name, expected_token)
+            except redis.exceptions.NoScriptError:
+                resp = self.redis.eval(self.LUA_RELEASE_SCRIPT, 1, self.name, expected_token)
 
         if not bool(resp):
             raise redis.lock.LockNotOwnedError("Cannot release a lock that's no longer owned")
@@ -81,27 +203,44 @@ class RedisLock(redis.lock.Lock):
 class Redis(redis.StrictRedis):
     """重写客户端对象，修改默认的锁对象"""
 
-    def lock(self, name, timeout=None, sleep=0.1, blocking_timeout=None, lock_class=RedisLock, thread_local=True):
+    def __init__(self, *args, is_log=True, **kwargs):
+        """
+        初始化
+        :param is_log: 是否记录命令及响应，按 BaseConfig.log_sample_rates["redis"] 采样后异步写入，高频调用的路径应关闭
+        """
+
+        super().__init__(*args, **kwargs)
+        self.is_log = is_log
+
+    def lock(self, name, timeout=None, sleep=0.1, blocking_timeout=None, lock_class=RedisLock, thread_local=True,
+             notify=False, watchdog=False):
         """
         生成锁对象
         :param name: 锁名称
         :param timeout: 锁超时时间（秒）
-        :param sleep: 循环检查周期（秒）
+        :param sleep: 循环检查周期（秒），notify 模式下不使用
         :param blocking_timeout: 阻塞超时时间（秒）
         :param lock_class: 锁对象
         :param thread_local: 是否使用本地线程
+        :param notify: 是否在释放时唤醒等待方，替代 sleep 轮询
+        :param watchdog: 是否在持有期间自动续期
         :return: 锁对象
         """
 
         name = f"lock:{name}"
-
-        return super().lock(name, timeout, sleep, blocking_timeout, lock_class, thread_local)
+        if not notify and not watchdog:
+            return super().lock(name, timeout, sleep, blocking_timeout, lock_class, thread_local)
+        return lock_class(
+            self, name, timeout=timeout, sleep=sleep, blocking_timeout=blocking_timeout, thread_local=thread_local,
+            notify=notify, watchdog=watchdog,
+        )
 
     def execute_command(self, *args, **options):
-        # log
-        common_logger.info(f'{args[0],args[1]},options:{options}')
+        if not self.is_log or not redis_log.sampled():
+            return super(Redis, self).execute_command(*args, **options)
+        # log，格式化和写入在后台线程中进行
         res = super(Redis, self).execute_command(*args, **options)
-        common_logger.info('resdis response:'+str(res))
+        redis_log.info("{},options:{} response:{}", args[:2], options, res)
         return res
 
 